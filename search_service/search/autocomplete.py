@@ -0,0 +1,140 @@
+"""
+Autocomplete from the materialised autocomplete terms (see models.AutocompleteTerm), for
+autocomplete requests that are only filtered by (at most) a single context and the Madoc site.
+
+Terms are matched on their normalised values, i.e. in lower case with whitespace collapsed.
+Prefix matches come first, ranked by frequency (the number of indexables with the value). With
+fuzzy matching, any remaining results are filled with fuzzy matches: values with a word that is
+similar to the query, ranked by trigram word similarity and then frequency, if the pg_trgm
+extension is installed (see migration 0018_autocompleteterm), or values that contain the query,
+ranked by frequency, if it isn't.
+
+The prefix matches can also be answered from the in-process autocomplete index (see
+autocomplete_index), if AUTOCOMPLETE_INDEX is set (or "autocomplete_index" in the request).
+"""
+import functools
+import logging
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connection, models
+
+from .autocomplete_index import AutocompleteIndex
+from .models import AutocompleteTerm
+from .search_cache import get_generations
+
+logger = logging.getLogger(__name__)
+
+
+def normalise_term(value):
+    """
+    Normalise an autocomplete query in the same way as the terms (search_autocomplete_normalise).
+    """
+    return " ".join(value.split()).lower()
+
+
+@functools.lru_cache(maxsize=None)
+def trigram_available():
+    """
+    Whether the pg_trgm extension is installed. This is checked once per process.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def ranked_terms(terms, limit, similarity=None):
+    """
+    The top values, by similarity (if given) and frequency, summing the frequencies across sites
+    (and types and subtypes, if the terms aren't filtered by them).
+    """
+    terms = terms.values_list("indexable").annotate(n=models.Sum("n"))
+    order_by = ["-n", "indexable"]
+    if similarity is not None:
+        terms = terms.annotate(similarity=models.Max(similarity))
+        order_by.insert(0, "-similarity")
+    return [(value, n) for value, n, *_ in terms.order_by(*order_by)[:limit]]
+
+
+def scope_terms(context, site):
+    """
+    The autocomplete terms in a context and Madoc site.
+    """
+    terms = AutocompleteTerm.objects.filter(context=context)
+    if site:
+        terms = terms.filter(site__startswith=site)
+    return terms
+
+
+def load_index_terms(context, site, limit):
+    """
+    Load the terms in a context and Madoc site for the autocomplete index, summing the
+    frequencies across sites.
+
+    :return: list of up to limit (type, subtype, normalised, value, frequency) tuples
+    """
+    terms = (
+        scope_terms(context, site)
+        .values_list("type", "subtype", "normalised", "indexable")
+        .annotate(n=models.Sum("n"))
+        .order_by()
+    )
+    return list(terms[:limit])
+
+
+@functools.lru_cache(maxsize=None)
+def autocomplete_index():
+    """
+    The process's autocomplete index, configured by the AUTOCOMPLETE_INDEX_* settings.
+    """
+    return AutocompleteIndex(
+        load=load_index_terms,
+        generations=get_generations,
+        max_terms=settings.AUTOCOMPLETE_INDEX_MAX_TERMS,
+        size=settings.AUTOCOMPLETE_INDEX_SIZE,
+        ttl=settings.AUTOCOMPLETE_INDEX_TTL,
+        refresh=settings.AUTOCOMPLETE_INDEX_REFRESH,
+    )
+
+
+def autocomplete_terms(
+    context,
+    site,
+    autocomplete_type=None,
+    autocomplete_subtype=None,
+    query=None,
+    fuzzy=False,
+    index=False,
+    limit=10,
+):
+    """
+    The autocomplete values for a query, in a context (or "" for all IIIF resources) and
+    Madoc site (or ""), with the prefix matches from the autocomplete index if index is set
+    (and the scope isn't too large to hold).
+
+    :return: list of (value, frequency) tuples
+    """
+    terms = scope_terms(context, site)
+    if autocomplete_type:
+        terms = terms.filter(type=autocomplete_type.lower())
+    if autocomplete_subtype:
+        terms = terms.filter(subtype=autocomplete_subtype.lower())
+    query = normalise_term(query or "")
+    results = None
+    if index:
+        results = autocomplete_index().search(
+            context, site, autocomplete_type, autocomplete_subtype, query, limit
+        )
+    if results is None:
+        results = ranked_terms(terms.filter(normalised__startswith=query), limit)
+    if fuzzy and query and len(results) < limit:
+        fuzzy_terms = terms.exclude(normalised__startswith=query)
+        if trigram_available():
+            results += ranked_terms(
+                fuzzy_terms.filter(normalised__trigram_word_similar=query),
+                limit - len(results),
+                similarity=TrigramWordSimilarity(query, "normalised"),
+            )
+        else:
+            results += ranked_terms(fuzzy_terms.filter(normalised__contains=query), limit - len(results))
+    return results
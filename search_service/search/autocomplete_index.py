@@ -0,0 +1,185 @@
+"""
+In-process autocomplete index, for answering autocomplete requests without querying the
+database (see autocomplete.autocomplete_terms).
+
+The index holds a snapshot of the materialised autocomplete terms for each context and Madoc site
+that has been requested (up to AUTOCOMPLETE_INDEX_SIZE of them, least recently used first out).
+Each snapshot has, for each type and subtype (and for all subtypes of a type, all types of a
+subtype, and all types and subtypes), the values sorted by their normalised value, so that the
+values with a prefix are a contiguous range found by binary search, and ranked by frequency.
+
+Snapshots are rebuilt when the search cache generations for their Madoc site (see
+search_cache.get_generations) have been bumped by a write, but not more than once every
+AUTOCOMPLETE_INDEX_REFRESH seconds, so the results can be that many seconds stale, and are rebuilt
+AUTOCOMPLETE_INDEX_TTL seconds after they were built regardless, as writes by other processes
+(e.g. the process_ingest_jobs workers) don't bump this process's generations. Scopes with more
+than AUTOCOMPLETE_INDEX_MAX_TERMS terms aren't held, and are answered from the database.
+"""
+import bisect
+import heapq
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict, defaultdict
+from contextlib import suppress
+
+from .metrics import AUTOCOMPLETE_INDEX_BUILD_DURATION, AUTOCOMPLETE_INDEX_BYTES, AUTOCOMPLETE_INDEX_TERMS
+
+# Greater than any character, for the end of a prefix range
+MAX_CHARACTER = "\U0010ffff"
+
+
+class AutocompleteGroup:
+    """
+    The values for a type and subtype (either of which can be None, for all types or subtypes),
+    sorted by normalised value, with their frequencies, and their order by frequency.
+    """
+
+    def __init__(self, terms):
+        """
+        :param terms: dict of (normalised, value): frequency
+        """
+        items = sorted(terms.items())
+        self.keys = [normalised for (normalised, _), _ in items]
+        self.values = [value for (_, value), _ in items]
+        self.counts = array("q", (n for _, n in items))
+        self.ranked = array("q", sorted(range(len(items)), key=lambda i: (-self.counts[i], self.values[i])))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, query, limit):
+        """
+        The top values with a normalised prefix, ranked by frequency and then value.
+
+        :return: list of (value, frequency) tuples
+        """
+        if not query:
+            return [(self.values[i], self.counts[i]) for i in self.ranked[:limit]]
+        start = bisect.bisect_left(self.keys, query)
+        end = bisect.bisect_left(self.keys, query + MAX_CHARACTER, lo=start)
+        top = heapq.nsmallest(limit, range(start, end), key=lambda i: (-self.counts[i], self.values[i]))
+        return [(self.values[i], self.counts[i]) for i in top]
+
+    def sizeof(self):
+        return sum(sys.getsizeof(c) for c in (self.keys, self.values, self.counts, self.ranked))
+
+
+class AutocompleteSnapshot:
+    """
+    The autocomplete terms for a context and Madoc site.
+    """
+
+    def __init__(self, terms, generations, max_terms=None):
+        """
+        :param terms: iterable of (type, subtype, normalised, value, frequency) tuples
+        :param generations: search cache generations that the terms were loaded at
+        :param max_terms: maximum number of terms, over which the snapshot is too large to hold
+        """
+        self.generations = generations
+        self.built = time.monotonic()
+        self.groups = {}
+        terms = list(terms)
+        self.too_large = max_terms is not None and len(terms) > max_terms
+        self.terms = 0 if self.too_large else len(terms)
+        if self.too_large:
+            return
+        grouped = defaultdict(lambda: defaultdict(int))
+        for term_type, subtype, normalised, value, n in terms:
+            for key in ((term_type, subtype), (term_type, None), (None, subtype), (None, None)):
+                grouped[key][(normalised, value)] += n
+        self.groups = {key: AutocompleteGroup(group_terms) for key, group_terms in grouped.items()}
+
+    def search(self, autocomplete_type=None, autocomplete_subtype=None, query="", limit=10):
+        """
+        The top values (see AutocompleteGroup.search) for a type and subtype, or None if the
+        snapshot is too large to hold.
+        """
+        if self.too_large:
+            return
+        group = self.groups.get(
+            ((autocomplete_type or "").lower() or None, (autocomplete_subtype or "").lower() or None)
+        )
+        return group.search(query, limit) if group is not None else []
+
+    def sizeof(self):
+        """
+        The approximate memory used by the snapshot, in bytes. The strings are shared by the
+        groups, so are only counted once.
+        """
+        strings = {id(s): s for group in self.groups.values() for s in group.keys + group.values}
+        return (
+            sys.getsizeof(self.groups)
+            + sum(group.sizeof() for group in self.groups.values())
+            + sum(sys.getsizeof(s) for s in strings.values())
+        )
+
+
+class AutocompleteIndex:
+    """
+    Thread safe, LRU cache of autocomplete snapshots, per context and Madoc site.
+    """
+
+    def __init__(self, load, generations, max_terms=100000, size=32, ttl=300, refresh=5):
+        """
+        :param load: function of (context, site, limit) that returns up to limit
+            (type, subtype, normalised, value, frequency) tuples for the scope
+        :param generations: function of site that returns its search cache generations
+        """
+        self.load = load
+        self.generations = generations
+        self.max_terms = max_terms
+        self.size = size
+        self.ttl = ttl
+        self.refresh = refresh
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def stale(self, snapshot, generations):
+        age = time.monotonic() - snapshot.built
+        return age >= self.ttl or (snapshot.generations != generations and age >= self.refresh)
+
+    def snapshot(self, context, site):
+        """
+        The snapshot for a context and Madoc site, (re)building it if it is stale.
+        """
+        key = (context, site)
+        generations = self.generations(site)
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None:
+                self._snapshots.move_to_end(key)
+        if snapshot is not None and not self.stale(snapshot, generations):
+            return snapshot
+        # The lock isn't held while building, so requests for other scopes aren't blocked
+        started = time.perf_counter()
+        snapshot = AutocompleteSnapshot(
+            self.load(context, site, self.max_terms + 1), generations, max_terms=self.max_terms
+        )
+        AUTOCOMPLETE_INDEX_BUILD_DURATION.observe(time.perf_counter() - started)
+        AUTOCOMPLETE_INDEX_TERMS.labels(context=context, site=site).set(snapshot.terms)
+        AUTOCOMPLETE_INDEX_BYTES.labels(context=context, site=site).set(snapshot.sizeof())
+        with self._lock:
+            self._snapshots[key] = snapshot
+            self._snapshots.move_to_end(key)
+            while len(self._snapshots) > self.size:
+                (evicted_context, evicted_site), _ = self._snapshots.popitem(last=False)
+                # Another index in the process may have already removed them
+                with suppress(KeyError):
+                    AUTOCOMPLETE_INDEX_TERMS.remove(evicted_context, evicted_site)
+                    AUTOCOMPLETE_INDEX_BYTES.remove(evicted_context, evicted_site)
+        return snapshot
+
+    def search(self, context, site, autocomplete_type=None, autocomplete_subtype=None, query="", limit=10):
+        """
+        The top values for a normalised query in a context (or "" for all IIIF resources) and
+        Madoc site (or ""), or None if the scope has too many terms to hold.
+
+        :return: list of (value, frequency) tuples
+        """
+        return self.snapshot(context, site).search(autocomplete_type, autocomplete_subtype, query, limit)
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
@@ -0,0 +1,136 @@
+"""
+Bulk IIIF ingest from newline-delimited JSON (NDJSON), for /api/search/iiif/bulk.
+
+Each line is an ingest payload, as POSTed to /api/search/iiif (see parse_and_configure_iiif_ingest).
+The lines are read from the request stream one at a time, rather than buffering the whole body,
+and ingested in batches, each in a transaction (with a savepoint per record, so that a record that
+fails doesn't roll back the rest of the batch). A IIIF resource is created if there isn't one with
+its Madoc ID, and updated otherwise.
+
+The status of each record is returned as a line of JSON once its batch has been committed,
+followed by a summary line, e.g.
+
+    {"line": 1, "madoc_id": "urn:madoc:manifest:foo", "status": "created"}
+    {"line": 2, "madoc_id": "urn:madoc:manifest:bar", "status": "failed", "errors": {...}}
+    {"summary": {"created": 1, "updated": 0, "unchanged": 0, "queued": 0, "failed": 1}}
+
+If a batch fails to commit, its records are counted as failed, and the ingest stops with an error
+line before the summary (as the response status has already been sent), e.g.
+
+    {"error": {"detail": "...", "lines": [51, 100]}}
+    {"summary": {"created": 50, "updated": 0, "unchanged": 0, "queued": 0, "failed": 50}}
+
+The request needs a Content-Length, as WSGI servers don't all provide the body of a chunked request.
+"""
+import itertools
+import json
+import logging
+from collections import Counter
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .metrics import metrics_endpoint
+from .models import IIIFResource, IngestJob
+from .parsers import parse_and_configure_iiif_ingest
+from .search_cache import invalidate_search_cache
+from .serializers import IIIFCreateUpdateSerializer
+
+logger = logging.getLogger(__name__)
+
+CREATED = "created"
+UPDATED = "updated"
+UNCHANGED = "unchanged"
+QUEUED = "queued"
+FAILED = "failed"
+
+
+def ingest_record(data, madoc_site_urn=None):
+    """
+    Create or update the IIIF resource for an ingest payload, or queue it as an ingest job if
+    "async_ingest" is set.
+
+    :param data: ingest payload (dict)
+    :param madoc_site_urn: Madoc site URN, if the request has one
+    :return: (madoc_id, status)
+    """
+    parsed = parse_and_configure_iiif_ingest(data=data, madoc_site_urn=madoc_site_urn)
+    instance = IIIFResource.objects.filter(madoc_id=parsed["madoc_id"]).first()
+    serializer = IIIFCreateUpdateSerializer(instance, data=parsed)
+    serializer.is_valid(raise_exception=True)
+    if serializer.validated_data.get("async_ingest"):
+        IngestJob.objects.create(
+            action=IngestJob.UPDATE if instance else IngestJob.CREATE,
+            madoc_id=parsed["madoc_id"],
+            payload=serializer.initial_data,
+        )
+        return parsed["madoc_id"], QUEUED
+    serializer.save()
+    if serializer.unchanged:
+        return parsed["madoc_id"], UNCHANGED
+    return parsed["madoc_id"], UPDATED if instance else CREATED
+
+
+def ingest_batch(records, madoc_site_urn=None):
+    """
+    Ingest a batch of (line number, line) records in a transaction, with a savepoint per record.
+
+    :return: list of record statuses (dicts)
+    """
+    statuses = []
+    with transaction.atomic():
+        for line_number, line in records:
+            record_status = {"line": line_number}
+            try:
+                data = json.loads(line)
+            except ValueError as e:
+                data = None
+                record_status.update(status=FAILED, errors={"detail": f"JSON parse error - {e}"})
+            if not isinstance(data, dict):
+                record_status.setdefault("status", FAILED)
+                record_status.setdefault("errors", {"detail": "Expected a JSON object"})
+                statuses.append(record_status)
+                continue
+            record_status["madoc_id"] = data.get("madoc_id", data.get("id"))
+            try:
+                with transaction.atomic():
+                    record_status["madoc_id"], record_status["status"] = ingest_record(
+                        data, madoc_site_urn=madoc_site_urn
+                    )
+            except ValidationError as e:
+                record_status.update(status=FAILED, errors=e.detail)
+            except Exception as e:
+                logger.exception(f"Bulk ingest failed for line {line_number}")
+                record_status.update(status=FAILED, errors={"detail": str(e)})
+            statuses.append(record_status)
+    invalidate_search_cache(
+        [s["madoc_id"] for s in statuses if s["status"] in (CREATED, UPDATED)]
+    )
+    return statuses
+
+
+def iter_bulk_ingest(stream, batch_size, madoc_site_urn=None):
+    """
+    Ingest the NDJSON payloads read from a stream, in batches of batch_size, and yield the status
+    of each record (once its batch has been committed) and then a summary, as lines of JSON.
+    """
+    records = (
+        (line_number, line)
+        for line_number, line in enumerate(stream or [], start=1)
+        if line.strip()
+    )
+    summary = Counter({CREATED: 0, UPDATED: 0, UNCHANGED: 0, QUEUED: 0, FAILED: 0})
+    while batch := list(itertools.islice(records, batch_size)):
+        try:
+            # The response is streamed after the view (and MetricsMiddleware) has returned
+            with metrics_endpoint("search.api.iiifresource_bulk"):
+                statuses = ingest_batch(batch, madoc_site_urn=madoc_site_urn)
+        except Exception as e:
+            logger.exception(f"Bulk ingest failed for lines {batch[0][0]}-{batch[-1][0]}")
+            summary[FAILED] += len(batch)
+            yield json.dumps({"error": {"detail": str(e), "lines": [batch[0][0], batch[-1][0]]}}) + "\n"
+            break
+        for record_status in statuses:
+            summary[record_status["status"]] += 1
+            yield json.dumps(record_status) + "\n"
+    yield json.dumps({"summary": dict(summary)}) + "\n"
@@ -1,16 +1,171 @@
 import logging
+import pytz
+from datetime import datetime
 
 from django.contrib.postgres.search import SearchRank
+from django.core.exceptions import FieldDoesNotExist
 from django.db.models import F
 from django.db.models import Max
-from django.db.models import OuterRef, Subquery
+from django.db.models import Exists, FilteredRelation, OuterRef, Subquery
 from django.db.models import Q, Value, FloatField
+from django.db.models.functions import Coalesce
 from rest_framework.filters import BaseFilterBackend
 
-from .models import IIIFResource, Context, Indexables
+from .metrics import instrument
+from .models import IIIFResource, Context, Indexables, SortKey
 
 logger = logging.getLogger(__name__)
 
+# The value_for_sort fields that have a precomputed sort key (see SortKey)
+SORT_KEY_FIELDS = (
+    "indexable",
+    "indexable_int",
+    "indexable_float",
+    "indexable_date_range_start",
+    "indexable_date_range_end",
+)
+
+
+def get_sort_default(order_key):
+    """
+    The sort key for resources that have no value to sort on, typed to match value_for_sort.
+    """
+    if value_for_sort := order_key.get("value_for_sort"):
+        if value_for_sort.startswith("indexable_int"):
+            return 0
+        elif value_for_sort.startswith("indexable_float"):
+            return 0.0
+        elif value_for_sort.startswith("indexable_date"):
+            return datetime.min.replace(tzinfo=pytz.UTC)
+        else:
+            return ""
+
+    if order_key.get("type") and order_key.get("subtype"):
+        return ""
+
+    return 0.0
+
+
+def multi_valued_relation(model, lookup):
+    """
+    The multi-valued (one to many or many to many) relation that a lookup starts with, if any.
+    """
+    try:
+        field = model._meta.get_field(lookup.split("__", 1)[0])
+    except FieldDoesNotExist:
+        return
+    if field.is_relation and (field.one_to_many or field.many_to_many):
+        return field
+
+
+def q_lookups(q):
+    """
+    The lookups in a Q object, and whether any part of it is negated.
+    """
+    lookups, negated = [], q.negated
+    for child in q.children:
+        if isinstance(child, Q):
+            child_lookups, child_negated = q_lookups(child)
+            lookups += child_lookups
+            negated = negated or child_negated
+        else:
+            lookups.append(child[0])
+    return lookups, negated
+
+
+def strip_relation(q, relation):
+    """
+    Copy of a Q object with the relation prefix removed from its lookups.
+    """
+    stripped = Q()
+    stripped.connector, stripped.negated = q.connector, q.negated
+    stripped.children = [
+        strip_relation(child, relation)
+        if isinstance(child, Q)
+        else (child[0][len(relation.name) + 2 :], child[1])
+        for child in q.children
+    ]
+    return stripped
+
+
+def related_exists(relation, q):
+    """
+    EXISTS subquery for the objects on the other side of a multi-valued relation that match q,
+    correlated with the outer queryset's primary key.
+    """
+    if relation.one_to_many or not relation.concrete:
+        # Reverse relations, e.g. IIIFResource.indexables, correlate on the related field
+        outer_lookup = relation.field.name
+    else:
+        outer_lookup = relation.related_query_name()
+    return Exists(
+        relation.related_model.objects.filter(
+            strip_relation(q, relation), **{outer_lookup: OuterRef("pk")}
+        )
+    )
+
+
+def last_join(model, filters, relation_name):
+    """
+    The index of the last of a chain of filters that joins a multi-valued relation, i.e. that has
+    lookups on it that aren't negated (negated lookups are a subquery), or None.
+    """
+    last = None
+    for i, q in enumerate(filters):
+        if isinstance(q, dict):
+            lookups, negated = list(q), False
+        else:
+            lookups, negated = q_lookups(q)
+        relations = {multi_valued_relation(model, lookup) for lookup in lookups}
+        if not negated and relation_name in {relation.name for relation in relations if relation}:
+            last = i
+    return last
+
+
+def join_filter(queryset, q):
+    """
+    Apply the lookups from one .filter() call, i.e. a Q object or a dict of keyword lookups.
+    """
+    if isinstance(q, dict):
+        return queryset.filter(**q)
+    return queryset.filter(q)
+
+
+def exists_filter(queryset, q):
+    """
+    Apply the lookups from one .filter() call, i.e. a Q object or a dict of keyword lookups,
+    using an EXISTS subquery for each multi-valued relation, rather than a join.
+
+    Lookups on a relation in the same call must match the same related object (e.g. the same
+    indexable), as with a join, but the queryset isn't multiplied by the number of matching
+    related objects, so it doesn't need a DISTINCT.
+
+    :param queryset: queryset to filter
+    :param q: Q object, or dict of lookups
+    :return: filtered queryset
+    """
+    model = queryset.model
+    if isinstance(q, dict):
+        direct, by_relation = {}, {}
+        for lookup, value in q.items():
+            if (relation := multi_valued_relation(model, lookup)) is None:
+                direct[lookup] = value
+            else:
+                by_relation.setdefault(relation, {})[lookup] = value
+        if direct:
+            queryset = queryset.filter(**direct)
+        for relation, lookups in by_relation.items():
+            queryset = queryset.filter(related_exists(relation, Q(**lookups)))
+        return queryset
+    lookups, negated = q_lookups(q)
+    relations = {multi_valued_relation(model, lookup) for lookup in lookups}
+    if relations == {None}:
+        return queryset.filter(q)
+    if len(relations) == 1 and not negated:
+        return queryset.filter(related_exists(relations.pop(), q))
+    # Mixed or negated lookups are correlated as a whole, so they keep the join semantics
+    return queryset.filter(Exists(model.objects.filter(q, pk=OuterRef("pk"))))
+
 
 class FacetListFilter(BaseFilterBackend):
     def filter_queryset(self, request, queryset, view):
@@ -80,24 +235,43 @@ class AutoCompleteFilter(BaseFilterBackend):
         if request.data.get("autocomplete_subtype", None):
             queryset = queryset.filter(subtype__iexact=request.data["autocomplete_subtype"])
         if request.data.get("autocomplete_query", None):
-            queryset = queryset.filter(indexable__istartswith=request.data["autocomplete_subtype"])
+            queryset = queryset.filter(indexable__istartswith=request.data["autocomplete_query"])
         return queryset.distinct()
 
 
 class IIIFSearchFilter(BaseFilterBackend):
+    @instrument("filter")
     def filter_queryset(self, request, queryset, view):
         """
         Return a filtered queryset.
         """
         order_key = request.data.get("sort_order", None)
+        exists_plan = request.data.get("exists_plan", False)
+        # Filter with an EXISTS subquery per filter, rather than joins and a DISTINCT
+        apply_filter = exists_filter if exists_plan else join_filter
+        postfilters = request.data.get("postfilter_kwargs") or []
+        rank_postfilter = None
+        if exists_plan and (request.data.get("hits_filter_kwargs") or {}).get("search_vector"):
+            # The rank is the best match of the last join to the indexables (see below), so the
+            # last postfilter on the indexables is a join, as it is without the EXISTS plan
+            rank_postfilter = last_join(queryset.model, postfilters, "indexables")
+
+        def apply_postfilter(queryset, i, f):
+            return (join_filter if i == rank_postfilter else apply_filter)(queryset, f)
+
         if request.data.get("prefilter_kwargs", None):
             # Just check if this thing is all nested Q() objects
             if all([type(k) == Q for k in request.data.get("prefilter_kwargs")]):
                 # This is a chaining operation
                 for f in request.data.get("prefilter_kwargs"):
-                    queryset = queryset.filter(*(f,))
-        if request.data.get("filter_kwargs", None):
-            queryset = queryset.filter(**request.data.get("filter_kwargs"))
+                    queryset = apply_filter(queryset, f)
+        if filter_kwargs := request.data.get("filter_kwargs", None):
+            if exists_plan and filter_kwargs.get("indexables__search_vector"):
+                # The fulltext filter is still a join, as the matching indexables are ranked,
+                # grouped by IIIF resource (see below)
+                queryset = join_filter(queryset, filter_kwargs)
+            else:
+                queryset = apply_filter(queryset, filter_kwargs)
         # Step up to a different level and filter to those things which are part of the context
         # of an object that meets the contains_kwargs filters.
         if request.data.get("contains_kwargs", None):
@@ -130,20 +304,20 @@ class IIIFSearchFilter(BaseFilterBackend):
                         ).distinct()
                         for f in request.data.get("postfilter_kwargs"):
                             manifests = manifests.filter(*(f,))
-                        queryset = queryset.filter(**{"contexts__id__in": manifests})
+                        queryset = apply_filter(queryset, {"contexts__id__in": manifests})
                     else:
                         logger.debug("Facet on manifests is False")
-                        for f in request.data.get("postfilter_kwargs"):
-                            queryset = queryset.filter(*(f,))
+                        for i, f in enumerate(postfilters):
+                            queryset = apply_postfilter(queryset, i, f)
                 else:
                     logger.debug("Can't find facet on manifests in context")
-                    for f in request.data.get("postfilter_kwargs"):
-                        queryset = queryset.filter(*(f,))
+                    for i, f in enumerate(postfilters):
+                        queryset = apply_postfilter(queryset, i, f)
             else:  # GET requests (i.e. without the fancy Q reduction)
-                for filter_dict in request.data.get("postfilter_kwargs"):
+                for i, filter_dict in enumerate(postfilters):
                     # This is a chaining operation
                     # Appending each filter one at a time
-                    queryset = queryset.filter(**filter_dict)
+                    queryset = apply_postfilter(queryset, i, filter_dict)
         search_query = None
         if hits_filter_kwargs := request.data.get("hits_filter_kwargs"):
             # We have a dictionary of queries to use, so we use that
@@ -153,7 +327,18 @@ class IIIFSearchFilter(BaseFilterBackend):
         else:
             search_type = None
         logger.warning(f"Search query {search_query}")
-        if search_query:
+        if search_query and exists_plan:
+            logger.debug(f"Search query for the ranking {search_query}")
+            # The rank is the best match of the last join to the indexables, i.e. the fulltext
+            # join, or the last postfilter on the indexables, as it is with the joins for every
+            # filter, and the aggregate groups the results by IIIF resource
+            queryset = queryset.annotate(
+                rank=Max(
+                    SearchRank(F("indexables__search_vector"), search_query, cover_density=True),
+                    output_field=FloatField(),
+                ),
+            )
+        elif search_query:
             logger.debug(f"Search query for the ranking {search_query}")
             queryset = queryset.distinct().annotate(
                 rank=Max(
@@ -161,6 +346,8 @@ class IIIFSearchFilter(BaseFilterBackend):
                     output_field=FloatField(),
                 ),
             )
+        elif exists_plan:
+            queryset = queryset.annotate(rank=Value(0.0, FloatField()))
         else:
             queryset = queryset.distinct().annotate(
                 rank=Value(0.0, FloatField()),
@@ -168,26 +355,39 @@ class IIIFSearchFilter(BaseFilterBackend):
         # Some ordering has been passed in from the request parser
         if isinstance(order_key, dict) and order_key.get("type") and order_key.get("subtype"):
             val = order_key.get("value_for_sort", "indexable")
-            if order_key.get("direction") == "descending":
+            if val in SORT_KEY_FIELDS:
+                # Join the precomputed sort key for the type and subtype
                 queryset = queryset.annotate(
-                    sortk=Subquery(
-                        Indexables.objects.filter(
-                            iiif=OuterRef("pk"),
-                            type__iexact=order_key.get("type"),
-                            subtype__iexact=order_key.get("subtype"),
-                        ).values(val)[:1]
+                    sort_key=FilteredRelation(
+                        "sort_keys",
+                        condition=Q(
+                            sort_keys__type=order_key["type"].lower(),
+                            sort_keys__subtype=order_key["subtype"].lower(),
+                        ),
                     )
-                ).order_by("-sortk")
+                )
+                sort_value = F(f"sort_key__{val}")
+                sort_field = SortKey._meta.get_field(val)
             else:
-                queryset = queryset.annotate(
-                    sortk=Subquery(
-                        Indexables.objects.filter(
-                            iiif=OuterRef("pk"),
-                            type__iexact=order_key.get("type"),
-                            subtype__iexact=order_key.get("subtype"),
-                        ).values(val)[:1]
+                sort_value = Subquery(
+                    Indexables.objects.filter(
+                        iiif=OuterRef("pk"),
+                        type__iexact=order_key.get("type"),
+                        subtype__iexact=order_key.get("subtype"),
                     )
-                ).order_by("sortk")
-            return queryset
-        # Otherwise, default to sorting by rank.
-        return queryset.distinct().order_by("-rank")
+                    .order_by("pk")
+                    .values(val)[:1]
+                )
+                sort_field = Indexables._meta.get_field(val)
+            # Resources without a value to sort on get a typed default, as the serializer's sortk
+            queryset = queryset.annotate(
+                sortk=Coalesce(sort_value, Value(get_sort_default(order_key)), output_field=sort_field)
+            )
+            if order_key.get("direction") == "descending":
+                return queryset.order_by("-sortk", "pk")
+            return queryset.order_by("sortk", "pk")
+        # Otherwise, default to sorting by rank (and then by id, so ties are in the same order for
+        # either plan, and across pages)
+        if exists_plan:
+            return queryset.order_by("-rank", "pk")
+        return queryset.distinct().order_by("-rank", "pk")
@@ -1,6 +1,13 @@
 import json
 import requests
 import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from requests.adapters import HTTPAdapter
 
 from .serializer_utils import (
     resources_by_type,
@@ -8,6 +15,10 @@ from .serializer_utils import (
 
 logger = logging.getLogger(__name__)
 
+# Exceptions that mean the image server could not be reached (or did not respond in time), as
+# opposed to returning something that isn't an info.json.
+INFO_JSON_CONNECTION_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
 
 def get_first_canvas(iiif_resource, manifest=None):
     """Gets the first canvas for a IIIF resource, the parent manifest must be provided
@@ -43,15 +54,222 @@ def get_first_canvas(iiif_resource, manifest=None):
     return first_canvas_json
 
 
+class InfoJSONCache:
+    """
+    Thread safe, in memory, TTL + LRU cache of info.json documents, keyed by image service id.
+    """
+
+    def __init__(self, maxsize=4096, ttl=86400):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :param key: image service id
+        :return: tuple of (hit, value)
+        """
+        with self._lock:
+            if (entry := self._data.get(key)) is None:
+                return False, None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl=None):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DatabaseInfoJSONStore:
+    """
+    Persists fetched info.json documents to the ImageServiceInfo table, so that they survive
+    restarts and are shared between processes.
+    """
+
+    def get_many(self, image_service_ids, max_age):
+        """
+        :param image_service_ids: list of image service ids
+        :param max_age: maximum age (in seconds) of a stored info.json
+        :return: dict of image service id -> info.json
+        """
+        from django.utils import timezone
+        from .models import ImageServiceInfo
+
+        return dict(
+            ImageServiceInfo.objects.filter(
+                service_id__in=image_service_ids,
+                modified__gte=timezone.now() - timezone.timedelta(seconds=max_age),
+            ).values_list("service_id", "info")
+        )
+
+    def set_many(self, infos):
+        """
+        :param infos: dict of image service id -> info.json
+        """
+        from django.db import transaction
+        from .models import ImageServiceInfo
+
+        with transaction.atomic():
+            ImageServiceInfo.objects.filter(service_id__in=list(infos)).delete()
+            ImageServiceInfo.objects.bulk_create(
+                [ImageServiceInfo(service_id=k, info=v) for k, v in infos.items()],
+                ignore_conflicts=True,
+            )
+
+
+class InfoJSONResolver:
+    """
+    Fetches the info.json for IIIF image services.
+
+    Uses a pooled HTTP session with a timeout, fetches multiple image services concurrently,
+    and caches the results by image service id, in memory and, optionally, in a persistent
+    store (e.g. DatabaseInfoJSONStore).
+
+    Failures are cached for failure_ttl seconds, so that a missing or unreachable image server
+    isn't requested again for every canvas in a manifest. Connection errors and timeouts are
+    re-raised for every lookup of that image service while they are cached.
+    """
+
+    def __init__(
+        self,
+        timeout=10.0,
+        max_workers=8,
+        cache_size=4096,
+        cache_ttl=86400,
+        failure_ttl=60,
+        store=None,
+    ):
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.failure_ttl = failure_ttl
+        self.cache = InfoJSONCache(maxsize=cache_size, ttl=cache_ttl)
+        self.store = store
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(max_workers, 1), thread_name_prefix="info-json"
+        )
+
+    def fetch(self, image_service_id):
+        """
+        Fetch the info.json for an image service, without using the cache.
+
+        :param image_service_id: image service id
+        :return: info.json (empty if it could not be fetched or parsed, e.g. an error response
+            or an invalid URL), or the exception if the image server could not be reached
+        """
+        info_url = f"{image_service_id}/info.json"
+        logger.debug(f"Fetching info.json: ({info_url})")
+        try:
+            info = self.session.get(info_url, timeout=self.timeout)
+            info.raise_for_status()
+            return info.json()
+        except INFO_JSON_CONNECTION_ERRORS as e:
+            logger.warning(f"Could not connect to fetch info.json: ({info_url}, {e})")
+            return e
+        except (requests.exceptions.RequestException, json.decoder.JSONDecodeError) as e:
+            logger.warning(f"Could not fetch info.json: ({info_url}, {e})")
+            return {}
+
+    def get_many(self, image_service_ids):
+        """
+        Get the info.json for a list of image services, fetching any that aren't cached
+        concurrently.
+
+        :param image_service_ids: list of image service ids
+        :return: dict of image service id -> info.json, or the exception if the image server
+            could not be reached
+        """
+        results, missing = {}, []
+        for image_service_id in dict.fromkeys(image_service_ids):
+            hit, value = self.cache.get(image_service_id)
+            if hit:
+                results[image_service_id] = value
+            else:
+                missing.append(image_service_id)
+        if missing and self.store is not None:
+            for image_service_id, info in self.store.get_many(missing, self.cache_ttl).items():
+                self.cache.set(image_service_id, info)
+                results[image_service_id] = info
+            missing = [x for x in missing if x not in results]
+        if missing:
+            if len(missing) == 1:
+                fetched = {missing[0]: self.fetch(missing[0])}
+            else:
+                fetched = dict(zip(missing, self.executor.map(self.fetch, missing)))
+            for image_service_id, value in fetched.items():
+                if value and not isinstance(value, Exception):
+                    self.cache.set(image_service_id, value)
+                else:
+                    self.cache.set(image_service_id, value, ttl=self.failure_ttl)
+            if self.store is not None and (
+                infos := {k: v for k, v in fetched.items() if v and not isinstance(v, Exception)}
+            ):
+                self.store.set_many(infos)
+            results.update(fetched)
+        return results
+
+    def get(self, image_service_id):
+        """
+        :param image_service_id: image service id
+        :return: info.json (empty if it could not be parsed)
+        :raises: requests.exceptions.ConnectionError or Timeout if the image server could
+            not be reached
+        """
+        value = self.get_many([image_service_id])[image_service_id]
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+
+_info_json_resolver = None
+_info_json_resolver_lock = threading.Lock()
+
+
+def get_info_json_resolver():
+    """
+    Get the (process wide) info.json resolver, configured from the INFO_JSON_* settings.
+    """
+    global _info_json_resolver
+    if _info_json_resolver is None:
+        with _info_json_resolver_lock:
+            if _info_json_resolver is None:
+                if settings.configured:
+                    options = {
+                        "timeout": settings.INFO_JSON_TIMEOUT,
+                        "max_workers": settings.INFO_JSON_MAX_WORKERS,
+                        "cache_size": settings.INFO_JSON_CACHE_SIZE,
+                        "cache_ttl": settings.INFO_JSON_CACHE_TTL,
+                        "store": DatabaseInfoJSONStore() if settings.INFO_JSON_PERSIST else None,
+                    }
+                else:
+                    options = {}
+                _info_json_resolver = InfoJSONResolver(**options)
+    return _info_json_resolver
+
+
 def get_info_json_data(image_service_id):
-    info_url = f"{image_service_id}/info.json"
-    logger.debug(f"Fetching info.json: ({info_url})")
-    try:
-        info = requests.get(info_url)
-        return info.json()
-    except (requests.exceptions.HTTPError, json.decoder.JSONDecodeError) as e:
-        logger.warning("Could not fetch info.json: ({info_url}, {e})")
-        return {}
+    return get_info_json_resolver().get(image_service_id)
+
+
+def get_image_service_id(image_service):
+    return image_service.get("id") or image_service.get("@id")
 
 
 def get_image_services(content_resource):
@@ -80,11 +298,13 @@ def normalise_thumbnail_services(thumbnail_json):
     image service properties.
     """
     image_services = get_image_services(thumbnail_json)
+    # Fetch the info.json for the image services concurrently
+    get_info_json_resolver().get_many(
+        [i_s_id for i_s in image_services.values() if (i_s_id := get_image_service_id(i_s))]
+    )
     normalised_image_services = []
     for i_s in image_services.values():
-        if not (i_s_id := i_s.get("id")):
-            i_s_id = i_s.get("@id")
-        if i_s_id:
+        if i_s_id := get_image_service_id(i_s):
             info_json = get_info_json_data(i_s_id)
             i_s["info"] = info_json
             normalised_image_services.append(i_s)
@@ -96,13 +316,9 @@ def normalise_thumbnail_services(thumbnail_json):
     return thumbnail_json
 
 
-def get_iiif_resource_thumbnail_json(iiif_resource, first_canvas_json={},
-                                     fallback=False):
-    """Defaults to using the thumbnail property that has been set for the
-    iiif resource, but if this is absent it will attempt to extract a thumbnail
-    from the first canvas (or the first canvas' descendent objects) following
-    the logic described in:
-        https://github.com/atlas-viewer/iiif-image-api/blob/master/src/README.md
+def get_thumbnail_candidates(iiif_resource, first_canvas_json={}):
+    """Returns the thumbnail property that has been set for the iiif resource, or
+    if this is absent, the first painting image annotation body on the first canvas.
     """
     thumbnail_json = iiif_resource.get("thumbnail", [])
     logger.debug(f"IIIF id passed to thumbnail code: {iiif_resource.get('id', iiif_resource.get('@id', None))}")
@@ -116,11 +332,42 @@ def get_iiif_resource_thumbnail_json(iiif_resource, first_canvas_json={},
             ]
             if image_annotation_bodies:
                 thumbnail_json = image_annotation_bodies[:1]
+    return thumbnail_json
+
+
+def prefetch_thumbnail_info_json(resources):
+    """Fetch, concurrently, the info.json for the image services of the thumbnails
+    for a list of iiif resources, so that normalising their thumbnails is served
+    from the info.json cache.
+
+    :param resources: list of (iiif_resource, first_canvas_json) tuples
+    """
+    image_service_ids = [
+        i_s_id
+        for iiif_resource, first_canvas_json in resources
+        for thumbnail in get_thumbnail_candidates(iiif_resource, first_canvas_json)
+        for i_s in get_image_services(thumbnail).values()
+        if (i_s_id := get_image_service_id(i_s))
+    ]
+    if image_service_ids:
+        get_info_json_resolver().get_many(image_service_ids)
+
+
+def get_iiif_resource_thumbnail_json(iiif_resource, first_canvas_json={},
+                                     fallback=False):
+    """Defaults to using the thumbnail property that has been set for the
+    iiif resource, but if this is absent it will attempt to extract a thumbnail
+    from the first canvas (or the first canvas' descendent objects) following
+    the logic described in:
+        https://github.com/atlas-viewer/iiif-image-api/blob/master/src/README.md
+    """
+    thumbnail_json = get_thumbnail_candidates(iiif_resource, first_canvas_json)
     if fallback:
         logger.debug("Dereferencing the info.json for the thumbnail")
         try:
+            prefetch_thumbnail_info_json([(iiif_resource, first_canvas_json)])
             thumbnail_json = [normalise_thumbnail_services(thumbnail) for thumbnail in thumbnail_json]
-        except requests.exceptions.ConnectionError:
+        except INFO_JSON_CONNECTION_ERRORS:
             thumbnail_json = None
     # else:
     #     thumbnail_json = None
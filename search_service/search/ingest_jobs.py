@@ -0,0 +1,124 @@
+import logging
+
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .metrics import metrics_endpoint
+from .models import IngestJob, IIIFResource
+from .search_cache import invalidate_search_cache
+from .serializers import IIIFCreateUpdateSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def lock_resource(madoc_id):
+    """
+    Take a transaction-level advisory lock on a Madoc ID, if no other transaction holds it.
+
+    :return: True if the lock was taken
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s))", [madoc_id])
+        return cursor.fetchone()[0]
+
+
+def claim_ingest_job():
+    """
+    Claim the oldest queued ingest job, and mark it as running.
+
+    Uses SELECT ... FOR UPDATE SKIP LOCKED, so that multiple workers can claim jobs
+    concurrently without claiming the same job. Jobs for a resource that already has a
+    running job are left in the queue, so that ingests for the same resource run in order.
+    Workers claiming jobs for the same resource at once (which wouldn't see each other's
+    running job until they commit) are serialised by an advisory lock on its Madoc ID,
+    and the running jobs are checked again once it is held.
+
+    :return: IngestJob instance, or None if there are no jobs to claim
+    """
+    skipped = []
+    with transaction.atomic():
+        while True:
+            job = (
+                IngestJob.objects.select_for_update(skip_locked=True)
+                .filter(status=IngestJob.QUEUED)
+                .exclude(madoc_id__in=skipped)
+                .exclude(
+                    madoc_id__in=IngestJob.objects.filter(status=IngestJob.RUNNING).values(
+                        "madoc_id"
+                    )
+                )
+                .order_by("created")
+                .first()
+            )
+            if job is None:
+                break
+            if (
+                lock_resource(job.madoc_id)
+                and not IngestJob.objects.filter(
+                    status=IngestJob.RUNNING, madoc_id=job.madoc_id
+                ).exists()
+            ):
+                job.status = IngestJob.RUNNING
+                job.started = timezone.now()
+                job.save(update_fields=["status", "started", "modified"])
+                break
+            # Another worker is claiming or running a job for the resource
+            skipped.append(job.madoc_id)
+    return job
+
+
+def process_ingest_job(job):
+    """
+    Run the IIIF create/update for an ingest job, and record the outcome on the job.
+
+    :param job: IngestJob instance
+    :return: IngestJob instance
+    """
+    logger.info(f"Processing ingest job {job.id} ({job.action} {job.madoc_id})")
+    try:
+        if job.action == IngestJob.UPDATE:
+            instance = IIIFResource.objects.get(madoc_id=job.madoc_id)
+            serializer = IIIFCreateUpdateSerializer(instance, data=job.payload)
+        else:
+            serializer = IIIFCreateUpdateSerializer(data=job.payload)
+        serializer.is_valid(raise_exception=True)
+        with metrics_endpoint("ingest_job"), transaction.atomic():
+            serializer.save()
+        if not serializer.unchanged:
+            invalidate_search_cache([job.madoc_id])
+        job.status = IngestJob.COMPLETE
+    except ValidationError as e:
+        logger.error(f"Ingest job {job.id} failed validation: {e.detail}")
+        job.status = IngestJob.FAILED
+        job.errors = e.detail
+    except Exception as e:
+        logger.exception(f"Ingest job {job.id} failed")
+        job.status = IngestJob.FAILED
+        job.errors = {"detail": str(e)}
+    job.finished = timezone.now()
+    job.save(update_fields=["status", "errors", "finished", "modified"])
+    return job
+
+
+def run_ingest_worker(stop_event, poll_interval=1.0, exit_when_empty=False):
+    """
+    Worker loop that claims and processes ingest jobs until stop_event is set.
+
+    :param stop_event: threading.Event used to stop the worker
+    :param poll_interval: seconds to wait before polling again when the queue is empty
+    :param exit_when_empty: stop once there are no more jobs to claim
+    :return:
+    """
+    try:
+        while not stop_event.is_set():
+            close_old_connections()
+            job = claim_ingest_job()
+            if job is None:
+                if exit_when_empty:
+                    break
+                stop_event.wait(poll_interval)
+                continue
+            process_ingest_job(job)
+    finally:
+        connection.close()
@@ -0,0 +1,382 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+from search.manualtests.queries import test_queries
+from search.metrics import QueryCounter
+from search.models import Context, IIIFResource, Indexables
+from search.synthetic_corpus import generate_corpus
+from search.views import Autocomplete, Facets, IIIFList, IIIFSearch, ModelList
+import json
+import logging
+import statistics
+import subprocess
+import time
+
+
+logger = logging.getLogger(__name__)
+
+SITE = "urn:benchmark:site:1"
+
+
+class Rollback(Exception):
+    pass
+
+
+def benchmark_settings():
+    """
+    Time the queries, not the search response cache, and don't fetch info.json for thumbnails
+    (which would time the network) on ingest.
+    """
+    return override_settings(SEARCH_CACHE="", THUMBNAIL_FALLBACK=False)
+
+
+def summarise_times(times):
+    times = sorted(times)
+    return {
+        "median_ms": round(statistics.median(times) * 1000, 2),
+        "min_ms": round(times[0] * 1000, 2),
+        "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))] * 1000, 2),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def query_mix():
+    """
+    The (endpoint, label, query, query string) cases to time: the manual test queries, and
+    typical Madoc searches, facet and autocomplete requests.
+    """
+    cases = [
+        ("search", f"manual: {q['label']}", {**q["query"], "contexts": [SITE]}, "")
+        for q in test_queries
+    ]
+    cases += [
+        ("search", "site", {"contexts": [SITE]}, ""),
+        ("search", "site, page 2", {"contexts": [SITE]}, "?page=2"),
+        ("search", "fulltext", {"fulltext": "bible", "contexts": [SITE]}, ""),
+        (
+            "search",
+            "fulltext in collection",
+            {"fulltext": "chronicle", "contexts": ["urn:benchmark:collection:0"]},
+            "",
+        ),
+        (
+            "search",
+            "facet filter",
+            {
+                "contexts": [SITE],
+                "facets": [{"type": "metadata", "subtype": "subject", "value": "Coreanica"}],
+            },
+            "",
+        ),
+        (
+            "search",
+            "fulltext and facet filters",
+            {
+                "fulltext": "psalter",
+                "contexts": [SITE],
+                "facets": [
+                    {"type": "metadata", "subtype": "subject", "value": "Coreanica"},
+                    {"type": "metadata", "subtype": "subject", "value": "History"},
+                    {"type": "metadata", "subtype": "place of publication", "value": "Berlin"},
+                ],
+            },
+            "",
+        ),
+        (
+            "search",
+            "facet fields",
+            {"contexts": [SITE], "facet_fields": ["subject", "place of publication"], "num_facets": 5},
+            "",
+        ),
+        (
+            "search",
+            "sorted by metadata",
+            {"contexts": [SITE], "ordering": {"type": "metadata", "subtype": "date of publication"}},
+            "",
+        ),
+        (
+            "search",
+            "sorted by navDate",
+            {
+                "contexts": [SITE],
+                "ordering": {
+                    "type": "descriptive",
+                    "subtype": "navDate",
+                    "value_for_sort": "indexable_date_range_start",
+                    "direction": "descending",
+                },
+            },
+            "",
+        ),
+        (
+            "search",
+            "fulltext sorted by metadata",
+            {
+                "fulltext": "bible",
+                "contexts": [SITE],
+                "ordering": {"type": "metadata", "subtype": "date of publication", "direction": "descending"},
+            },
+            "",
+        ),
+        ("facets", "site", {"contexts": [SITE]}, ""),
+        ("facets", "fulltext", {"fulltext": "bible", "contexts": [SITE]}, ""),
+        (
+            "autocomplete",
+            "author",
+            {
+                "contexts": [SITE],
+                "autocomplete_type": "metadata",
+                "autocomplete_subtype": "author",
+                "autocomplete_query": "A",
+            },
+            "",
+        ),
+        (
+            "autocomplete",
+            "author, fuzzy",
+            {
+                "contexts": [SITE],
+                "autocomplete_type": "metadata",
+                "autocomplete_subtype": "author",
+                "autocomplete_query": "bingen",
+                "autocomplete_fuzzy": True,
+            },
+            "",
+        ),
+        (
+            "autocomplete",
+            "author, index",
+            {
+                "contexts": [SITE],
+                "autocomplete_type": "metadata",
+                "autocomplete_subtype": "author",
+                "autocomplete_query": "A",
+                "autocomplete_index": True,
+            },
+            "",
+        ),
+        (
+            "autocomplete",
+            "author, counted",
+            {
+                "contexts": [SITE],
+                "autocomplete_type": "metadata",
+                "autocomplete_subtype": "author",
+                "autocomplete_query": "A",
+                "materialised_autocomplete": False,
+            },
+            "",
+        ),
+    ]
+    return cases
+
+
+class Command(BaseCommand):
+    help = (
+        "Management command to benchmark ingest and search against a synthetic IIIF corpus, which "
+        "is ingested through the API views and rolled back afterwards. Outputs JSON, optionally "
+        "compared with the output of a previous run"
+    )
+
+    views = {
+        "iiif": IIIFList.as_view(),
+        "model": ModelList.as_view(),
+        "search": IIIFSearch.as_view({"post": "list"}),
+        "facets": Facets.as_view({"post": "list"}),
+        "autocomplete": Autocomplete.as_view({"post": "list"}),
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument("--manifests", nargs="?", type=int, default=200)
+        parser.add_argument("--collections", nargs="?", type=int, default=5)
+        parser.add_argument("--canvases", nargs="?", type=int, default=5)
+        parser.add_argument(
+            "--v2-ratio", nargs="?", type=float, default=0.5,
+            help="Proportion of the manifests that are IIIF Presentation 2",
+        )
+        parser.add_argument(
+            "--ocr-lines", nargs="?", type=int, default=20,
+            help="Lines of OCR for each manifest (0 for none)",
+        )
+        parser.add_argument(
+            "--capture-models", nargs="?", type=int, default=1,
+            help="Capture models for each manifest",
+        )
+        parser.add_argument("--repeat", nargs="?", type=int, default=5)
+        parser.add_argument("--seed", nargs="?", type=int, default=1)
+        parser.add_argument("--output", nargs="?", type=str, default=None)
+        parser.add_argument(
+            "--compare", nargs="?", type=str, default=None,
+            help="JSON output of a previous run to compare the timings with",
+        )
+        parser.add_argument(
+            "--threshold", nargs="?", type=float, default=1.25,
+            help="Report timings that are slower than the --compare run by more than this factor",
+        )
+        parser.add_argument(
+            "--keep", action="store_true", help="Keep the synthetic corpus, rather than rolling back"
+        )
+
+    def post(self, view, path, data):
+        request = APIRequestFactory().post(path, data, format="json")
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = self.views[view](request)
+            response.render()
+        return response, time.perf_counter() - start, counter.queries
+
+    def ingest(self, view, path, payloads):
+        times, queries = [], 0
+        for payload in payloads:
+            response, elapsed, n_queries = self.post(view, path, payload)
+            if response.status_code != 201:
+                raise CommandError(f"Ingest to {path} failed ({response.status_code}): {response.data}")
+            times.append(elapsed)
+            queries += n_queries
+        if not times:
+            return {"n": 0}
+        return {
+            "n": len(times),
+            "total_s": round(sum(times), 2),
+            **summarise_times(times),
+            "queries": queries,
+        }
+
+    def ingest_corpus(self, corpus):
+        return {
+            "manifests": self.ingest("iiif", "/api/search/iiif", corpus["manifests"]),
+            "collections": self.ingest("iiif", "/api/search/iiif", corpus["collections"]),
+            "ocr": self.ingest("model", "/api/search/model", corpus["ocr"]),
+            "capture_models": self.ingest("model", "/api/search/model", corpus["capture_models"]),
+        }
+
+    def time_case(self, endpoint, query, query_string, repeat):
+        times = []
+        for _ in range(repeat):
+            response, elapsed, n_queries = self.post(
+                endpoint, f"/api/search/{endpoint}{query_string}", query
+            )
+            times.append(elapsed)
+        result = {"status": response.status_code, **summarise_times(times), "queries": n_queries}
+        if response.status_code == 200 and isinstance(response.data, dict):
+            if pagination := response.data.get("pagination"):
+                result["results"] = pagination.get("totalResults")
+            elif "results" in response.data:
+                result["results"] = len(response.data["results"])
+        return result
+
+    def run_benchmark(self, options):
+        corpus = generate_corpus(
+            manifests=options["manifests"],
+            collections=options["collections"],
+            canvases=options["canvases"],
+            v2_ratio=options["v2_ratio"],
+            ocr_lines=options["ocr_lines"],
+            capture_models=options["capture_models"],
+            seed=options["seed"],
+        )
+        ingest = self.ingest_corpus(corpus)
+        with connection.cursor() as cursor:
+            # Update the planner statistics for the corpus, which autovacuum won't have seen yet
+            cursor.execute("ANALYZE")
+        queries = []
+        for endpoint, label, query, query_string in query_mix():
+            logger.info(f"Timing {endpoint}: {label}")
+            queries.append(
+                {
+                    "endpoint": endpoint,
+                    "label": label,
+                    "query": query,
+                    **self.time_case(endpoint, query, query_string, options["repeat"]),
+                }
+            )
+        return {
+            "commit": git_commit(),
+            "settings": {
+                "SEARCH_EXISTS_PLAN": settings.SEARCH_EXISTS_PLAN,
+                "MATERIALISED_FACETS": settings.MATERIALISED_FACETS,
+                "MATERIALISED_AUTOCOMPLETE": settings.MATERIALISED_AUTOCOMPLETE,
+                "AUTOCOMPLETE_INDEX": settings.AUTOCOMPLETE_INDEX,
+                "BULK_CASCADE": settings.BULK_CASCADE,
+                "DEBUG": settings.DEBUG,
+            },
+            "corpus": {
+                **{
+                    key: options[key]
+                    for key in (
+                        "manifests", "collections", "canvases", "v2_ratio", "ocr_lines",
+                        "capture_models", "seed",
+                    )
+                },
+                "iiif_resources": IIIFResource.objects.filter(madoc_id__startswith="urn:benchmark:").count(),
+                "indexables": Indexables.objects.filter(resource_id__startswith="urn:benchmark:").count(),
+                "contexts": Context.objects.filter(id__startswith="urn:benchmark:").count(),
+            },
+            "repeat": options["repeat"],
+            "ingest": ingest,
+            "queries": queries,
+        }
+
+    def compare(self, report, baseline, threshold):
+        """
+        The ratio of each median time to the median time for the same case in the baseline, and
+        a list of the cases that are slower than the baseline by more than the threshold.
+        """
+        ratios, regressions = {}, []
+        baseline_times = {
+            **{f"ingest: {kind}": timing.get("median_ms") for kind, timing in baseline["ingest"].items()},
+            **{f"{case['endpoint']}: {case['label']}": case["median_ms"] for case in baseline["queries"]},
+        }
+        current_times = {
+            **{f"ingest: {kind}": timing.get("median_ms") for kind, timing in report["ingest"].items()},
+            **{f"{case['endpoint']}: {case['label']}": case["median_ms"] for case in report["queries"]},
+        }
+        for key, median_ms in current_times.items():
+            if not median_ms or not baseline_times.get(key):
+                continue
+            ratios[key] = round(median_ms / baseline_times[key], 2)
+            if ratios[key] > threshold:
+                regressions.append(key)
+        return {"commit": baseline.get("commit"), "ratios": ratios, "regressions": regressions}
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("The benchmark needs a PostgreSQL database")
+        with benchmark_settings():
+            try:
+                with transaction.atomic():
+                    report = self.run_benchmark(options)
+                    if not options["keep"]:
+                        raise Rollback
+            except Rollback:
+                pass
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                report["compare"] = self.compare(report, json.load(f), options["threshold"])
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        self.stdout.write(output)
+        if failed := [case["label"] for case in report["queries"] if case["status"] != 200]:
+            self.stderr.write(f"Requests failed: {', '.join(failed)}")
+        if report.get("compare", {}).get("regressions"):
+            self.stderr.write(
+                f"Slower than {report['compare']['commit']} by more than {options['threshold']}x: "
+                f"{', '.join(report['compare']['regressions'])}"
+            )
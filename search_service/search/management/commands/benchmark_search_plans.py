@@ -0,0 +1,174 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from rest_framework.request import Request
+from search.filters import IIIFSearchFilter
+from search.management.commands.benchmark_search import (
+    SITE,
+    Command as BenchmarkSearch,
+    Rollback,
+    benchmark_settings,
+)
+from search.models import IIIFResource, Indexables
+from search.parsers import IIIFSearchParser
+from search.synthetic_corpus import generate_corpus
+import itertools
+import json
+import logging
+import statistics
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Management command to benchmark the search query plans (EXISTS subqueries vs. joins and a "
+        "DISTINCT) against a synthetic IIIF corpus, which is ingested through the API views and "
+        "rolled back afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--manifests", nargs="?", type=int, default=200)
+        parser.add_argument("--collections", nargs="?", type=int, default=5)
+        parser.add_argument("--canvases", nargs="?", type=int, default=5)
+        parser.add_argument(
+            "--ocr-lines", nargs="?", type=int, default=20,
+            help="Lines of OCR for each manifest (0 for none)",
+        )
+        parser.add_argument("--repeat", nargs="?", type=int, default=5)
+        parser.add_argument("--seed", nargs="?", type=int, default=1)
+        parser.add_argument("--output", nargs="?", type=str, default=None)
+        parser.add_argument(
+            "--keep", action="store_true", help="Keep the synthetic corpus, rather than rolling back"
+        )
+
+    @staticmethod
+    def search_queryset(query):
+        request = Request(
+            RequestFactory().post(
+                "/api/search/search", data=json.dumps(query), content_type="application/json"
+            ),
+            parsers=[IIIFSearchParser()],
+        )
+        return IIIFSearchFilter().filter_queryset(
+            request, IIIFResource.objects.all(), view=None
+        )
+
+    def ordered_results(self, query):
+        """
+        The ids and ranks of the results of a search, in order, with the results that tie on the
+        ordering key (which the plans can return in either order) ordered by id.
+        """
+        queryset = self.search_queryset(query)
+        key = queryset.query.order_by[0].lstrip("-")
+        results = [
+            (resource.madoc_id, round(resource.rank, 6), getattr(resource, key)) for resource in queryset
+        ]
+        return [
+            (madoc_id, rank)
+            for _, ties in itertools.groupby(results, key=lambda result: result[2])
+            for madoc_id, rank, _ in sorted(ties)
+        ]
+
+    def time_query(self, query, repeat):
+        """
+        Time the count and the first page of results for a search, as run by the paginator.
+        """
+        count_times, page_times = [], []
+        for _ in range(repeat):
+            queryset = self.search_queryset(query)
+            start = time.perf_counter()
+            count = queryset.count()
+            count_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            list(queryset[:25])
+            page_times.append(time.perf_counter() - start)
+        return {
+            "count": count,
+            "count_ms": round(statistics.median(count_times) * 1000, 2),
+            "page_ms": round(statistics.median(page_times) * 1000, 2),
+        }, self.ordered_results(query)
+
+    def run_benchmark(self, options):
+        corpus = generate_corpus(
+            manifests=options["manifests"],
+            collections=options["collections"],
+            canvases=options["canvases"],
+            ocr_lines=options["ocr_lines"],
+            capture_models=0,
+            seed=options["seed"],
+        )
+        start = time.perf_counter()
+        BenchmarkSearch().ingest_corpus(corpus)
+        with connection.cursor() as cursor:
+            # Update the planner statistics for the corpus, which autovacuum won't have seen yet
+            cursor.execute("ANALYZE")
+        logger.info(f"Ingested corpus in {time.perf_counter() - start:.1f}s")
+        queries = [
+            {"contexts": [SITE]},
+            {"fulltext": "bible"},
+            {"fulltext": "bible", "contexts": [SITE]},
+            {
+                "contexts": [SITE],
+                "facets": [{"type": "metadata", "subtype": "subject", "value": "Coreanica"}],
+            },
+            {
+                "fulltext": "chronicle",
+                "facets": [
+                    {"type": "metadata", "subtype": "subject", "value": "Coreanica"},
+                    {"type": "metadata", "subtype": "subject", "value": "History"},
+                    {"type": "metadata", "subtype": "place of publication", "value": "Berlin"},
+                ],
+            },
+            {
+                "fulltext": "Berlin",
+                "facets": [{"type": "metadata", "subtype": "place of publication", "value": "Berlin"}],
+            },
+            {
+                "contexts": [SITE],
+                "ordering": {"type": "metadata", "subtype": "date of publication"},
+            },
+        ]
+        results = []
+        for query in queries:
+            join_timings, join_results = self.time_query(
+                {**query, "exists_plan": False}, options["repeat"]
+            )
+            exists_timings, exists_results = self.time_query(
+                {**query, "exists_plan": True}, options["repeat"]
+            )
+            results.append(
+                {
+                    "query": query,
+                    "join": join_timings,
+                    "exists": exists_timings,
+                    "identical": join_results == exists_results,
+                }
+            )
+        return {
+            "manifests": options["manifests"],
+            "indexables": Indexables.objects.filter(resource_id__startswith="urn:benchmark:").count(),
+            "repeat": options["repeat"],
+            "results": results,
+        }
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("The benchmark needs a PostgreSQL database")
+        with benchmark_settings():
+            try:
+                with transaction.atomic():
+                    report = self.run_benchmark(options)
+                    if not options["keep"]:
+                        raise Rollback
+            except Rollback:
+                pass
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        self.stdout.write(output)
+        if not all(result["identical"] for result in report["results"]):
+            self.stderr.write("The query plans returned different results")
@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from search.management.commands.benchmark_search import git_commit, summarise_times
+import json
+import logging
+import subprocess
+import sys
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Modules that are only needed for ingest, so shouldn't be imported on startup
+DEFERRED_MODULES = ("search.langbase", "search.prezi_upgrader")
+
+# Run in a fresh interpreter for each cold start, and prints the timings of each stage as JSON
+STARTUP_SCRIPT = f"""
+import json, sys, time
+timings = {{}}
+started = time.perf_counter()
+import django
+django.setup()
+timings["setup"] = time.perf_counter() - started
+started = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+timings["urls"] = time.perf_counter() - started
+loaded = [module for module in {DEFERRED_MODULES!r} if module in sys.modules]
+started = time.perf_counter()
+from search.parsers import get_upgrader
+from search.serializer_utils import get_language_data
+get_upgrader()
+get_language_data("en")
+timings["first_ingest"] = time.perf_counter() - started
+print(json.dumps({{"timings": timings, "loaded": loaded}}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Management command to benchmark cold starts: the time to set up Django (as for a "
+        "management command or ingest worker), load the URL conf (as for the web process), and "
+        "load the modules deferred until the first ingest, each in a fresh interpreter. Outputs JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", nargs="?", type=int, default=10)
+        parser.add_argument("--output", nargs="?", type=str, default=None)
+
+    def cold_start(self):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        elapsed = time.perf_counter() - started
+        return {**json.loads(result.stdout.strip().splitlines()[-1]), "process": elapsed}
+
+    def handle(self, *args, **options):
+        runs = [self.cold_start() for _ in range(options["repeat"])]
+        report = {
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "repeat": options["repeat"],
+            "timings": {
+                stage: summarise_times([run["timings"][stage] for run in runs])
+                for stage in ("setup", "urls", "first_ingest")
+            },
+            "process": summarise_times([run["process"] for run in runs]),
+            "loaded_on_startup": sorted({module for run in runs for module in run["loaded"]}),
+        }
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        self.stdout.write(output)
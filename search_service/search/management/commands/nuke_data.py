@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from search.models import IIIFResource, Indexables
+from search.search_cache import invalidate_search_cache
 import logging
 
 
@@ -13,4 +14,5 @@ class Command(BaseCommand):
         logger.warning("Deleting all the things")
         IIIFResource.objects.all().delete()
         Indexables.objects.all().delete()
+        invalidate_search_cache()
 
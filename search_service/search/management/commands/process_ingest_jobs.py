@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from search.ingest_jobs import run_ingest_worker
+from search.models import IngestJob
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Management command to run a pool of workers that process queued IIIF ingest jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", nargs="?", type=int, default=settings.INGEST_WORKERS)
+        parser.add_argument("--poll-interval", nargs="?", type=float, default=1.0)
+        parser.add_argument(
+            "--once", action="store_true", help="Exit once there are no more queued jobs"
+        )
+        parser.add_argument(
+            "--requeue",
+            action="store_true",
+            help="Requeue any jobs left running, e.g. by a worker that was killed",
+        )
+
+    def handle(self, *args, **options):
+        if options["requeue"]:
+            requeued = IngestJob.objects.filter(status=IngestJob.RUNNING).update(
+                status=IngestJob.QUEUED, started=None
+            )
+            logger.warning(f"Requeued {requeued} running ingest jobs")
+        stop_event = threading.Event()
+        workers = [
+            threading.Thread(
+                target=run_ingest_worker,
+                kwargs={
+                    "stop_event": stop_event,
+                    "poll_interval": options["poll_interval"],
+                    "exit_when_empty": options["once"],
+                },
+                name=f"ingest-worker-{n}",
+            )
+            for n in range(max(options["workers"], 1))
+        ]
+        logger.info(f"Starting {len(workers)} ingest workers")
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            logger.warning("Stopping ingest workers")
+            stop_event.set()
+            for worker in workers:
+                worker.join()
@@ -1,6 +1,5 @@
 import requests
 import json
-from langdetect import detect
 import unicodedata
 
 BASE_API = "http://localhost:8000/api/search/search"
@@ -0,0 +1,202 @@
+"""
+Per-request performance metrics, exposed in the Prometheus text format at /metrics (with the
+prometheus_client default registry, so the process and Python runtime metrics are included).
+
+MetricsMiddleware records the duration and number of SQL queries of each request, per endpoint
+(the URL name, e.g. "search.api.search"), and the instrumented stages of the search and ingest
+record their duration, the number of SQL queries they ran and the number of rows those queries
+returned (or, for writes, affected), per endpoint and stage:
+
+* parse: IIIFSearchParser.parse, e.g. resolving the Madoc site and contexts
+* filter: IIIFSearchFilter.filter_queryset (which builds, but doesn't run, the search query)
+* hits: fetching the hits for a page of results (IIIFSearchSummarySerializer.get_hits)
+* facets: IIIFSearch.get_facets
+* ingest: IIIF resource create/update, and capture model/OCR ingest
+
+The in-process autocomplete index (see autocomplete_index) records the number of terms and the
+approximate memory of each of its snapshots, and how long they took to build.
+
+Stages can be nested, e.g. the facets re-run the search filter, in which case the queries are
+counted in both.
+
+The metrics are held in process, so each process (e.g. each ingest worker) has its own, and
+they are reset on restart. Stages run by the process_ingest_jobs workers are recorded with the
+"ingest_job" endpoint, but aren't exposed by the web process.
+
+The metrics are off by default (METRICS_ENABLED), and /metrics isn't authenticated, so it should
+only be reachable by the metrics scraper when they are on, as the labels include the contexts
+and Madoc sites in the autocomplete index.
+"""
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+from django.http import Http404, HttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+current_endpoint = ContextVar("current_endpoint", default="")
+
+REQUEST_DURATION = Histogram(
+    "search_request_duration_seconds",
+    "Request duration in seconds, per endpoint",
+    ("endpoint", "method", "status"),
+)
+REQUEST_QUERIES = Histogram(
+    "search_request_queries",
+    "SQL queries run per request, per endpoint",
+    ("endpoint", "method"),
+    buckets=QUERY_BUCKETS,
+)
+STAGE_DURATION = Histogram(
+    "search_stage_duration_seconds",
+    "Duration of a search or ingest stage in seconds, per endpoint",
+    ("endpoint", "stage"),
+)
+STAGE_QUERIES = Histogram(
+    "search_stage_queries",
+    "SQL queries run by a search or ingest stage, per endpoint",
+    ("endpoint", "stage"),
+    buckets=QUERY_BUCKETS,
+)
+STAGE_ROWS = Histogram(
+    "search_stage_rows",
+    "Rows returned (or affected) by the SQL queries of a search or ingest stage, per endpoint",
+    ("endpoint", "stage"),
+    buckets=ROW_BUCKETS,
+)
+STAGE_ERRORS = Counter(
+    "search_stage_errors",
+    "Search or ingest stages that raised an exception, per endpoint",
+    ("endpoint", "stage"),
+)
+AUTOCOMPLETE_INDEX_TERMS = Gauge(
+    "search_autocomplete_index_terms",
+    "Terms held in the in-process autocomplete index, per context and Madoc site",
+    ("context", "site"),
+)
+AUTOCOMPLETE_INDEX_BYTES = Gauge(
+    "search_autocomplete_index_bytes",
+    "Approximate memory used by the in-process autocomplete index in bytes, per context and Madoc site",
+    ("context", "site"),
+)
+AUTOCOMPLETE_INDEX_BUILD_DURATION = Histogram(
+    "search_autocomplete_index_build_seconds",
+    "Duration of (re)building the in-process autocomplete index for a context and Madoc site in seconds",
+)
+
+
+class QueryCounter:
+    """
+    Connection execute wrapper that counts the SQL queries run, and the rows they returned or
+    affected.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        self.queries += 1
+        # -1 if the number of rows isn't known, e.g. for server side cursors (.iterator())
+        if (rowcount := getattr(context["cursor"], "rowcount", -1)) > 0:
+            self.rows += rowcount
+        return result
+
+
+@contextmanager
+def measure_stage(stage):
+    """
+    Record the duration, SQL queries and rows of the block as a stage of the current endpoint.
+    """
+    if not settings.METRICS_ENABLED:
+        yield
+        return
+    endpoint = current_endpoint.get() or "none"
+    counter = QueryCounter()
+    started = time.perf_counter()
+    try:
+        with connection.execute_wrapper(counter):
+            yield
+    except Exception:
+        STAGE_ERRORS.labels(endpoint=endpoint, stage=stage).inc()
+        raise
+    finally:
+        STAGE_DURATION.labels(endpoint=endpoint, stage=stage).observe(time.perf_counter() - started)
+        STAGE_QUERIES.labels(endpoint=endpoint, stage=stage).observe(counter.queries)
+        STAGE_ROWS.labels(endpoint=endpoint, stage=stage).observe(counter.rows)
+
+
+def instrument(stage):
+    """
+    Decorator that records each call of a function or method as a stage (see measure_stage).
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with measure_stage(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def metrics_endpoint(endpoint):
+    """
+    Record the stages run in the block against an endpoint, outside of a request, e.g. in the
+    ingest workers.
+    """
+    token = current_endpoint.set(endpoint)
+    try:
+        yield
+    finally:
+        current_endpoint.reset(token)
+
+
+class MetricsMiddleware:
+    """
+    Records the duration and SQL queries of each request, per endpoint, i.e. per URL name.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        token = current_endpoint.set("unmatched")
+        counter = QueryCounter()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(counter):
+                response = self.get_response(request)
+        finally:
+            endpoint = current_endpoint.get()
+            current_endpoint.reset(token)
+        REQUEST_DURATION.labels(
+            endpoint=endpoint, method=request.method, status=response.status_code
+        ).observe(time.perf_counter() - started)
+        REQUEST_QUERIES.labels(endpoint=endpoint, method=request.method).observe(counter.queries)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if settings.METRICS_ENABLED:
+            current_endpoint.set(request.resolver_match.url_name or request.resolver_match.route)
+
+
+def metrics_view(request):
+    """
+    The metrics, in the Prometheus text exposition format.
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    return HttpResponse(generate_latest(REGISTRY), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,73 @@
+"""
+Compute Indexables.search_vector in Postgres, via a trigger keyed on language_pg,
+rather than in Indexables.save().
+
+N.B. this can't be a GENERATED column, as the cast of language_pg to a regconfig
+is not immutable.
+"""
+from django.db import migrations, transaction
+
+BACKFILL_BATCH_SIZE = 10000
+
+CREATE_TRIGGER = """
+CREATE OR REPLACE FUNCTION search_indexables_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    IF NEW.language_pg IS NOT NULL AND NEW.language_pg <> '' THEN
+        NEW.search_vector := setweight(
+            to_tsvector(NEW.language_pg::regconfig, COALESCE(NEW.indexable, '')), 'A'
+        );
+    ELSE
+        NEW.search_vector := setweight(to_tsvector(COALESCE(NEW.indexable, '')), 'A');
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER search_indexables_search_vector_update
+    BEFORE INSERT OR UPDATE OF indexable, language_pg ON search_indexables
+    FOR EACH ROW EXECUTE FUNCTION search_indexables_search_vector_trigger();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS search_indexables_search_vector_update ON search_indexables;
+DROP FUNCTION IF EXISTS search_indexables_search_vector_trigger();
+"""
+
+BACKFILL = """
+UPDATE search_indexables SET search_vector = CASE
+    WHEN language_pg IS NOT NULL AND language_pg <> ''
+        THEN setweight(to_tsvector(language_pg::regconfig, COALESCE(indexable, '')), 'A')
+    ELSE setweight(to_tsvector(COALESCE(indexable, '')), 'A')
+END
+WHERE id >= %s AND id < %s
+"""
+
+
+def backfill_search_vectors(apps, schema_editor):
+    """
+    Recompute the search_vector for existing rows, in batches of ids, each batch in its
+    own transaction so that a large table isn't locked for the whole backfill.
+    """
+    Indexables = apps.get_model("search", "Indexables")
+    ids = Indexables.objects.order_by("id").values_list("id", flat=True)
+    first_id, last_id = ids.first(), ids.last()
+    if first_id is None:
+        return
+    for batch_start in range(first_id, last_id + 1, BACKFILL_BATCH_SIZE):
+        with transaction.atomic(using=schema_editor.connection.alias):
+            with schema_editor.connection.cursor() as cursor:
+                cursor.execute(BACKFILL, [batch_start, batch_start + BACKFILL_BATCH_SIZE])
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("search", "0010_alter_iiifresource_items_and_more"),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_TRIGGER, reverse_sql=DROP_TRIGGER),
+        migrations.RunPython(backfill_search_vectors, reverse_code=migrations.RunPython.noop),
+    ]
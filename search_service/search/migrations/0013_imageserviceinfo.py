@@ -0,0 +1,27 @@
+# Generated by Django 4.0 on 2026-10-18 02:45
+
+from django.db import migrations, models
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0012_ingestjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageServiceInfo',
+            fields=[
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('service_id', models.CharField(max_length=1024, primary_key=True, serialize=False)),
+                ('info', models.JSONField()),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
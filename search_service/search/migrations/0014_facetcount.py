@@ -0,0 +1,198 @@
+"""
+Materialised facet counts for metadata indexables, maintained by statement level triggers on
+search_indexables and search_iiifresource_contexts.
+
+For each change, a IIIF resource is added to (or removed from) the count for a facet value in
+each of its contexts, and in the "" (all IIIF resources) context, when it gains its first (or
+loses its last) indexable with that value. Counts are also kept per Madoc site (the site URN
+prefix of the IIIF resource madoc_id), so that they can be summed for a site filtered search.
+"""
+from django.db import migrations, models
+import django.db.models.expressions
+import django.db.models.functions.text
+
+CREATE_TRIGGERS = """
+CREATE OR REPLACE FUNCTION search_facetcount_site(madoc_id text) RETURNS text AS $$
+    SELECT COALESCE(substring(madoc_id from '^urn:madoc:site:[0-9]+'), '')
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Apply the changes in the number of indexables for (iiif_id, type, subtype, indexable) keys,
+-- counting the current indexables for the changed keys in one scan by IIIF resource (rather
+-- than a subquery per key, which scans every indexable with a common value)
+CREATE OR REPLACE FUNCTION search_facetcount_apply_indexables(
+    iiif_ids text[], types text[], subtypes text[], indexables text[], changes bigint[]
+) RETURNS void AS $$
+    WITH counts AS MATERIALIZED (
+        SELECT i.iiif_id, i.type, i.subtype, i.indexable, count(*) AS now_n
+        FROM search_indexables i
+        WHERE i.iiif_id = ANY(iiif_ids) AND i.type = ANY(types)
+        GROUP BY 1, 2, 3, 4
+    ), changed AS MATERIALIZED (
+        SELECT k.iiif_id, k.type, k.subtype, k.indexable, k.change, COALESCE(n.now_n, 0) AS now_n
+        FROM unnest(iiif_ids, types, subtypes, indexables, changes)
+            AS k(iiif_id, type, subtype, indexable, change)
+        LEFT JOIN counts n ON n.iiif_id = k.iiif_id AND n.type = k.type
+            AND n.subtype = k.subtype AND n.indexable = k.indexable
+    )
+    INSERT INTO search_facetcount (context, site, type, subtype, indexable, n)
+    SELECT scope.context, search_facetcount_site(c.iiif_id), c.type, c.subtype, c.indexable,
+        sum((c.now_n > 0)::int - (c.now_n - c.change > 0)::int)
+    FROM changed c
+    CROSS JOIN LATERAL (
+        SELECT context_id AS context FROM search_iiifresource_contexts
+        WHERE iiifresource_id = c.iiif_id
+        UNION SELECT ''
+    ) scope
+    WHERE (c.now_n > 0) <> (c.now_n - c.change > 0)
+    GROUP BY 1, 2, 3, 4, 5
+    ON CONFLICT (context, site, type, subtype, md5(indexable))
+        DO UPDATE SET n = search_facetcount.n + EXCLUDED.n;
+    DELETE FROM search_facetcount WHERE n <= 0;
+$$ LANGUAGE sql;
+
+-- Add (change = 1) or remove (change = -1) IIIF resources from contexts
+CREATE OR REPLACE FUNCTION search_facetcount_apply_contexts(
+    iiif_ids text[], context_ids text[], change int
+) RETURNS void AS $$
+    INSERT INTO search_facetcount (context, site, type, subtype, indexable, n)
+    SELECT c.context_id, search_facetcount_site(c.iiif_id), i.type, i.subtype, i.indexable,
+        count(*) * change
+    FROM unnest(iiif_ids, context_ids) AS c(iiif_id, context_id)
+    CROSS JOIN LATERAL (
+        SELECT DISTINCT type, subtype, indexable FROM search_indexables
+        WHERE iiif_id = c.iiif_id AND type = 'metadata'
+    ) i
+    GROUP BY 1, 2, 3, 4, 5
+    ON CONFLICT (context, site, type, subtype, md5(indexable))
+        DO UPDATE SET n = search_facetcount.n + EXCLUDED.n;
+    DELETE FROM search_facetcount WHERE n <= 0;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION search_facetcount_indexables_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM search_facetcount_apply_indexables(
+            array_agg(iiif_id), array_agg(type), array_agg(subtype), array_agg(indexable),
+            array_agg(change)
+        ) FROM (
+            SELECT iiif_id, type, subtype, indexable, count(*) AS change FROM new_rows
+            WHERE type = 'metadata' GROUP BY 1, 2, 3, 4
+        ) changes;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM search_facetcount_apply_indexables(
+            array_agg(iiif_id), array_agg(type), array_agg(subtype), array_agg(indexable),
+            array_agg(change)
+        ) FROM (
+            SELECT iiif_id, type, subtype, indexable, -count(*) AS change FROM old_rows
+            WHERE type = 'metadata' GROUP BY 1, 2, 3, 4
+        ) changes;
+    ELSE
+        PERFORM search_facetcount_apply_indexables(
+            array_agg(iiif_id), array_agg(type), array_agg(subtype), array_agg(indexable),
+            array_agg(change)
+        ) FROM (
+            SELECT iiif_id, type, subtype, indexable, sum(change) AS change FROM (
+                SELECT iiif_id, type, subtype, indexable, 1 AS change FROM new_rows
+                UNION ALL
+                SELECT iiif_id, type, subtype, indexable, -1 AS change FROM old_rows
+            ) rows
+            WHERE type = 'metadata' GROUP BY 1, 2, 3, 4
+        ) changes;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION search_facetcount_contexts_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM search_facetcount_apply_contexts(
+            array_agg(iiifresource_id), array_agg(context_id), 1
+        ) FROM new_rows;
+    ELSE
+        PERFORM search_facetcount_apply_contexts(
+            array_agg(iiifresource_id), array_agg(context_id), -1
+        ) FROM old_rows;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER search_facetcount_indexables_insert
+    AFTER INSERT ON search_indexables REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION search_facetcount_indexables_trigger();
+CREATE TRIGGER search_facetcount_indexables_update
+    AFTER UPDATE ON search_indexables REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION search_facetcount_indexables_trigger();
+CREATE TRIGGER search_facetcount_indexables_delete
+    AFTER DELETE ON search_indexables REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION search_facetcount_indexables_trigger();
+CREATE TRIGGER search_facetcount_contexts_insert
+    AFTER INSERT ON search_iiifresource_contexts REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION search_facetcount_contexts_trigger();
+CREATE TRIGGER search_facetcount_contexts_delete
+    AFTER DELETE ON search_iiifresource_contexts REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION search_facetcount_contexts_trigger();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS search_facetcount_indexables_insert ON search_indexables;
+DROP TRIGGER IF EXISTS search_facetcount_indexables_update ON search_indexables;
+DROP TRIGGER IF EXISTS search_facetcount_indexables_delete ON search_indexables;
+DROP TRIGGER IF EXISTS search_facetcount_contexts_insert ON search_iiifresource_contexts;
+DROP TRIGGER IF EXISTS search_facetcount_contexts_delete ON search_iiifresource_contexts;
+DROP FUNCTION IF EXISTS search_facetcount_indexables_trigger();
+DROP FUNCTION IF EXISTS search_facetcount_contexts_trigger();
+DROP FUNCTION IF EXISTS search_facetcount_apply_indexables(text[], text[], text[], text[], bigint[]);
+DROP FUNCTION IF EXISTS search_facetcount_apply_contexts(text[], text[], int);
+DROP FUNCTION IF EXISTS search_facetcount_site(text);
+"""
+
+BACKFILL = """
+INSERT INTO search_facetcount (context, site, type, subtype, indexable, n)
+SELECT scope.context, search_facetcount_site(i.iiif_id), i.type, i.subtype, i.indexable,
+    count(DISTINCT i.iiif_id)
+FROM search_indexables i
+CROSS JOIN LATERAL (
+    SELECT context_id AS context FROM search_iiifresource_contexts
+    WHERE iiifresource_id = i.iiif_id
+    UNION SELECT ''
+) scope
+WHERE i.type = 'metadata'
+GROUP BY 1, 2, 3, 4, 5;
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0013_imageserviceinfo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('context', models.CharField(max_length=512)),
+                ('site', models.CharField(blank=True, max_length=512)),
+                ('type', models.CharField(max_length=64)),
+                ('subtype', models.CharField(max_length=256)),
+                ('indexable', models.TextField()),
+                ('n', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='facetcount',
+            index=models.Index(fields=['context', 'type', 'subtype'], name='search_face_context_3c663f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facetcount',
+            index=models.Index(condition=models.Q(('n__lte', 0)), fields=['n'], name='facetcount_empty'),
+        ),
+        migrations.AddConstraint(
+            model_name='facetcount',
+            constraint=models.UniqueConstraint(django.db.models.expressions.F('context'), django.db.models.expressions.F('site'), django.db.models.expressions.F('type'), django.db.models.expressions.F('subtype'), django.db.models.functions.text.MD5('indexable'), name='unique_facetcount'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, reverse_sql=DROP_TRIGGERS),
+        migrations.RunSQL(BACKFILL, reverse_sql=migrations.RunSQL.noop),
+    ]
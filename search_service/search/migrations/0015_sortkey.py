@@ -0,0 +1,149 @@
+"""
+Precomputed sort keys, maintained by statement level triggers on search_indexables.
+
+For each change, the sort key for each changed (iiif_id, lower(type), lower(subtype)) is
+recomputed from the first (lowest id) indexable with that type and subtype, or deleted if the
+IIIF resource no longer has one.
+"""
+from django.db import migrations, models
+import django.db.models.deletion
+
+SORTKEY_COLUMNS = """
+    left(i.indexable, 256), i.indexable_int, i.indexable_float, i.indexable_date_range_start,
+    i.indexable_date_range_end
+"""
+
+CREATE_TRIGGERS = f"""
+-- Recompute the sort keys for (iiif_id, type, subtype) keys, with lower case types/subtypes
+CREATE OR REPLACE FUNCTION search_sortkey_refresh(
+    iiif_ids text[], types text[], subtypes text[]
+) RETURNS void AS $$
+    WITH changed AS (
+        SELECT DISTINCT * FROM unnest(iiif_ids, types, subtypes) AS k(iiif_id, type, subtype)
+    ), deleted AS (
+        DELETE FROM search_sortkey s USING changed c
+        WHERE s.iiif_id = c.iiif_id AND s.type = c.type AND s.subtype = c.subtype
+            AND NOT EXISTS (
+                SELECT 1 FROM search_indexables i
+                WHERE i.iiif_id = c.iiif_id AND lower(i.type) = c.type
+                    AND lower(i.subtype) = c.subtype
+            )
+    )
+    INSERT INTO search_sortkey (
+        iiif_id, type, subtype, indexable, indexable_int, indexable_float,
+        indexable_date_range_start, indexable_date_range_end
+    )
+    SELECT DISTINCT ON (c.iiif_id, c.type, c.subtype) c.iiif_id, c.type, c.subtype,
+        {SORTKEY_COLUMNS}
+    FROM changed c
+    JOIN search_indexables i ON i.iiif_id = c.iiif_id AND lower(i.type) = c.type
+        AND lower(i.subtype) = c.subtype
+    ORDER BY c.iiif_id, c.type, c.subtype, i.id
+    ON CONFLICT (iiif_id, type, subtype) DO UPDATE SET
+        indexable = EXCLUDED.indexable,
+        indexable_int = EXCLUDED.indexable_int,
+        indexable_float = EXCLUDED.indexable_float,
+        indexable_date_range_start = EXCLUDED.indexable_date_range_start,
+        indexable_date_range_end = EXCLUDED.indexable_date_range_end;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION search_sortkey_indexables_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM search_sortkey_refresh(
+            array_agg(iiif_id), array_agg(lower(type)), array_agg(lower(subtype))
+        ) FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM search_sortkey_refresh(
+            array_agg(iiif_id), array_agg(lower(type)), array_agg(lower(subtype))
+        ) FROM old_rows;
+    ELSE
+        PERFORM search_sortkey_refresh(
+            array_agg(iiif_id), array_agg(lower(type)), array_agg(lower(subtype))
+        ) FROM (
+            SELECT iiif_id, type, subtype FROM new_rows
+            UNION SELECT iiif_id, type, subtype FROM old_rows
+        ) rows;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER search_sortkey_indexables_insert
+    AFTER INSERT ON search_indexables REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION search_sortkey_indexables_trigger();
+CREATE TRIGGER search_sortkey_indexables_update
+    AFTER UPDATE ON search_indexables REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION search_sortkey_indexables_trigger();
+CREATE TRIGGER search_sortkey_indexables_delete
+    AFTER DELETE ON search_indexables REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION search_sortkey_indexables_trigger();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS search_sortkey_indexables_insert ON search_indexables;
+DROP TRIGGER IF EXISTS search_sortkey_indexables_update ON search_indexables;
+DROP TRIGGER IF EXISTS search_sortkey_indexables_delete ON search_indexables;
+DROP FUNCTION IF EXISTS search_sortkey_indexables_trigger();
+DROP FUNCTION IF EXISTS search_sortkey_refresh(text[], text[], text[]);
+"""
+
+BACKFILL = f"""
+INSERT INTO search_sortkey (
+    iiif_id, type, subtype, indexable, indexable_int, indexable_float,
+    indexable_date_range_start, indexable_date_range_end
+)
+SELECT DISTINCT ON (i.iiif_id, lower(i.type), lower(i.subtype))
+    i.iiif_id, lower(i.type), lower(i.subtype), {SORTKEY_COLUMNS}
+FROM search_indexables i
+ORDER BY i.iiif_id, lower(i.type), lower(i.subtype), i.id;
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0014_facetcount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SortKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(max_length=64)),
+                ('subtype', models.CharField(max_length=256)),
+                ('indexable', models.CharField(max_length=256)),
+                ('indexable_int', models.IntegerField(blank=True, null=True)),
+                ('indexable_float', models.FloatField(blank=True, null=True)),
+                ('indexable_date_range_start', models.DateTimeField(blank=True, null=True)),
+                ('indexable_date_range_end', models.DateTimeField(blank=True, null=True)),
+                ('iiif', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sort_keys', to='search.iiifresource')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='sortkey',
+            index=models.Index(fields=['type', 'subtype', 'indexable'], name='search_sort_type_cba03c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sortkey',
+            index=models.Index(fields=['type', 'subtype', 'indexable_int'], name='search_sort_type_ffadab_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sortkey',
+            index=models.Index(fields=['type', 'subtype', 'indexable_float'], name='search_sort_type_2f0c24_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sortkey',
+            index=models.Index(fields=['type', 'subtype', 'indexable_date_range_start'], name='search_sort_type_bc7809_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sortkey',
+            index=models.Index(fields=['type', 'subtype', 'indexable_date_range_end'], name='search_sort_type_eec980_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='sortkey',
+            constraint=models.UniqueConstraint(fields=('iiif', 'type', 'subtype'), name='unique_sortkey'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, reverse_sql=DROP_TRIGGERS),
+        migrations.RunSQL(BACKFILL, reverse_sql=migrations.RunSQL.noop),
+    ]
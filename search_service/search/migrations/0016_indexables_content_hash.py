@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("search", "0015_sortkey"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="indexables",
+            name="content_hash",
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("search", "0016_indexables_content_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="iiifresource",
+            name="ingest_digest",
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,217 @@
+"""
+Materialised autocomplete terms, maintained by statement level triggers on search_indexables and
+search_iiifresource_contexts.
+
+For each change, the indexables (with values of up to 256 characters) are added to (or removed
+from) the count for their value in each of their IIIF resource's contexts, and in the ""
+(all IIIF resources) context, per Madoc site (see 0014_facetcount). Types and subtypes are lower
+cased, and the values are normalised for matching by search_autocomplete_normalise.
+
+If the pg_trgm extension is available, it is installed, and a trigram index is added on the
+normalised values for fuzzy matching (see autocomplete.autocomplete_terms).
+"""
+import logging
+
+from django.db import DatabaseError, migrations, models, transaction
+import django.db.models.expressions
+import django.db.models.functions.text
+
+logger = logging.getLogger(__name__)
+
+CREATE_TRIGGERS = """
+-- Lower case, with runs of whitespace collapsed to a single space (see autocomplete.normalise_term)
+CREATE OR REPLACE FUNCTION search_autocomplete_normalise(value text) RETURNS text AS $$
+    SELECT lower(regexp_replace(btrim(value), '\\s+', ' ', 'g'))
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Apply the changes in the number of indexables for (iiif_id, type, subtype, indexable) keys
+CREATE OR REPLACE FUNCTION search_autocomplete_apply_indexables(
+    iiif_ids text[], types text[], subtypes text[], indexables text[], changes bigint[]
+) RETURNS void AS $$
+    INSERT INTO search_autocompleteterm (context, site, type, subtype, indexable, normalised, n)
+    SELECT scope.context, search_facetcount_site(k.iiif_id), k.type, k.subtype, k.indexable,
+        search_autocomplete_normalise(k.indexable), sum(k.change)
+    FROM unnest(iiif_ids, types, subtypes, indexables, changes)
+        AS k(iiif_id, type, subtype, indexable, change)
+    CROSS JOIN LATERAL (
+        SELECT context_id AS context FROM search_iiifresource_contexts
+        WHERE iiifresource_id = k.iiif_id
+        UNION SELECT ''
+    ) scope
+    GROUP BY 1, 2, 3, 4, 5
+    ON CONFLICT (context, site, type, subtype, md5(indexable))
+        DO UPDATE SET n = search_autocompleteterm.n + EXCLUDED.n;
+    DELETE FROM search_autocompleteterm WHERE n <= 0;
+$$ LANGUAGE sql;
+
+-- Add (change = 1) or remove (change = -1) IIIF resources from contexts
+CREATE OR REPLACE FUNCTION search_autocomplete_apply_contexts(
+    iiif_ids text[], context_ids text[], change int
+) RETURNS void AS $$
+    INSERT INTO search_autocompleteterm (context, site, type, subtype, indexable, normalised, n)
+    SELECT c.context_id, search_facetcount_site(c.iiif_id), lower(i.type), lower(i.subtype),
+        i.indexable, search_autocomplete_normalise(i.indexable), count(*) * change
+    FROM unnest(iiif_ids, context_ids) AS c(iiif_id, context_id)
+    JOIN search_indexables i ON i.iiif_id = c.iiif_id
+    WHERE char_length(i.indexable) BETWEEN 1 AND 256
+    GROUP BY 1, 2, 3, 4, 5
+    ON CONFLICT (context, site, type, subtype, md5(indexable))
+        DO UPDATE SET n = search_autocompleteterm.n + EXCLUDED.n;
+    DELETE FROM search_autocompleteterm WHERE n <= 0;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION search_autocomplete_indexables_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM search_autocomplete_apply_indexables(
+            array_agg(iiif_id), array_agg(type), array_agg(subtype), array_agg(indexable),
+            array_agg(change)
+        ) FROM (
+            SELECT iiif_id, lower(type), lower(subtype), indexable, count(*) FROM new_rows
+            WHERE char_length(indexable) BETWEEN 1 AND 256 GROUP BY 1, 2, 3, 4
+        ) changes(iiif_id, type, subtype, indexable, change);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM search_autocomplete_apply_indexables(
+            array_agg(iiif_id), array_agg(type), array_agg(subtype), array_agg(indexable),
+            array_agg(change)
+        ) FROM (
+            SELECT iiif_id, lower(type), lower(subtype), indexable, -count(*) FROM old_rows
+            WHERE char_length(indexable) BETWEEN 1 AND 256 GROUP BY 1, 2, 3, 4
+        ) changes(iiif_id, type, subtype, indexable, change);
+    ELSE
+        PERFORM search_autocomplete_apply_indexables(
+            array_agg(iiif_id), array_agg(type), array_agg(subtype), array_agg(indexable),
+            array_agg(change)
+        ) FROM (
+            SELECT iiif_id, lower(type), lower(subtype), indexable, sum(change) FROM (
+                SELECT iiif_id, type, subtype, indexable, 1 AS change FROM new_rows
+                UNION ALL
+                SELECT iiif_id, type, subtype, indexable, -1 AS change FROM old_rows
+            ) rows
+            WHERE char_length(indexable) BETWEEN 1 AND 256 GROUP BY 1, 2, 3, 4
+            HAVING sum(change) <> 0
+        ) changes(iiif_id, type, subtype, indexable, change);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION search_autocomplete_contexts_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM search_autocomplete_apply_contexts(
+            array_agg(iiifresource_id), array_agg(context_id), 1
+        ) FROM new_rows;
+    ELSE
+        PERFORM search_autocomplete_apply_contexts(
+            array_agg(iiifresource_id), array_agg(context_id), -1
+        ) FROM old_rows;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER search_autocomplete_indexables_insert
+    AFTER INSERT ON search_indexables REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION search_autocomplete_indexables_trigger();
+CREATE TRIGGER search_autocomplete_indexables_update
+    AFTER UPDATE ON search_indexables REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION search_autocomplete_indexables_trigger();
+CREATE TRIGGER search_autocomplete_indexables_delete
+    AFTER DELETE ON search_indexables REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION search_autocomplete_indexables_trigger();
+CREATE TRIGGER search_autocomplete_contexts_insert
+    AFTER INSERT ON search_iiifresource_contexts REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION search_autocomplete_contexts_trigger();
+CREATE TRIGGER search_autocomplete_contexts_delete
+    AFTER DELETE ON search_iiifresource_contexts REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION search_autocomplete_contexts_trigger();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS search_autocomplete_indexables_insert ON search_indexables;
+DROP TRIGGER IF EXISTS search_autocomplete_indexables_update ON search_indexables;
+DROP TRIGGER IF EXISTS search_autocomplete_indexables_delete ON search_indexables;
+DROP TRIGGER IF EXISTS search_autocomplete_contexts_insert ON search_iiifresource_contexts;
+DROP TRIGGER IF EXISTS search_autocomplete_contexts_delete ON search_iiifresource_contexts;
+DROP FUNCTION IF EXISTS search_autocomplete_indexables_trigger();
+DROP FUNCTION IF EXISTS search_autocomplete_contexts_trigger();
+DROP FUNCTION IF EXISTS search_autocomplete_apply_indexables(text[], text[], text[], text[], bigint[]);
+DROP FUNCTION IF EXISTS search_autocomplete_apply_contexts(text[], text[], int);
+DROP FUNCTION IF EXISTS search_autocomplete_normalise(text);
+"""
+
+BACKFILL = """
+INSERT INTO search_autocompleteterm (context, site, type, subtype, indexable, normalised, n)
+SELECT scope.context, search_facetcount_site(i.iiif_id), lower(i.type), lower(i.subtype),
+    i.indexable, search_autocomplete_normalise(i.indexable), count(*)
+FROM search_indexables i
+CROSS JOIN LATERAL (
+    SELECT context_id AS context FROM search_iiifresource_contexts
+    WHERE iiifresource_id = i.iiif_id
+    UNION SELECT ''
+) scope
+WHERE char_length(i.indexable) BETWEEN 1 AND 256
+GROUP BY 1, 2, 3, 4, 5;
+"""
+
+
+def create_trigram_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            logger.warning("pg_trgm is not available, so fuzzy autocomplete won't be indexed")
+            return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except DatabaseError as e:
+        logger.warning(f"Couldn't install pg_trgm, so fuzzy autocomplete won't be indexed: {e}")
+        return
+    schema_editor.execute(
+        "CREATE INDEX autocompleteterm_trigram ON search_autocompleteterm "
+        "USING gin (normalised gin_trgm_ops)"
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    schema_editor.execute("DROP INDEX IF EXISTS autocompleteterm_trigram")
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0017_iiifresource_ingest_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AutocompleteTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('context', models.CharField(max_length=512)),
+                ('site', models.CharField(blank=True, max_length=512)),
+                ('type', models.CharField(max_length=64)),
+                ('subtype', models.CharField(max_length=256)),
+                ('indexable', models.CharField(max_length=256)),
+                ('normalised', models.CharField(max_length=256)),
+                ('n', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='autocompleteterm',
+            index=models.Index(fields=['context', 'type', 'subtype', 'normalised'], name='autocompleteterm_prefix', opclasses=['varchar_pattern_ops', 'varchar_pattern_ops', 'varchar_pattern_ops', 'varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='autocompleteterm',
+            index=models.Index(condition=models.Q(('n__lte', 0)), fields=['n'], name='autocompleteterm_empty'),
+        ),
+        migrations.AddConstraint(
+            model_name='autocompleteterm',
+            constraint=models.UniqueConstraint(django.db.models.expressions.F('context'), django.db.models.expressions.F('site'), django.db.models.expressions.F('type'), django.db.models.expressions.F('subtype'), django.db.models.functions.text.MD5('indexable'), name='unique_autocompleteterm'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, reverse_sql=DROP_TRIGGERS),
+        migrations.RunSQL(BACKFILL, reverse_sql=migrations.RunSQL.noop),
+        migrations.RunPython(create_trigram_index, reverse_code=drop_trigram_index),
+    ]
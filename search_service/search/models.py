@@ -1,7 +1,9 @@
+import uuid
+
 from django.contrib.postgres.indexes import GinIndex, HashIndex
-from django.contrib.postgres.search import SearchVectorField, SearchVector
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
-from django.db.models.functions import Upper
+from django.db.models.functions import MD5, Upper
 
 # from .langbase import INTERNET_LANGUAGES
 from django.utils.translation import gettext_lazy as _
@@ -27,7 +29,8 @@ class Context(TimeStampedModel):
         max_length=512, primary_key=True, editable=True, verbose_name=_("Identifier (Context)")
     )
     type = models.CharField(max_length=30)
-    slug = AutoSlugField(populate_from="id", max_length=512)
+    # overwrite_on_add=False so that slugs generated in bulk (see unique_slugs) are kept
+    slug = AutoSlugField(populate_from="id", max_length=512, overwrite_on_add=False)
 
 
 class IIIFResource(TimeStampedModel):
@@ -41,7 +44,7 @@ class IIIFResource(TimeStampedModel):
     )
     madoc_thumbnail = models.URLField(blank=True, null=True)
     id = models.URLField(verbose_name=_("IIIF id"))
-    slug = AutoSlugField(populate_from="madoc_id", max_length=512)
+    slug = AutoSlugField(populate_from="madoc_id", max_length=512, overwrite_on_add=False)
     type = models.CharField(max_length=30)
     label = models.JSONField(blank=True, null=True)
     thumbnail = models.JSONField(blank=True, null=True)
@@ -55,6 +58,8 @@ class IIIFResource(TimeStampedModel):
     contexts = models.ManyToManyField(Context, blank=True, related_name="associated_iiif")
     first_canvas_id = models.URLField(verbose_name=_("First canvas IIIF id"), blank=True, null=True)
     first_canvas_json = models.JSONField(blank=True, null=True)
+    # Digest of the data for the last ingest of this resource, used to skip unchanged re-ingests
+    ingest_digest = models.CharField(max_length=64, blank=True, null=True, editable=False)
 
     class Meta:
         # Add a postgres index for the search_vector
@@ -84,7 +89,8 @@ class Indexables(TimeStampedModel):
     indexable_datetime: indexable date time
     indexable_json: indexable json
     indexable: concatenated/summarised content for indexing
-    search_vector: search vector for the indexer to use
+    search_vector: search vector for the indexer to use, this is computed by a database trigger
+        from indexable and language_pg on insert/update (see migration 0011)
     original_content: textual content (as per original), if the original is JSON, this will be
         dumped/serialised JSON, rather than a JSON object
 
@@ -121,15 +127,9 @@ class Indexables(TimeStampedModel):
     selector = models.JSONField(blank=True, null=True)
     type = models.CharField(max_length=64)
     subtype = models.CharField(max_length=256)
-
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        if "update_fields" not in kwargs or "search_vector" not in kwargs["update_fields"]:
-            if self.language_pg:
-                self.search_vector = SearchVector("indexable", weight="A", config=self.language_pg)
-            else:
-                self.search_vector = SearchVector("indexable", weight="A")
-            self.save(update_fields=["search_vector"])
+    # Hash of the flattened indexable, for indexables derived from a IIIF resource, used to diff
+    # the indexables on re-ingest
+    content_hash = models.CharField(max_length=32, blank=True, null=True, editable=False)
 
     class Meta:
         # Add a postgres index for the search_vector
@@ -146,3 +146,183 @@ class Indexables(TimeStampedModel):
             models.Index(Upper("type"), Upper("subtype"), name="uppercase_type_subtype"),
             HashIndex(fields=["indexable"]),
         ]
+
+
+class FacetCount(models.Model):
+    """
+    Materialised facet counts, i.e. the number of IIIF resources in a context that have a
+    metadata indexable with this type, subtype and value.
+
+    Maintained by database triggers on the indexables and the IIIF resource contexts (see
+    migration 0014_facetcount), and used for the facets on searches that are only filtered
+    by context.
+
+    context: context id, or "" for all IIIF resources
+    site: the Madoc site URN that the IIIF resources' madoc_ids start with, or ""
+    type: indexable type
+    subtype: indexable subtype
+    indexable: indexable value
+    n: number of IIIF resources
+    """
+
+    context = models.CharField(max_length=512)
+    site = models.CharField(max_length=512, blank=True)
+    type = models.CharField(max_length=64)
+    subtype = models.CharField(max_length=256)
+    indexable = models.TextField()
+    n = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["context", "type", "subtype"]),
+            models.Index(fields=["n"], condition=models.Q(n__lte=0), name="facetcount_empty"),
+        ]
+        constraints = [
+            # Indexable values can be too long for a btree index, so use a hash of the value
+            models.UniqueConstraint(
+                "context", "site", "type", "subtype", MD5("indexable"), name="unique_facetcount"
+            ),
+        ]
+
+
+class SortKey(models.Model):
+    """
+    Precomputed sort keys, i.e. the value of the first indexable with a type and subtype for
+    each IIIF resource, so that searches can be ordered on an indexed column, rather than a
+    subquery on the indexables for every result.
+
+    Maintained by database triggers on the indexables (see migration 0015_sortkey).
+
+    iiif: the IIIF resource
+    type: indexable type (lower case)
+    subtype: indexable subtype (lower case)
+    indexable: indexable value, truncated to 256 characters so that it can be indexed
+    indexable_int: indexable integer
+    indexable_float: indexable float
+    indexable_date_range_start: indexable start date
+    indexable_date_range_end: indexable end date
+    """
+
+    iiif = models.ForeignKey(IIIFResource, related_name="sort_keys", on_delete=models.CASCADE)
+    type = models.CharField(max_length=64)
+    subtype = models.CharField(max_length=256)
+    indexable = models.CharField(max_length=256)
+    indexable_int = models.IntegerField(blank=True, null=True)
+    indexable_float = models.FloatField(blank=True, null=True)
+    indexable_date_range_start = models.DateTimeField(blank=True, null=True)
+    indexable_date_range_end = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["type", "subtype", "indexable"]),
+            models.Index(fields=["type", "subtype", "indexable_int"]),
+            models.Index(fields=["type", "subtype", "indexable_float"]),
+            models.Index(fields=["type", "subtype", "indexable_date_range_start"]),
+            models.Index(fields=["type", "subtype", "indexable_date_range_end"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["iiif", "type", "subtype"], name="unique_sortkey"),
+        ]
+
+
+class AutocompleteTerm(models.Model):
+    """
+    Materialised autocomplete terms, i.e. the distinct indexable values (of up to 256 characters)
+    for each type and subtype in a context, with the number of indexables with that value.
+
+    Maintained by database triggers on the indexables and the IIIF resource contexts (see
+    migration 0018_autocompleteterm), and used for autocomplete requests that are only filtered
+    by context (see autocomplete.autocomplete_terms). If the pg_trgm extension is available, the
+    migration also adds a trigram index on the normalised values, for fuzzy matching.
+
+    context: context id, or "" for all IIIF resources
+    site: the Madoc site URN that the IIIF resources' madoc_ids start with, or ""
+    type: indexable type (lower case)
+    subtype: indexable subtype (lower case)
+    indexable: indexable value
+    normalised: indexable value in lower case, with whitespace collapsed, for matching
+    n: number of indexables
+    """
+
+    context = models.CharField(max_length=512)
+    site = models.CharField(max_length=512, blank=True)
+    type = models.CharField(max_length=64)
+    subtype = models.CharField(max_length=256)
+    indexable = models.CharField(max_length=256)
+    normalised = models.CharField(max_length=256)
+    n = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Prefix matches on the normalised value (LIKE 'value%')
+            models.Index(
+                fields=["context", "type", "subtype", "normalised"],
+                name="autocompleteterm_prefix",
+                opclasses=["varchar_pattern_ops"] * 4,
+            ),
+            models.Index(fields=["n"], condition=models.Q(n__lte=0), name="autocompleteterm_empty"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                "context", "site", "type", "subtype", MD5("indexable"), name="unique_autocompleteterm"
+            ),
+        ]
+
+
+class ImageServiceInfo(TimeStampedModel):
+    """
+    Cached info.json for a IIIF image service, fetched when normalising thumbnails
+    (see iiif_utils.DatabaseInfoJSONStore).
+
+    service_id: the image service id
+    info: the info.json
+    """
+
+    service_id = models.CharField(max_length=1024, primary_key=True)
+    info = models.JSONField()
+
+
+class IngestJob(TimeStampedModel):
+    """
+    A queued IIIF ingest (create or update) that is processed asynchronously by the ingest
+    workers (see the process_ingest_jobs management command), rather than in the request.
+
+    id: autogenerated UUID, returned to the client so that it can poll for the job status
+    action: create or update
+    madoc_id: Madoc identifier for the IIIF resource being ingested
+    payload: the parsed ingest data, as returned by parse_and_configure_iiif_ingest
+    status: queued, running, complete or failed
+    errors: validation errors or other details, if the job failed
+    started: when a worker picked up the job
+    finished: when the job completed or failed
+    """
+
+    CREATE = "create"
+    UPDATE = "update"
+    ACTION_CHOICES = ((CREATE, _("Create")), (UPDATE, _("Update")))
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETE = "complete"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (QUEUED, _("Queued")),
+        (RUNNING, _("Running")),
+        (COMPLETE, _("Complete")),
+        (FAILED, _("Failed")),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    action = models.CharField(max_length=16, choices=ACTION_CHOICES, default=CREATE)
+    madoc_id = models.CharField(max_length=512, verbose_name=_("Identifier (Madoc)"))
+    payload = models.JSONField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    errors = models.JSONField(blank=True, null=True)
+    started = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created"]),
+            models.Index(fields=["madoc_id"]),
+        ]
@@ -1,11 +1,62 @@
+import base64
+import json
 import logging
-from django.conf import settings
+import math
+from datetime import datetime
 
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import F, FloatField, Q
+from django.db.models.expressions import RawSQL, Value
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 logger = logging.getLogger(__name__)
 
+COUNT_EXACT = "exact"
+COUNT_ESTIMATE = "estimate"
+COUNT_CAPPED = "capped"
+COUNT_NONE = "none"
+
+
+def estimated_count(queryset):
+    """
+    Estimate the number of results from the query planner's row estimate (EXPLAIN), rather
+    than running a COUNT(*).
+    """
+    plan = json.loads(queryset.explain(format="json"))
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def capped_count(queryset, cap):
+    """
+    Count the results, but stop counting at cap + 1.
+    """
+    return queryset.order_by()[: cap + 1].count()
+
+
+class MadocPaginator(Paginator):
+    """
+    Paginator that can estimate or cap the count, rather than always running a full COUNT(*).
+    """
+
+    def __init__(self, *args, count_mode=COUNT_EXACT, count_cap=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_mode = count_mode
+        self.count_cap = count_cap
+
+    @cached_property
+    def count(self):
+        if self.count_mode == COUNT_ESTIMATE:
+            return estimated_count(self.object_list)
+        if self.count_mode == COUNT_CAPPED:
+            return min(capped_count(self.object_list, self.count_cap), self.count_cap)
+        return super().count
+
 
 class MadocPagination(PageNumberPagination):
     """
@@ -17,21 +68,175 @@ class MadocPagination(PageNumberPagination):
         "totalPages": 35,
         "totalResults": 830
       }
+
+    Optional query parameters:
+
+    count: how to count the results, "exact" (the default), "estimate" (the query planner's
+        estimate), "capped" (an exact count up to PAGINATION_COUNT_CAP) or "none" (cursor
+        pagination only)
+    cursor: use keyset (cursor) pagination rather than page numbers, starting from the cursor
+        returned as "nextCursor" in the previous page, or from the first page if empty. Results
+        are ordered by the queryset's ordering (e.g. rank or sortk) and then the primary key
+        (e.g. madoc_id), and no count is run unless one is requested.
     """
     page_size_query_param = "page_size"
     max_page_size = settings.MAX_PAGE_SIZE
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    count_cap = settings.PAGINATION_COUNT_CAP
+    invalid_cursor_message = "Invalid cursor"
+
+    def get_count_mode(self, request, default):
+        count_mode = request.query_params.get(self.count_query_param, default)
+        if count_mode not in (COUNT_EXACT, COUNT_ESTIMATE, COUNT_CAPPED, COUNT_NONE):
+            return default
+        return count_mode
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.cursor = None
+        if self.cursor_query_param in request.query_params:
+            self.count_mode = self.get_count_mode(request, default=COUNT_NONE)
+            return self.paginate_queryset_by_cursor(queryset, request)
+        self.count_mode = self.get_count_mode(request, default=COUNT_EXACT)
+        if self.count_mode == COUNT_NONE:
+            self.count_mode = COUNT_EXACT
+        self.django_paginator_class = lambda *args, **kwargs: MadocPaginator(
+            *args, count_mode=self.count_mode, count_cap=self.count_cap, **kwargs
+        )
+        return super().paginate_queryset(queryset, request, view=view)
+
+    def get_count(self, queryset):
+        if self.count_mode == COUNT_ESTIMATE:
+            return estimated_count(queryset)
+        if self.count_mode == COUNT_CAPPED:
+            return min(capped_count(queryset, self.count_cap), self.count_cap)
+        if self.count_mode == COUNT_EXACT:
+            return queryset.count()
+
+    def get_count_flags(self, count):
+        """
+        Flag counts that aren't exact.
+        """
+        if self.count_mode == COUNT_ESTIMATE:
+            return {"totalResultsEstimated": True}
+        if self.count_mode == COUNT_CAPPED:
+            return {"totalResultsCapped": count >= self.count_cap}
+        return {}
+
+    @staticmethod
+    def get_cursor_ordering(queryset):
+        """
+        The (single) leading ordering key of the queryset, and its direction, for the keyset.
+
+        Constant keys (e.g. the rank of a search without fulltext) are ignored, as the results
+        are then just ordered by the primary key.
+        """
+        ordering = [o for o in queryset.query.order_by if isinstance(o, str)]
+        if not ordering:
+            return None, False
+        key, descending = ordering[0].lstrip("-"), ordering[0].startswith("-")
+        if isinstance(queryset.query.annotations.get(key), Value):
+            return None, False
+        return key, descending
+
+    def encode_cursor(self, key, descending, value, pk):
+        cursor = {"k": key, "d": descending, "v": value, "p": pk}
+        if isinstance(value, datetime):
+            cursor.update({"v": value.isoformat(), "t": "datetime"})
+        return base64.urlsafe_b64encode(json.dumps(cursor).encode("utf-8")).decode("ascii")
+
+    def decode_cursor(self, encoded, key, descending):
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            if cursor["k"] != key or cursor["d"] != descending:
+                raise ValueError("Cursor does not match the query ordering")
+            value = cursor["v"]
+            if cursor.get("t") == "datetime":
+                value = parse_datetime(value)
+            return value, cursor["p"]
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def keyset_filter(key, descending, value, pk):
+        """
+        Filter to the results after (value, pk), where NULL values of the key are sorted as
+        Postgres sorts them (last ascending, first descending).
+        """
+        if value is None:
+            after = Q(**{f"{key}__isnull": True, "pk__gt": pk})
+            if descending:
+                after |= Q(**{f"{key}__isnull": False})
+            return after
+        if key == "rank":
+            # The rank is a float4, so compare it with a float4 rather than the (float8) value
+            value = RawSQL("%s::real", (value,), output_field=FloatField())
+        if descending:
+            return Q(**{f"{key}__lt": value}) | Q(**{key: value, "pk__gt": pk})
+        return (
+            Q(**{f"{key}__gt": value})
+            | Q(**{key: value, "pk__gt": pk})
+            | Q(**{f"{key}__isnull": True})
+        )
+
+    def paginate_queryset_by_cursor(self, queryset, request):
+        self.page_size_value = self.get_page_size(request)
+        if not self.page_size_value:
+            return None
+        key, descending = self.get_cursor_ordering(queryset)
+        self.count = self.get_count(queryset) if self.count_mode != COUNT_NONE else None
+        if key is not None:
+            key_ordering = F(key).desc(nulls_first=True) if descending else F(key).asc(nulls_last=True)
+            queryset = queryset.order_by(key_ordering, "pk")
+        else:
+            queryset = queryset.order_by("pk")
+        if encoded := request.query_params.get(self.cursor_query_param):
+            self.cursor = encoded
+            value, pk = self.decode_cursor(encoded, key, descending)
+            if key is not None:
+                queryset = queryset.filter(self.keyset_filter(key, descending, value, pk))
+            else:
+                queryset = queryset.filter(pk__gt=pk)
+        results = list(queryset[: self.page_size_value + 1])
+        self.next_cursor = None
+        if len(results) > self.page_size_value:
+            results = results[: self.page_size_value]
+            last = results[-1]
+            self.next_cursor = self.encode_cursor(
+                key, descending, getattr(last, key) if key is not None else None, last.pk
+            )
+        self.page = None
+        return results
 
     def get_paginated_response(self, data):
-        return Response(
-            {
-                "pagination": {
-                    "page": self.page.number,
-                    "pageSize": self.page.paginator.per_page,
-                    "next": self.get_next_link(),
-                    "previous": self.get_previous_link(),
-                    "totalPages": self.page.paginator.num_pages,
-                    "totalResults": self.page.paginator.count,
-                },
-                "results": data,
+        if self.page is None:
+            pagination = {
+                "pageSize": self.page_size_value,
+                "cursor": self.cursor,
+                "nextCursor": self.next_cursor,
+                "next": replace_query_param(
+                    self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor
+                )
+                if self.next_cursor
+                else None,
             }
-        )
+            if self.count is not None:
+                pagination.update(
+                    {
+                        "totalPages": math.ceil(self.count / self.page_size_value),
+                        "totalResults": self.count,
+                        **self.get_count_flags(self.count),
+                    }
+                )
+            return Response({"pagination": pagination, "results": data})
+        pagination = {
+            "page": self.page.number,
+            "pageSize": self.page.paginator.per_page,
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "totalPages": self.page.paginator.num_pages,
+            "totalResults": self.page.paginator.count,
+            **self.get_count_flags(self.page.paginator.count),
+        }
+        return Response({"pagination": pagination, "results": data})
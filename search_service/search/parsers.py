@@ -1,10 +1,11 @@
 import codecs
 import json
-from functools import reduce
+from functools import lru_cache, reduce
 from operator import or_, and_
 import pytz
 from dateutil import parser
 import logging
+import re
 import unicodedata
 
 
@@ -19,14 +20,24 @@ from django.utils.translation import get_language
 from rest_framework.exceptions import ParseError
 from rest_framework.parsers import JSONParser
 
-from .prezi_upgrader import Upgrader
+from .metrics import instrument
 
 from .madoc_jwt import (
     request_madoc_site_urn,
 )
 
 default_lang = get_language()
-upgrader = Upgrader(flags={"default_lang": default_lang})
+
+
+@lru_cache(maxsize=None)
+def get_upgrader():
+    """
+    The IIIF Presentation 2 to 3 upgrader, created on first use rather than on import.
+    """
+    from .prezi_upgrader import Upgrader
+
+    return Upgrader(flags={"default_lang": default_lang})
+
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +46,14 @@ global_facet_on_manifests = settings.FACET_ON_MANIFESTS_ONLY
 global_facet_types = ["metadata"]
 global_non_latin_fulltext = settings.NONLATIN_FULLTEXT
 global_search_multiple_fields = settings.SEARCH_MULTIPLE_FIELDS
+global_bulk_cascade = settings.BULK_CASCADE
+global_skip_unchanged = settings.INGEST_SKIP_UNCHANGED
+global_async_ingest = settings.ASYNC_INGEST
+global_materialised_facets = settings.MATERIALISED_FACETS
+global_materialised_autocomplete = settings.MATERIALISED_AUTOCOMPLETE
+global_autocomplete_fuzzy = settings.AUTOCOMPLETE_FUZZY
+global_autocomplete_index = settings.AUTOCOMPLETE_INDEX
+global_exists_plan = settings.SEARCH_EXISTS_PLAN
 
 
 def date_query_value(q_key, value):
@@ -202,7 +221,37 @@ def is_latin(text):
     )
 
 
+def materialised_scope(request_data, madoc_site_urn):
+    """
+    If a request is filtered by (at most) a single context and the Madoc site, return the context
+    and site to read the materialised facet counts or autocomplete terms for.
+    """
+    contexts = request_data.get("contexts")
+    if (contexts and not (isinstance(contexts, list) and len(contexts) == 1)) or (
+        madoc_site_urn and not re.fullmatch(r"urn:madoc:site:[0-9]+", madoc_site_urn)
+    ):
+        return
+    return {"context": contexts[0] if contexts else "", "site": madoc_site_urn or ""}
+
+
+def facet_counts_scope(request_data, madoc_site_urn, filtered, facet_types, facet_on_manifests):
+    """
+    If the facets for a search can be read from the materialised facet counts, i.e. the search is
+    filtered by (at most) a single context and the Madoc site, return the context and site to
+    read the counts for.
+    """
+    if (
+        filtered
+        or facet_on_manifests
+        or request_data.get("facet_languages")
+        or not set(facet_types) <= {"metadata"}
+    ):
+        return
+    return materialised_scope(request_data, madoc_site_urn)
+
+
 class IIIFSearchParser(JSONParser):
+    @instrument("parse")
     def parse(self, stream, media_type=None, parser_context=None):
         logger.debug("IIIF Search Parser being invoked")
         parser_context = parser_context or {}
@@ -240,6 +289,15 @@ class IIIFSearchParser(JSONParser):
             autocomplete_type = request_data.get("autocomplete_type", None)
             autocomplete_subtype = request_data.get("autocomplete_subtype", None)
             autocomplete_query = request_data.get("autocomplete_query", None)
+            materialised_facets = request_data.get(
+                "materialised_facets", global_materialised_facets
+            )
+            materialised_autocomplete = request_data.get(
+                "materialised_autocomplete", global_materialised_autocomplete
+            )
+            autocomplete_fuzzy = request_data.get("autocomplete_fuzzy", global_autocomplete_fuzzy)
+            autocomplete_index = request_data.get("autocomplete_index", global_autocomplete_index)
+            exists_plan = request_data.get("exists_plan", global_exists_plan)
             if madoc_site_urn := request_madoc_site_urn(parser_context.get("request")):
                 logger.debug(f"Got madoc site urn: {madoc_site_urn}")
                 prefilter_kwargs.append(Q(**{f"madoc_id__startswith": madoc_site_urn}))
@@ -330,6 +388,23 @@ class IIIFSearchParser(JSONParser):
             if search_type:
                 hits_filter_kwargs["search_type"] = search_type
             sort_order = request_data.get("ordering", {"ordering": "descending"})
+            filtered = bool(
+                filter_kwargs or postfilter_q or contexts_all or madoc_identifiers or iiif_identifiers
+            )
+            if materialised_facets:
+                facet_counts = facet_counts_scope(
+                    request_data=request_data,
+                    madoc_site_urn=madoc_site_urn,
+                    filtered=filtered,
+                    facet_types=facet_types,
+                    facet_on_manifests=facet_on_manifests,
+                )
+            else:
+                facet_counts = None
+            if materialised_autocomplete and not filtered:
+                autocomplete_scope = materialised_scope(request_data, madoc_site_urn)
+            else:
+                autocomplete_scope = None
             logger.info(f"Filter kwargs: {filter_kwargs}")
             return {
                 "prefilter_kwargs": prefilter_kwargs,
@@ -342,10 +417,15 @@ class IIIFSearchParser(JSONParser):
                 "facet_types": facet_types,
                 "facet_languages": facet_languages,
                 "num_facets": num_facets,
+                "facet_counts_scope": facet_counts,
+                "exists_plan": exists_plan,
                 "metadata_fields": metadata_fields,
                 "autocomplete_type": autocomplete_type,
                 "autocomplete_subtype": autocomplete_subtype,
                 "autocomplete_query": autocomplete_query,
+                "autocomplete_scope": autocomplete_scope,
+                "autocomplete_fuzzy": autocomplete_fuzzy,
+                "autocomplete_index": autocomplete_index,
             }
         except ValueError as exc:
             raise ParseError("JSON parse error - %s" % str(exc))
@@ -360,6 +440,9 @@ def parse_and_configure_iiif_ingest(data, madoc_site_urn=None):
         {
         "casacde": Boolean,
         "cascade_canvases": Boolean,
+        "bulk_cascade": Boolean,
+        "skip_unchanged": Boolean,
+        "async_ingest": Boolean,
         "contexts": List,
         "resource": IIIF Presentation API resource,
         "id": Madoc ID (string),
@@ -373,6 +456,9 @@ def parse_and_configure_iiif_ingest(data, madoc_site_urn=None):
     _return = dict(
         cascade=data.get("cascade", False),
         cascade_canvases=data.get("cascade_canvases", False),
+        bulk_cascade=data.get("bulk_cascade", global_bulk_cascade),
+        skip_unchanged=data.get("skip_unchanged", global_skip_unchanged),
+        async_ingest=data.get("async_ingest", global_async_ingest),
         resource_contexts=data.get("contexts", []),
         iiif3_resource=None,
         manifest=None,
@@ -386,7 +472,7 @@ def parse_and_configure_iiif_ingest(data, madoc_site_urn=None):
             _return["madoc_id"] = f"{madoc_site_urn}|{_return['madoc_id']}"
     if (iiif_resource := data.get("resource")) is not None:
         if iiif_resource.get("@context") == "http://iiif.io/api/presentation/2/context.json":
-            iiif3 = upgrader.process_resource(iiif_resource, top=True)
+            iiif3 = get_upgrader().process_resource(iiif_resource, top=True)
             iiif3["@context"] = "http://iiif.io/api/presentation/3/context.json"
             _return["iiif3_resource"] = iiif3
         else:
@@ -1,5 +1,4 @@
 import json
-import requests
 import uuid
 from collections import OrderedDict
 from django.utils.translation import get_language
@@ -183,6 +182,8 @@ class Upgrader(object):
             print(msg)
 
     def retrieve_resource(self, uri):
+        import requests
+
         resp = requests.get(uri, verify=False)
         try:
             val = resp.json()
@@ -396,6 +397,8 @@ class Upgrader(object):
 
     def set_remote_type(self, what):
         # do a HEAD on the resource and look at Content-Type
+        import requests
+
         try:
             h = requests.head(what["id"])
         except:
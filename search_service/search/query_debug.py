@@ -0,0 +1,187 @@
+"""
+Query plan introspection for the search, facets and autocomplete views.
+
+Requests with ?debug=true (from staff users, or from anyone if SEARCH_QUERY_DEBUG is set) return
+a "debug" object alongside the results, with the wall time of each stage of the request and, for
+each SQL query the stage ran, the SQL, its time and its EXPLAIN (ANALYZE, BUFFERS) output.
+
+Stages:
+
+* filter: the queryset produced by the view's filter backend (e.g. IIIFSearchFilter), which is
+  explained as a whole, even though only the count and the page of results are actually run
+* count: the paginator's count (or estimate)
+* page: the page of results
+* hits: serializing the page, e.g. fetching the hits for the page of results
+* facets / autocomplete: the facet or autocomplete queries
+"""
+import functools
+import logging
+import time
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from django.db import connection
+from rest_framework.exceptions import PermissionDenied
+
+logger = logging.getLogger(__name__)
+
+DEBUG_QUERY_PARAM = "debug"
+
+
+def query_debug_requested(request):
+    return request.query_params.get(DEBUG_QUERY_PARAM, "").lower() in ("1", "true", "yes")
+
+
+def query_debug_allowed(request):
+    return settings.SEARCH_QUERY_DEBUG or bool(getattr(request.user, "is_staff", False))
+
+
+class QueryDebugger:
+    """
+    Records the SQL queries run by a request (as a connection execute wrapper), grouped by stage.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.current_stage = None
+        self._stage_started = None
+
+    def get_stage(self, name):
+        return self.stages.setdefault(name, {"stage": name, "time_ms": 0.0, "queries": []})
+
+    def begin_stage(self, name):
+        self.end_stage()
+        self.current_stage = name
+        self._stage_started = time.perf_counter()
+
+    def end_stage(self):
+        # The paginate stage is split into the count and the page, timed by their queries
+        if self.current_stage not in (None, "paginate"):
+            self.get_stage(self.current_stage)["time_ms"] += (
+                time.perf_counter() - self._stage_started
+            ) * 1000
+        self.current_stage = None
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Attribute the queries run in the block to a stage, unless it is already in a stage (e.g.
+        the facets re-running the search filter).
+        """
+        if self.current_stage is not None:
+            yield
+            return
+        self.begin_stage(name)
+        try:
+            yield
+        finally:
+            self.end_stage()
+
+    def add_queryset(self, name, queryset):
+        """
+        Record the SQL for a queryset that hasn't been (or won't be) run as it is, e.g. the
+        filtered queryset before it is counted and paginated.
+        """
+        sql, params = queryset.query.sql_with_params()
+        self.get_stage(name)["queries"].append({"sql": sql, "params": params, "time_ms": None})
+
+    def __call__(self, execute, sql, params, many, context):
+        stage = self.current_stage or "other"
+        if stage == "paginate":
+            stage = "count" if sql.startswith(("SELECT COUNT(", "EXPLAIN")) else "page"
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            time_ms = (time.perf_counter() - started) * 1000
+            if stage in ("count", "page"):
+                self.get_stage(stage)["time_ms"] += time_ms
+            self.get_stage(stage)["queries"].append(
+                {"sql": sql, "params": params, "time_ms": round(time_ms, 3)}
+            )
+
+    def report(self, explain=True):
+        """
+        The stages, with the SQL for each query (with the parameters interpolated) and, if
+        explain is True, the EXPLAIN (ANALYZE, BUFFERS) output for each SELECT query.
+
+        N.B. explaining runs each query again.
+        """
+        stages = []
+        with connection.cursor() as cursor:
+            for stage in self.stages.values():
+                queries = []
+                for query in stage["queries"]:
+                    sql = cursor.mogrify(query["sql"], query["params"]).decode("utf-8")
+                    query_report = {"sql": sql, "time_ms": query["time_ms"]}
+                    if explain and query["sql"].startswith("SELECT"):
+                        cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {query['sql']}", query["params"])
+                        query_report["explain"] = [row[0] for row in cursor.fetchall()]
+                    queries.append(query_report)
+                stages.append(
+                    {"stage": stage["stage"], "time_ms": round(stage["time_ms"], 3), "queries": queries}
+                )
+        return stages
+
+
+def debug_search_response(list_method):
+    """
+    Decorator for the list method of a search view, that adds the query debugging to the
+    response for ?debug=true requests.
+    """
+
+    @functools.wraps(list_method)
+    def wrapper(self, request, *args, **kwargs):
+        if not query_debug_requested(request):
+            return list_method(self, request, *args, **kwargs)
+        if not query_debug_allowed(request):
+            raise PermissionDenied("Query debugging is only available to staff users")
+        self.query_debugger = QueryDebugger()
+        started = time.perf_counter()
+        with connection.execute_wrapper(self.query_debugger):
+            response = list_method(self, request, *args, **kwargs)
+        self.query_debugger.end_stage()
+        total_ms = (time.perf_counter() - started) * 1000
+        if response.status_code == 200:
+            response.data["debug"] = {
+                "time_ms": round(total_ms, 3),
+                "stages": self.query_debugger.report(),
+            }
+        return response
+
+    return wrapper
+
+
+class QueryDebugMixin:
+    """
+    Mixin for the search views, that attributes their queries to the query debugging stages.
+    """
+
+    query_debugger = None
+
+    def debug_stage(self, name):
+        if self.query_debugger is None:
+            return nullcontext()
+        return self.query_debugger.stage(name)
+
+    def filter_queryset(self, queryset):
+        if self.query_debugger is None or self.query_debugger.current_stage is not None:
+            return super().filter_queryset(queryset)
+        with self.query_debugger.stage("filter"):
+            queryset = super().filter_queryset(queryset)
+        self.query_debugger.add_queryset("filter", queryset)
+        return queryset
+
+    def paginate_queryset(self, queryset):
+        if self.query_debugger is None:
+            return super().paginate_queryset(queryset)
+        with self.query_debugger.stage("paginate"):
+            page = super().paginate_queryset(queryset)
+        # The page is serialized (e.g. the hits are fetched) before get_paginated_response
+        self.query_debugger.begin_stage("hits")
+        return page
+
+    def get_paginated_response(self, data):
+        if self.query_debugger is not None:
+            self.query_debugger.end_stage()
+        return super().get_paginated_response(data)
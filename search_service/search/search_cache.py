@@ -0,0 +1,272 @@
+"""
+Response cache for the search, facets and autocomplete views.
+
+Responses are cached by a hash of the parsed query (the output of IIIFSearchParser), the Madoc
+site URN, and the query string (i.e. the page and page size). Each key also includes
+generation counters, which are bumped on IIIF resource, indexable and context writes, so that
+cached responses are invalidated without having to find them:
+
+* a generation for each Madoc site (and "" for requests without a Madoc site), bumped on a
+  write to an IIIF resource with a madoc_id prefixed with that site
+* a generation for all responses, bumped on writes that can't be attributed to a site
+
+The generations are also used to refresh the in-process autocomplete index (see
+autocomplete_index). If the cache is disabled, they are kept in process.
+
+Backends:
+
+* lru: an in-process LRU cache. N.B. the cache (and the generation counters) aren't shared
+  between processes, e.g. with the process_ingest_jobs workers, so responses can be stale for
+  up to SEARCH_CACHE_TTL seconds after an asynchronous ingest.
+* django: Django's cache framework, using the SEARCH_CACHE_ALIAS cache
+"""
+import functools
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+from django.db.models.expressions import BaseExpression
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .madoc_jwt import request_madoc_site_urn
+from .query_debug import query_debug_requested
+
+logger = logging.getLogger(__name__)
+
+ALL_GENERATION = "*"
+
+
+def canonical(obj):
+    """
+    JSON encoder default for the parsed query data, which contains Q objects and query
+    expressions, e.g. SearchQuery.
+    """
+    if isinstance(obj, Q):
+        return {"Q": [obj.connector, obj.negated, list(obj.children)]}
+    if isinstance(obj, BaseExpression):
+        return {obj.__class__.__name__: repr(obj.identity)}
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj, key=repr)
+    return repr(obj)
+
+
+def madoc_id_sites(madoc_id):
+    """
+    The Madoc site URNs whose searches can include the IIIF resource with this madoc_id.
+
+    Searches are filtered to madoc_ids that start with the site URN, so a resource in
+    urn:madoc:site:12 can also be returned by a search for urn:madoc:site:1.
+
+    :param madoc_id: madoc_id, prefixed with the site URN and "|" if it belongs to a site
+    :return: list of site URNs, including "" for searches without a site
+    """
+    sites = [""]
+    if "|" in madoc_id:
+        site = madoc_id.split("|")[0]
+        sites.append(site)
+        while site and site[-1].isdigit() and site[:-1][-1:].isdigit():
+            site = site[:-1]
+            sites.append(site)
+    return sites
+
+
+class LocalGenerations:
+    """
+    Thread safe, in process, generation counters.
+    """
+
+    def __init__(self):
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get_generation(self, scope):
+        with self._lock:
+            return self._generations.get(scope, 0)
+
+    def bump_generation(self, scope):
+        with self._lock:
+            self._generations[scope] = self._generations.get(scope, 0) + 1
+
+
+class LRUSearchCacheBackend(LocalGenerations):
+    """
+    Thread safe, in process, LRU cache with a TTL.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            if (entry := self._data.get(key)) is None:
+                return
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+class DjangoSearchCacheBackend:
+    """
+    Cache using Django's cache framework.
+
+    Generations start at the current time (in ms), rather than 0, so that if a generation is
+    evicted from the cache, the cached responses for the old generation aren't reused.
+    """
+
+    def __init__(self, alias="default", ttl=300):
+        self.cache = caches[alias]
+        self.ttl = ttl
+
+    def get(self, key):
+        return self.cache.get(f"search:response:{key}")
+
+    def set(self, key, value):
+        self.cache.set(f"search:response:{key}", value, self.ttl)
+
+    def get_generation(self, scope):
+        generation_key = f"search:generation:{scope}"
+        if (generation := self.cache.get(generation_key)) is None:
+            self.cache.add(generation_key, int(time.time() * 1000), None)
+            generation = self.cache.get(generation_key, 0)
+        return generation
+
+    def bump_generation(self, scope):
+        generation_key = f"search:generation:{scope}"
+        try:
+            self.cache.incr(generation_key)
+        except ValueError:
+            self.cache.set(generation_key, int(time.time() * 1000), None)
+
+
+_search_cache = None
+_search_cache_lock = threading.Lock()
+# Generations for when the search cache is disabled
+_local_generations = LocalGenerations()
+
+
+def get_search_cache():
+    """
+    Get the search cache backend configured by the SEARCH_CACHE setting, or None if the search
+    cache is disabled.
+    """
+    global _search_cache
+    if not settings.SEARCH_CACHE:
+        return
+    if _search_cache is None:
+        with _search_cache_lock:
+            if _search_cache is None:
+                if settings.SEARCH_CACHE == "django":
+                    _search_cache = DjangoSearchCacheBackend(
+                        alias=settings.SEARCH_CACHE_ALIAS, ttl=settings.SEARCH_CACHE_TTL
+                    )
+                else:
+                    _search_cache = LRUSearchCacheBackend(
+                        maxsize=settings.SEARCH_CACHE_SIZE, ttl=settings.SEARCH_CACHE_TTL
+                    )
+    return _search_cache
+
+
+def get_generations(madoc_site_urn):
+    """
+    The current generations for the responses for a Madoc site URN (or "" for requests without a
+    Madoc site), from the search cache if it is enabled.
+
+    :return: list of the generation for all responses, and the generation for the site
+    """
+    cache = get_search_cache() or _local_generations
+    return [cache.get_generation(ALL_GENERATION), cache.get_generation(madoc_site_urn)]
+
+
+def search_cache_key(view_name, request):
+    """
+    Hash of the view, parsed query, site URN, query string and current generations.
+    """
+    madoc_site_urn = request_madoc_site_urn(request) or ""
+    key_data = {
+        "view": view_name,
+        "data": request.data,
+        "site": madoc_site_urn,
+        "query_params": sorted(request.query_params.lists()),
+        "generations": get_generations(madoc_site_urn),
+    }
+    return hashlib.sha256(
+        json.dumps(key_data, sort_keys=True, default=canonical).encode("utf-8")
+    ).hexdigest()
+
+
+def cache_search_response(list_method):
+    """
+    Decorator for the list method of a search view, that caches the response data.
+    """
+
+    @functools.wraps(list_method)
+    def wrapper(self, request, *args, **kwargs):
+        if (cache := get_search_cache()) is None or query_debug_requested(request):
+            return list_method(self, request, *args, **kwargs)
+        key = search_cache_key(self.__class__.__name__, request)
+        if (data := cache.get(key)) is not None:
+            logger.debug(f"Search cache hit: {key}")
+            return Response(data)
+        response = list_method(self, request, *args, **kwargs)
+        if response.status_code == 200:
+            # Store the response data as plain JSON data, e.g. the facets are nested defaultdicts
+            cache.set(key, json.loads(json.dumps(response.data, cls=JSONEncoder)))
+        return response
+
+    return wrapper
+
+
+def invalidate_search_cache(madoc_ids=None):
+    """
+    Invalidate the cached responses that can include these IIIF resources, or all cached
+    responses if madoc_ids is None.
+
+    :param madoc_ids: list of madoc_ids that have been written to
+    """
+    cache = get_search_cache() or _local_generations
+    if madoc_ids is None:
+        cache.bump_generation(ALL_GENERATION)
+        return
+    for site in {site for madoc_id in madoc_ids for site in madoc_id_sites(madoc_id)}:
+        cache.bump_generation(site)
+
+
+class SearchCacheInvalidationMixin:
+    """
+    Mixin for views that write IIIF resources, indexables or contexts, that invalidates the
+    search cache after a successful write.
+
+    Views can override get_invalidation_madoc_ids to just invalidate the cached responses for
+    the Madoc sites of the IIIF resources that were written.
+    """
+
+    def get_invalidation_madoc_ids(self, request, response):
+        return None
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if request.method not in ("GET", "HEAD", "OPTIONS") and 200 <= response.status_code < 300:
+            invalidate_search_cache(self.get_invalidation_madoc_ids(request, response))
+        return super().finalize_response(request, response, *args, **kwargs)
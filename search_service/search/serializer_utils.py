@@ -7,6 +7,7 @@ from collections import defaultdict
 from ordered_set import OrderedSet
 from dateutil import parser
 import bleach
+import functools
 import logging
 import itertools
 
@@ -148,42 +149,75 @@ def iiif_to_presentationapiresourcemodel(data_dict):
     return return_dict
 
 
-def get_language_data(lang_code=None, langbase=None):
-    if lang_code:
-        if "-" in lang_code:
-            lang_code = lang_code.split("-")[0]
-        if len(lang_code) == 2:
-            language_data = [x for x in langbase if x[1] == lang_code]
-            if language_data:
-                if language_data[0][-1].lower() in pg_languages:
-                    pg_lang = language_data[0][-1].lower()
-                else:
-                    pg_lang = None
-                return {
-                    "language_iso639_2": language_data[0][0],
-                    "language_iso639_1": language_data[0][1],
-                    "language_display": language_data[0][-1].lower(),
-                    "language_pg": pg_lang,
-                }
-        elif len(lang_code) == 3:
-            language_data = [x for x in langbase if x[0] == lang_code]
-            if language_data:
-                if language_data[0][-1].lower() in pg_languages:
-                    pg_lang = language_data[0][-1].lower()
-                else:
-                    pg_lang = None
+NO_LANGUAGE_DATA = {
+    "language_iso639_2": None,
+    "language_iso639_1": None,
+    "language_display": None,
+    "language_pg": None,
+}
+
+
+class LanguageIndex:
+    """
+    The language data for the ISO 639-1 and ISO 639-2 codes in a language base (see
+    langbase.LANGBASE), looked up by code rather than by scanning the language base, and memoised.
+    Where a code is in more than one row, the first is used.
+    """
+
+    def __init__(self, langbase):
+        self.langbase = langbase
+        self.iso639_1 = {}
+        self.iso639_2 = {}
+        for row in langbase:
+            if row[1]:
+                self.iso639_1.setdefault(row[1], row)
+            self.iso639_2.setdefault(row[0], row)
+        self.language_data = functools.lru_cache(maxsize=1024)(self.lookup)
+
+    def lookup(self, lang_code):
+        """
+        The language data for a language code, or BCP 47 language tag (by its primary language
+        subtag), e.g. "en", "eng" or "en-GB".
+        """
+        if lang_code:
+            if "-" in lang_code:
+                lang_code = lang_code.split("-")[0]
+            if len(lang_code) == 2:
+                row = self.iso639_1.get(lang_code)
+            elif len(lang_code) == 3:
+                row = self.iso639_2.get(lang_code)
+            else:
+                row = None
+            if row:
+                language_display = row[-1].lower()
                 return {
-                    "language_iso639_2": language_data[0][0],
-                    "language_iso639_1": language_data[0][1],
-                    "language_display": language_data[0][-1].lower(),
-                    "language_pg": pg_lang,
+                    "language_iso639_2": row[0],
+                    "language_iso639_1": row[1],
+                    "language_display": language_display,
+                    "language_pg": language_display if language_display in pg_languages else None,
                 }
-    return {
-        "language_iso639_2": None,
-        "language_iso639_1": None,
-        "language_display": None,
-        "language_pg": None,
-    }
+        return NO_LANGUAGE_DATA
+
+
+_language_indexes = {}
+
+
+def language_index(langbase=None):
+    """
+    The LanguageIndex for a language base (by default, langbase.LANGBASE), built on first use.
+    """
+    if langbase is None:
+        from .langbase import LANGBASE
+
+        langbase = LANGBASE
+    index = _language_indexes.get(id(langbase))
+    if index is None or index.langbase is not langbase:
+        index = _language_indexes[id(langbase)] = LanguageIndex(langbase)
+    return index
+
+
+def get_language_data(lang_code=None, langbase=None):
+    return dict(language_index(langbase).language_data(lang_code))
 
 
 def process_field(
@@ -293,6 +327,10 @@ def flatten_iiif_descriptive(iiif, default_language=None, lang_base=None):
     """
     Flatten the descriptive fields in a Presentation API into a list of dicts
     that can be passed to the Indexables model and serializers
+
+    N.B. bump serializers.INGEST_DIGEST_VERSION when changing the indexables that this (or
+    anything else in the ingest) produces for the same IIIF resource, or resources that are
+    re-ingested with skip_unchanged will keep their old indexables.
     """
     field_data = []
     dict_fields = [
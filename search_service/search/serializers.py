@@ -1,20 +1,35 @@
+import hashlib
 import logging
-import pytz
 import json
 import itertools
+from collections import defaultdict, Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import reduce
+from operator import or_
 from django.contrib.auth.models import User
 from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils import timezone
+from django.utils.text import slugify
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 from copy import deepcopy
-from .iiif_utils import get_first_canvas, get_iiif_resource_thumbnail_json, format_thumbnail_url
+from .iiif_utils import (
+    get_first_canvas,
+    get_iiif_resource_thumbnail_json,
+    format_thumbnail_url,
+    prefetch_thumbnail_info_json,
+)
+from .filters import get_sort_default
 from .indexable_utils import clean_values
-from .models import Indexables, IIIFResource, Context
+from .metrics import instrument
+from .models import Indexables, IIIFResource, Context, IngestJob
 from django.contrib.postgres.search import SearchQuery, SearchRank, SearchHeadline
 from django.db.models.functions import Concat
+from django.db import models
 from django.db.models import F, Value, CharField
-from datetime import datetime
 from .serializer_utils import calc_offsets, flatten_iiif_descriptive
-from .langbase import LANGBASE
 from django.utils.translation import get_language
 
 
@@ -22,7 +37,25 @@ default_lang = get_language()
 
 logger = logging.getLogger(__name__)
 
-utc = pytz.UTC
+# Context objects resolved by get_or_create_contexts, memoised for the duration of an ingest (see
+# resolved_contexts), so that, e.g., the Canvases of a Manifest don't each look up the same contexts
+_resolved_contexts = ContextVar("resolved_contexts", default=None)
+
+
+@contextmanager
+def resolved_contexts():
+    """
+    Memoise the Context objects resolved by get_or_create_contexts in the block (or decorated
+    function), e.g. for an ingest and its cascade. Nested blocks share the outermost memo.
+    """
+    if _resolved_contexts.get() is not None:
+        yield
+        return
+    token = _resolved_contexts.set({})
+    try:
+        yield
+    finally:
+        _resolved_contexts.reset(token)
 
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
@@ -182,6 +215,48 @@ class IndexablesSummarySerializer(serializers.HyperlinkedModelSerializer):
         ]
 
 
+def hits_queryset(queryset, search_query):
+    """
+    Annotate a queryset of Indexables with rank, and with snippets, for a search query and
+    filter it to just those Indexables that are a hit.
+    """
+    # Rank must be greater than 0 (i.e. this is some kind of hit)
+    filter_kwargs = {"rank__gt": 0.0}
+    return queryset.annotate(
+        rank=SearchRank(F("search_vector"), search_query, cover_density=True),
+        snippet=Concat(
+            Value("'"),
+            SearchHeadline(
+                "original_content",
+                search_query,
+                max_words=50,
+                min_words=25,
+                max_fragments=3,
+            ),
+            output_field=CharField(),
+        ),
+        fullsnip=SearchHeadline(
+            "indexable",
+            search_query,
+            start_sel="<start_sel>",
+            stop_sel="<end_sel>",
+            highlight_all=True,
+        ),
+    ).filter(search_vector=search_query, **filter_kwargs)
+
+
+class IIIFSearchSummaryListSerializer(serializers.ListSerializer):
+    """
+    List serializer for search results that fetches the hits for the page of results
+    in one query, rather than one query per result.
+    """
+
+    def to_representation(self, data):
+        iterable = list(data.all() if isinstance(data, models.Manager) else data)
+        self.child.prefetch_hits(iterable)
+        return super().to_representation(iterable)
+
+
 class IIIFSearchSummarySerializer(serializers.HyperlinkedModelSerializer):
     """
     Serializer that produces the summarized search results.
@@ -202,48 +277,16 @@ class IIIFSearchSummarySerializer(serializers.HyperlinkedModelSerializer):
 
     def get_sortk(self, iiif):
         """
-        Generate a sort key to associate with the object.
+        The sort key associated with the object, annotated by IIIFSearchFilter.
         """
+        if hasattr(iiif, "sortk"):
+            return iiif.sortk
         order_key = None
         if self.context.get("request"):
             order_key = self.context["request"].data.get("sort_order", None)
         if not order_key:
             return self.get_rank(iiif=iiif)
-        logger.debug(f"Order key {order_key}")
-        if isinstance(order_key, dict) and order_key.get("type") and order_key.get("subtype"):
-            val = order_key.get("value_for_sort", "indexable")
-            sort_qs = (
-                Indexables.objects.filter(
-                    iiif=iiif,
-                    type__iexact=order_key.get("type"),
-                    subtype__iexact=order_key.get("subtype"),
-                )
-                .values(val)
-                .first()
-            )
-            if sort_qs:
-                sort_keys = list(sort_qs.values())[0]
-                return sort_keys
-        else:
-            logger.debug("We have no type or subtype on order key")
-        return self.get_sort_default(order_key=order_key)
-
-    @staticmethod
-    def get_sort_default(order_key):
-        if value_for_sort := order_key.get("value_for_sort"):
-            if value_for_sort.startswith("indexable_int"):
-                return 0
-            elif value_for_sort.startswith("indexable_float"):
-                return 0.0
-            elif value_for_sort.startswith("indexable_date"):
-                return datetime.min.replace(tzinfo=utc)
-            else:
-                return ""
-
-        if order_key.get("type") and order_key.get("subtype"):
-            return ""
-
-        return 0.0
+        return get_sort_default(order_key=order_key)
 
     def get_rank(self, iiif):
         """
@@ -252,7 +295,7 @@ class IIIFSearchSummarySerializer(serializers.HyperlinkedModelSerializer):
         """
         try:
             return max([h["rank"] for h in self.get_hits(iiif=iiif)])
-        except TypeError or ValueError:
+        except (TypeError, ValueError):
             return 1.0
 
     def get_has_matching_parts(self, iiif):
@@ -279,68 +322,61 @@ class IIIFSearchSummarySerializer(serializers.HyperlinkedModelSerializer):
                 if qs:
                     return qs
 
-    def get_hits(self, iiif):
+    def get_search_query(self):
         """
-        Serializer method that calculates the hits to return along with this search
-        result
+        Return the SearchQuery used to generate hits, either from the parsed request data
+        or, for a simple GET request, constructed from the query params.
         """
-        # Rank must be greater than 0 (i.e. this is some kind of hit)
-        filter_kwargs = {"rank__gt": 0.0}
-        # Filter the indexables to query against to just those associated with this IIIF resource
-        qs = Indexables.objects.filter(iiif=iiif)
-        search_query = None
-        if self.context.get("request"):
-            if self.context["request"].data.get("hits_filter_kwargs"):
-                # We have a dictionary of queries to use, so we use that
-                search_query = (
-                    self.context["request"].data["hits_filter_kwargs"].get("search_vector", None)
-                )
-            else:
-                # Otherwise, this is probably a simple GET request, so we construct the queries from params
-                search_string = self.context["request"].query_params.get("fulltext", None)
-                language = self.context["request"].query_params.get("search_language", None)
-                search_type = self.context["request"].query_params.get("search_type", "websearch")
-                if search_string:
-                    if language:
-                        search_query = SearchQuery(
-                            search_string, config=language, search_type=search_type
-                        )
-                    else:
-                        search_query = SearchQuery(search_string, search_type=search_type)
-                else:
-                    search_query = None
-        if search_query:
-            # Annotate the results in the queryset with rank, and with a snippet
-            qs = (
-                qs.annotate(
-                    rank=SearchRank(F("search_vector"), search_query, cover_density=True),
-                    snippet=Concat(
-                        Value("'"),
-                        SearchHeadline(
-                            "original_content",
-                            search_query,
-                            max_words=50,
-                            min_words=25,
-                            max_fragments=3,
-                        ),
-                        output_field=CharField(),
-                    ),
-                    fullsnip=SearchHeadline(
-                        "indexable",
-                        search_query,
-                        start_sel="<start_sel>",
-                        stop_sel="<end_sel>",
-                        highlight_all=True,
-                    ),
-                )
-                .filter(search_vector=search_query, **filter_kwargs)
-                .order_by("-rank")
-            )
-        else:
+        if not self.context.get("request"):
+            return
+        if self.context["request"].data.get("hits_filter_kwargs"):
+            # We have a dictionary of queries to use, so we use that
+            return self.context["request"].data["hits_filter_kwargs"].get("search_vector", None)
+        # Otherwise, this is probably a simple GET request, so we construct the queries from params
+        search_string = self.context["request"].query_params.get("fulltext", None)
+        language = self.context["request"].query_params.get("search_language", None)
+        search_type = self.context["request"].query_params.get("search_type", "websearch")
+        if search_string:
+            if language:
+                return SearchQuery(search_string, config=language, search_type=search_type)
+            return SearchQuery(search_string, search_type=search_type)
+        return
+
+    @instrument("hits")
+    def prefetch_hits(self, iiif_resources):
+        """
+        Fetch the hits for a list (e.g. a page) of IIIF resources in a single query, and
+        cache them, grouped by IIIF resource, for use by get_hits and get_rank.
+        """
+        if not hasattr(self, "_hits_cache"):
+            self._hits_cache = {}
+        search_query = self.get_search_query()
+        pks = [iiif.pk for iiif in iiif_resources if iiif.pk not in self._hits_cache]
+        if not pks:
+            return
+        if not search_query:
+            self._hits_cache.update({pk: None for pk in pks})
             return
-        # Use the Indexables summary serializer to return the hit list
-        serializer = IndexablesSummarySerializer(instance=qs, many=True)
-        return serializer.data
+        grouped_hits = defaultdict(list)
+        for hit in hits_queryset(
+            Indexables.objects.filter(iiif__in=pks), search_query=search_query
+        ).order_by("iiif_id", "-rank"):
+            grouped_hits[hit.iiif_id].append(hit)
+        for pk in pks:
+            # Use the Indexables summary serializer to return the hit list
+            self._hits_cache[pk] = IndexablesSummarySerializer(
+                instance=grouped_hits.get(pk, []), many=True
+            ).data
+
+    def get_hits(self, iiif):
+        """
+        Serializer method that returns the hits to return along with this search
+        result. Hits are fetched for the whole page by the list serializer, this will
+        only query for an individual resource if it is being serialized on its own.
+        """
+        if iiif.pk not in getattr(self, "_hits_cache", {}):
+            self.prefetch_hits([iiif])
+        return self._hits_cache[iiif.pk]
 
     def get_metadata(self, iiif):
         """If the context has had the `metadata_fields` property set
@@ -390,6 +426,43 @@ class IIIFSearchSummarySerializer(serializers.HyperlinkedModelSerializer):
             "requiredStatement",
         ]
         extra_kwargs = {"url": {"view_name": "search.api.iiifresource_detail"}}
+        list_serializer_class = IIIFSearchSummaryListSerializer
+
+
+class IngestJobSerializer(serializers.HyperlinkedModelSerializer):
+    """
+    Serializer for the status of an (asynchronous) IIIF ingest job.
+    """
+
+    madoc_id = MadocIDSiteURNField(read_only=True)
+    resource = serializers.SerializerMethodField()
+
+    def get_resource(self, job):
+        """
+        Link to the IIIF resource once the job is complete.
+        """
+        if job.status == IngestJob.COMPLETE:
+            return reverse(
+                "search.api.iiifresource_detail",
+                kwargs={"pk": job.madoc_id.split("|")[-1]},
+                request=self.context.get("request"),
+            )
+
+    class Meta:
+        model = IngestJob
+        fields = [
+            "url",
+            "id",
+            "action",
+            "madoc_id",
+            "status",
+            "errors",
+            "created",
+            "started",
+            "finished",
+            "resource",
+        ]
+        extra_kwargs = {"url": {"view_name": "search.api.ingestjob_detail"}}
 
 
 class AutocompleteSerializer(serializers.ModelSerializer):
@@ -448,6 +521,49 @@ class IndexablesSerializer(serializers.HyperlinkedModelSerializer):
             Indexables.objects.filter(resource_id=resource_id, content_id=content_id).delete()
         return super(IndexablesSerializer, self).create(validated_data)
 
+    def update(self, instance, validated_data):
+        # The indexable no longer matches the one that was ingested, so the next ingest of its
+        # IIIF resource replaces it (see sync_indexables)
+        validated_data["content_hash"] = None
+        return super().update(instance, validated_data)
+
+
+class CaptureModelListSerializer(serializers.ListSerializer):
+    """
+    List serializer for capture model/OCR Indexables that resolves the IIIF resources for all
+    of the Indexables in one query, replaces the existing Indexables for each (resource_id,
+    content_id) with one DELETE, and writes the new Indexables in a single bulk INSERT (the
+    search_vector is computed by the database).
+    """
+
+    @instrument("ingest")
+    def create(self, validated_data):
+        # Associate each Indexable with the relevant IIIF resource via the Madoc identifier
+        resource_ids = {item.get("resource_id") for item in validated_data}
+        iiif_resources = IIIFResource.objects.in_bulk(resource_ids)
+        if missing := resource_ids - iiif_resources.keys():
+            raise serializers.ValidationError(
+                {"resource_id": [f"No IIIF resource with id {r}" for r in sorted(missing, key=str)]}
+            )
+        replaced_content_ids = defaultdict(set)
+        for item in validated_data:
+            if item.get("resource_id") and item.get("content_id"):
+                replaced_content_ids[item["resource_id"]].add(item["content_id"])
+        if replaced_content_ids:
+            logger.debug(f"Deleting any indexables for content ids {dict(replaced_content_ids)}")
+            Indexables.objects.filter(
+                reduce(
+                    or_,
+                    (
+                        models.Q(resource_id=resource_id, content_id__in=content_ids)
+                        for resource_id, content_ids in replaced_content_ids.items()
+                    ),
+                )
+            ).delete()
+        return Indexables.objects.bulk_create(
+            [Indexables(**item, iiif=iiif_resources[item.get("resource_id")]) for item in validated_data]
+        )
+
 
 class CaptureModelSerializer(serializers.HyperlinkedModelSerializer):
     """
@@ -480,7 +596,9 @@ class CaptureModelSerializer(serializers.HyperlinkedModelSerializer):
             "iiif",
         ]
         extra_kwargs = {"url": {"view_name": "search.api.indexables_detail"}}
+        list_serializer_class = CaptureModelListSerializer
 
+    @instrument("ingest")
     def create(self, validated_data):
         # On create, associate the resource with the relevant IIIF resource
         # via the Madoc identifier for that object
@@ -504,38 +622,102 @@ def contexts_create_update(instance, local_contexts):
     :return:
     """
     if local_contexts:
-        c_objs = [Context.objects.get_or_create(**context) for context in local_contexts]
-        c_objs_set = [c_obj for c_obj, _ in c_objs]
-        instance.contexts.set(c_objs_set)
-        instance.save()
+        instance.contexts.set(list(get_or_create_contexts(local_contexts).values()))
+
+
+def indexable_content_hash(indexable):
+    """
+    A stable hash of a flattened indexable (a dict of Indexables fields).
+    """
+    return hashlib.md5(
+        json.dumps(indexable, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def sync_indexables(resource_indexables):
+    """
+    Replace the indexables derived from IIIF resources (i.e. those without a content_id, so not
+    capture model or OCR content) with new lists of flattened indexables, by diffing them on
+    their content hashes, so that re-ingesting an unchanged IIIF resource doesn't write anything.
+
+    Unchanged indexables at the start of each type and subtype are left alone, and the rest are
+    deleted and inserted, so the first (lowest id) indexable of each type and subtype, which is
+    used for the sort keys, is still the first in the IIIF resource.
+
+    :param resource_indexables: list of (IIIF resource instance, list of flattened indexables)
+    :return: (number of indexables deleted, number of indexables inserted)
+    """
+    instances = {instance.madoc_id: instance for instance, _ in resource_indexables}
+    new_indexables = defaultdict(list)
+    for instance, indexable_list in resource_indexables:
+        for _indexable in indexable_list or []:
+            key = (instance.madoc_id, _indexable["type"].lower(), _indexable["subtype"].lower())
+            new_indexables[key].append((indexable_content_hash(_indexable), _indexable))
+    existing_indexables = defaultdict(list)
+    for pk, iiif_id, _type, subtype, content_hash in (
+        Indexables.objects.filter(iiif__in=list(instances), content_id__isnull=True)
+        .order_by("pk")
+        .values_list("pk", "iiif_id", "type", "subtype", "content_hash")
+    ):
+        existing_indexables[(iiif_id, _type.lower(), subtype.lower())].append((pk, content_hash))
+    deleted, created = [], []
+    for key in [*new_indexables, *(k for k in existing_indexables if k not in new_indexables)]:
+        existing, new = existing_indexables.get(key, []), new_indexables.get(key, [])
+        unchanged = 0
+        while (
+            unchanged < min(len(existing), len(new))
+            and existing[unchanged][1] == new[unchanged][0]
+        ):
+            unchanged += 1
+        deleted += [pk for pk, _ in existing[unchanged:]]
+        created += [
+            Indexables(
+                **_indexable, content_hash=content_hash, iiif=instances[key[0]], resource_id=key[0]
+            )
+            for content_hash, _indexable in new[unchanged:]
+        ]
+    if deleted:
+        Indexables.objects.filter(pk__in=deleted).delete()
+    if created:
+        Indexables.objects.bulk_create(created)
+    return len(deleted), len(created)
 
 
 def indexables_create_update(iiif3_resource, instance, delete_existing_indexables=True):
     """
-    N.B. we should probably be deleting the existing indexables to avoid issues where orphaned indexables
-    are left hanging around. Parameter defaults to True.
+    N.B. we should probably be replacing the existing indexables to avoid issues where orphaned
+    indexables are left hanging around. Parameter defaults to True.
 
-    Function to create the indexables for a IIIF resource
+    Function to create the indexables for a IIIF resource. The existing indexables derived from
+    the IIIF resource are diffed with the new ones (see sync_indexables), so only those that have
+    changed are deleted or inserted, and capture model and OCR indexables are left alone.
 
     :param iiif3_resource: IIIF Presentation API 3 resource
     :param instance: IIIF Resource model instance
-    :param delete_existing_indexables: clean up the old indexables.
+    :param delete_existing_indexables: replace the old indexables.
     :return:
     """
     if iiif3_resource:
         # Flatten the IIIF metadata and descriptive properties into a list of indexables
         indexable_list = flatten_iiif_descriptive(
-            iiif=iiif3_resource, default_language=default_lang, lang_base=LANGBASE
+            iiif=iiif3_resource, default_language=default_lang
         )
         if delete_existing_indexables:
-            instance.indexables.all().delete()
-        if indexable_list:
+            deleted, created = sync_indexables([(instance, indexable_list)])
+            logger.debug(f"Deleted {deleted} and created {created} indexables for {instance.madoc_id}")
+        elif indexable_list:
             # Create the indexables
-            for _indexable in indexable_list:
-                indexable_obj = Indexables(
-                    **_indexable, iiif=instance, resource_id=instance.madoc_id
-                )
-                indexable_obj.save()
+            Indexables.objects.bulk_create(
+                [
+                    Indexables(
+                        **_indexable,
+                        content_hash=indexable_content_hash(_indexable),
+                        iiif=instance,
+                        resource_id=instance.madoc_id,
+                    )
+                    for _indexable in indexable_list
+                ]
+            )
 
 
 def children_create_update(instance, iiif3_resource, validated_data, local_contexts):
@@ -579,6 +761,7 @@ def children_create_update(instance, iiif3_resource, validated_data, local_conte
                     manifest=validated_data.get("manifest"),
                     cascade=validated_data.get("cascade"),
                     cascade_canvases=validated_data.get("cascade_canvases"),
+                    skip_unchanged=validated_data.get("skip_unchanged", False),
                     id=item.get("id"),
                 )
                 # Catch cases where the Range or Canvas already exists, e.g. if a Manifest has been
@@ -603,6 +786,308 @@ def children_create_update(instance, iiif3_resource, validated_data, local_conte
                     logger.error(nested.errors)
 
 
+def unique_slugs(model, values, slug_field="slug"):
+    """
+    Generate unique slugs for the AutoSlugField on a model for a list of values (e.g. for a
+    bulk_create), checking for clashes with existing slugs in at most two queries.
+
+    Slugs that clash (with each other or with existing objects) are given the next free suffix
+    ("-2", "-3", ...), as the AutoSlugField would, as bulk_create would otherwise check each
+    clashing slug against the existing objects only, and give the values the same slug.
+
+    :param model: model class with the AutoSlugField
+    :param values: list of the values that the slugs are populated from
+    :param slug_field: name of the AutoSlugField
+    :return: dict of value to slug
+    """
+    max_length = model._meta.get_field(slug_field).max_length
+    slugs = {value: slugify(value)[:max_length].strip("-") for value in values}
+    slug_counts = Counter(slugs.values())
+    taken = set(
+        model.objects.filter(**{f"{slug_field}__in": list(slug_counts)}).values_list(
+            slug_field, flat=True
+        )
+    )
+    if clashing := [slug for slug, n in slug_counts.items() if n > 1 or slug in taken]:
+        # The suffixed slugs (truncated to fit) all start with these prefixes
+        prefixes = [
+            models.Q(**{f"{slug_field}__startswith": slug[: max_length - 8].rstrip("-") or "-"})
+            for slug in clashing
+        ]
+        taken.update(model.objects.filter(reduce(or_, prefixes)).values_list(slug_field, flat=True))
+
+    def candidates(slug):
+        yield slug
+        for i in itertools.count(2):
+            suffix = f"-{i}"
+            yield slug[: max_length - len(suffix)].rstrip("-") + suffix
+
+    unique = {}
+    for value, slug in slugs.items():
+        unique[value] = next(
+            candidate for candidate in candidates(slug) if candidate and candidate not in taken
+        )
+        taken.add(unique[value])
+    return unique
+
+
+def get_or_create_contexts(context_dicts):
+    """
+    Get or create the Context objects for a list of context dicts, using one query to get any
+    existing contexts, and one bulk insert to create any missing contexts. Contexts that have
+    already been resolved in a resolved_contexts block aren't looked up again.
+
+    :param context_dicts: list of context object dicts
+    :return: dict of context id to Context object
+    """
+    unique_contexts = {}
+    for context in context_dicts:
+        unique_contexts.setdefault(context["id"], context)
+    memo = _resolved_contexts.get()
+    if memo is None:
+        memo = {}
+    c_objs = {c_id: memo[c_id] for c_id in unique_contexts if c_id in memo}
+    if unresolved := [c_id for c_id in unique_contexts if c_id not in c_objs]:
+        c_objs.update(Context.objects.in_bulk(unresolved))
+    if missing := [c_id for c_id in unique_contexts if c_id not in c_objs]:
+        slugs = unique_slugs(Context, missing)
+        Context.objects.bulk_create(
+            [Context(**unique_contexts[c_id], slug=slugs[c_id]) for c_id in missing],
+            ignore_conflicts=True,
+        )
+        c_objs.update(Context.objects.in_bulk(missing))
+    memo.update(c_objs)
+    return c_objs
+
+
+def iter_cascade_children(instance_madoc_id, instance_type, iiif3_resource, validated_data):
+    """
+    Generator that yields the child_dict for each child IIIF Resource (Canvas or Range) that
+    children_create_update would ingest for a resource, along with the madoc_id of its parent.
+    Children of Ranges are yielded (recursively) after the Range itself.
+    """
+    subitems = []
+    if iiif3_resource.get("items"):
+        subitems += iiif3_resource["items"]
+    if iiif3_resource.get("structures"):
+        subitems += iiif3_resource["structures"]
+    if subitems:
+        # Chain any lists, because ranges sometimes contain lists of ranges, rather than just ranges
+        # or contain lists of lists of lists, etc.
+        if any([isinstance(s, list) for s in subitems]):
+            iterable_subitems = itertools.chain.from_iterable(subitems)
+        else:
+            iterable_subitems = subitems
+        for num, item in enumerate(iterable_subitems):
+            if (
+                item.get("type") == "Canvas"
+                and instance_type == "Manifest"
+                and validated_data.get("cascade_canvases")
+            ) or (item.get("type") == "Range" and validated_data.get("cascade")):
+                child_dict = dict(
+                    iiif3_resource=item,
+                    madoc_id=":".join([instance_madoc_id, item["type"].lower(), str(num)]),
+                    madoc_thumbnail=None,
+                    manifest=validated_data.get("manifest"),
+                    id=item.get("id"),
+                )
+                yield child_dict, instance_madoc_id
+                yield from iter_cascade_children(
+                    instance_madoc_id=child_dict["madoc_id"],
+                    instance_type=item["type"],
+                    iiif3_resource=item,
+                    validated_data=validated_data,
+                )
+
+
+def children_bulk_create_update(instance, iiif3_resource, validated_data, local_contexts):
+    """
+    Bulk version of children_create_update, for Manifests with many Canvases and/or Ranges.
+
+    Rather than running a lookup and a nested IIIFCreateUpdateSerializer save for each child, this:
+
+    * fetches the info.json for the children's thumbnails concurrently (with THUMBNAIL_FALLBACK)
+    * diffs the madoc_ids of the children against the database in one query
+    * bulk creates the new children, and bulk updates the existing children
+    * diffs the indexables for all of the children with the existing indexables, with one
+      query, one delete and one bulk insert (see sync_indexables)
+    * gets or creates all of the children's contexts in bulk, and attaches them to the children
+      with a single insert into the contexts through table
+
+    The contexts for each child are those of its parent, plus the child itself, and its parent.
+    Contexts are only ever added to existing children, never removed.
+
+    :param instance: IIIF Resource instance
+    :param iiif3_resource: iiif3 presentation API resource (as a dict/object)
+    :param validated_data: validated data from the request/serializer
+    :param local_contexts: list of context objects from the parent
+    :return:
+    """
+    cascade_children = list(
+        iter_cascade_children(
+            instance_madoc_id=instance.madoc_id,
+            instance_type=instance.type,
+            iiif3_resource=iiif3_resource,
+            validated_data=validated_data,
+        )
+    )
+    if settings.THUMBNAIL_FALLBACK:
+        # Fetch the info.json for all of the children's thumbnails concurrently, up front.
+        prefetch_thumbnail_info_json(
+            [
+                (
+                    child_dict["iiif3_resource"],
+                    get_first_canvas(child_dict["iiif3_resource"], child_dict.get("manifest")),
+                )
+                for child_dict, _ in cascade_children
+                if child_dict.get("iiif3_resource")
+            ]
+        )
+    children = {}
+    children_digests = {}
+    children_contexts = {instance.madoc_id: local_contexts}
+    for child_dict, parent_madoc_id in cascade_children:
+        if parent_madoc_id not in children_contexts:
+            # The parent of this item failed, so skip it
+            continue
+        if not child_dict.get("id"):
+            logger.error(f"Failed nested item ID was: {child_dict.get('madoc_id')}")
+            logger.error("Nested item has no id")
+            continue
+        local_dict, child_iiif3_resource, child_contexts = build_iiif_resource_data(
+            validated_data=child_dict, contexts=children_contexts[parent_madoc_id]
+        )
+        child_type = local_dict.get("type")
+        if parent_madoc_id == instance.madoc_id:
+            parent_id, parent_type = instance.id, instance.type
+        else:
+            parent_id, parent_type = children[parent_madoc_id][0]["id"], "Range"
+        child_contexts += [
+            {"id": child_dict["madoc_id"], "type": child_type},
+            {"id": local_dict["id"], "type": child_type},
+            {"id": parent_id, "type": parent_type},
+            {"id": parent_madoc_id, "type": parent_type},
+        ]
+        children_contexts[child_dict["madoc_id"]] = child_contexts
+        children[child_dict["madoc_id"]] = (local_dict, child_iiif3_resource)
+        children_digests[child_dict["madoc_id"]] = ingest_digest(
+            {
+                **child_dict,
+                "cascade": validated_data.get("cascade"),
+                "cascade_canvases": validated_data.get("cascade_canvases"),
+            },
+            contexts=children_contexts[parent_madoc_id],
+        )
+    if not children:
+        return
+    # Catch cases where the Range or Canvas already exists, e.g. if a Manifest has been
+    # added and then deleted at some point, or this is an update.
+    existing_children = IIIFResource.objects.in_bulk(list(children))
+    slugs = unique_slugs(
+        IIIFResource, [madoc_id for madoc_id in children if madoc_id not in existing_children]
+    )
+    created, updated, update_fields = [], [], {"modified"}
+    now = timezone.now()
+    for madoc_id, (local_dict, _) in children.items():
+        if (child := existing_children.get(madoc_id)) is not None:
+            logger.debug(f"Nested item {madoc_id} already exists")
+            if validated_data.get("skip_unchanged") and (
+                child.ingest_digest == children_digests[madoc_id]
+            ):
+                logger.debug(f"Nested item {madoc_id} is unchanged")
+                continue
+            for k, v in local_dict.items():
+                setattr(child, k, v)
+            child.modified = now
+            update_fields.update(local_dict)
+        else:
+            child = IIIFResource(**local_dict, slug=slugs[madoc_id])
+        try:
+            child.clean_fields(exclude=["slug"])
+        except DjangoValidationError as e:
+            logger.error(f"Failed nested item ID was: {madoc_id}")
+            logger.error(e.message_dict)
+            continue
+        if madoc_id in existing_children:
+            updated.append(child)
+        else:
+            created.append(child)
+    update_fields.discard("madoc_id")
+    if created:
+        IIIFResource.objects.bulk_create(created)
+    if updated:
+        IIIFResource.objects.bulk_update(updated, fields=sorted(update_fields))
+    saved = {child.madoc_id: child for child in created + updated}
+    logger.debug(f"Created {len(created)} and updated {len(updated)} nested items")
+    # Create the indexed data for search
+    sync_indexables(
+        [
+            (
+                child,
+                flatten_iiif_descriptive(
+                    iiif=children[madoc_id][1], default_language=default_lang
+                ),
+            )
+            for madoc_id, child in saved.items()
+        ]
+    )
+    # Create the contexts, and add them to the children
+    c_objs = get_or_create_contexts(
+        [context for madoc_id in saved for context in children_contexts[madoc_id]]
+    )
+    through_model = IIIFResource.contexts.through
+    through_model.objects.bulk_create(
+        [
+            through_model(iiifresource_id=madoc_id, context_id=c_id)
+            for madoc_id in saved
+            for c_id in {context["id"] for context in children_contexts[madoc_id]}
+            if c_id in c_objs
+        ],
+        ignore_conflicts=True,
+    )
+    # Record the digests once the children have been ingested
+    for madoc_id, child in saved.items():
+        child.ingest_digest = children_digests[madoc_id]
+    IIIFResource.objects.bulk_update(list(saved.values()), fields=["ingest_digest"])
+
+
+# Bump this when a change to the ingest (e.g. to the indexables from flatten_iiif_descriptive)
+# means that IIIF resources that haven't changed since their last ingest should be re-ingested
+# anyway, as re-ingests with skip_unchanged are skipped while the digest matches
+INGEST_DIGEST_VERSION = 1
+
+
+def ingest_digest(validated_data, contexts=None):
+    """
+    Digest of the normalised ingest data for a IIIF resource, i.e. the IIIF 3 resource, the Madoc
+    thumbnail, the cascade flags and the (de-duplicated and sorted) contexts, which is stored on
+    the IIIF resource so that re-ingests of unchanged resources can be skipped.
+
+    :param validated_data: validated data from the request/serializer
+    :param contexts: list of context objects
+    :return: hex digest
+    """
+    normalised = {
+        "version": INGEST_DIGEST_VERSION,
+        "iiif3_resource": validated_data.get("iiif3_resource"),
+        "madoc_thumbnail": validated_data.get("madoc_thumbnail"),
+        "cascade": bool(validated_data.get("cascade")),
+        "cascade_canvases": bool(validated_data.get("cascade_canvases")),
+        "contexts": sorted({(c.get("id"), c.get("type")) for c in contexts or []}, key=str),
+    }
+    return hashlib.sha256(
+        json.dumps(normalised, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def save_ingest_digest(instance, digest):
+    """
+    Record the ingest digest on a IIIF resource, without re-saving the rest of the resource.
+    """
+    IIIFResource.objects.filter(pk=instance.pk).update(ingest_digest=digest)
+    instance.ingest_digest = digest
+
+
 def build_iiif_resource_data(validated_data, contexts=None):
     """
     Function to parse the incoming data and return:
@@ -665,6 +1150,8 @@ def build_iiif_resource_data(validated_data, contexts=None):
 class IIIFCreateUpdateSerializer(serializers.Serializer):
     cascade = serializers.BooleanField(default=False)
     cascade_canvases = serializers.BooleanField(default=False)
+    bulk_cascade = serializers.BooleanField(default=False)
+    skip_unchanged = serializers.BooleanField(default=False)
     resource_contexts = serializers.ListField(allow_empty=True, allow_null=True)
     iiif3_resource = serializers.JSONField()
     manifest = serializers.JSONField(allow_null=True)
@@ -673,6 +1160,8 @@ class IIIFCreateUpdateSerializer(serializers.Serializer):
     madoc_thumbnail = serializers.URLField(allow_null=True, allow_blank=True)
     child = serializers.BooleanField(default=False)
     parent = serializers.CharField(allow_null=True, allow_blank=True)
+    # Set when an update is skipped with skip_unchanged, so that nothing has been written
+    unchanged = False
 
     def to_representation(self, instance):
         """
@@ -684,6 +1173,8 @@ class IIIFCreateUpdateSerializer(serializers.Serializer):
         """
         return IIIFSerializer(instance, context={"request": self.context["request"]}).data
 
+    @instrument("ingest")
+    @resolved_contexts()
     def create(self, validated_data):
         instance = None
         # if madoc_site_urn := request_madoc_site_urn(self.context["request"]):
@@ -731,15 +1222,29 @@ class IIIFCreateUpdateSerializer(serializers.Serializer):
             indexables_create_update(instance=instance, iiif3_resource=iiif3_resource)
         # Create or update any child IIIF resources
         if local_contexts and iiif3_resource:
-            children_create_update(
+            if validated_data.get("bulk_cascade"):
+                children_func = children_bulk_create_update
+            else:
+                children_func = children_create_update
+            children_func(
                 instance=instance,
                 iiif3_resource=iiif3_resource,
                 validated_data=validated_data,
                 local_contexts=local_contexts,
             )
+        save_ingest_digest(
+            instance, ingest_digest(validated_data, contexts=validated_data.get("resource_contexts"))
+        )
         return instance
 
+    @instrument("ingest")
+    @resolved_contexts()
     def update(self, instance, validated_data):
+        digest = ingest_digest(validated_data, contexts=validated_data.get("resource_contexts"))
+        if validated_data.get("skip_unchanged") and instance.ingest_digest == digest:
+            logger.debug(f"{instance.madoc_id} is unchanged since it was last ingested")
+            self.unchanged = True
+            return instance
         existing_contexts = [{"id": c.id, "type": c.type} for c in instance.contexts.all()]
         # Add any contexts on the incoming request to the list if there are any
         if (updated_contexts := validated_data.get("contexts")) is not None:
@@ -760,12 +1265,17 @@ class IIIFCreateUpdateSerializer(serializers.Serializer):
             contexts_create_update(instance=instance, local_contexts=local_contexts)
         # Create/update any child IIIF resources, e.g. Ranges or Canvases for a Manifest
         if local_contexts and iiif3_resource:
-            children_create_update(
+            if validated_data.get("bulk_cascade"):
+                children_func = children_bulk_create_update
+            else:
+                children_func = children_create_update
+            children_func(
                 instance=instance,
                 iiif3_resource=iiif3_resource,
                 validated_data=validated_data,
                 local_contexts=local_contexts,
             )
+        save_ingest_digest(instance, digest)
         # If 'prefetch_related' has been applied to a queryset, we need to
         # forcibly invalidate the prefetch cache on the instance.
         if getattr(instance, "_prefetched_objects_cache", None):
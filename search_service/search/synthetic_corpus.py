@@ -0,0 +1,312 @@
+"""
+Synthetic IIIF resources, OCR and capture models for benchmarking, generated deterministically
+from a seeded random.Random.
+
+The metadata values include the terms used by the manual test queries (manualtests/queries.py),
+in Latin, Chinese and Korean scripts, so that those queries have results.
+"""
+import random
+
+WORDS = [
+    "abbey", "archive", "bible", "chronicle", "codex", "diary", "estate", "folio", "gospel",
+    "herbal", "hymnal", "index", "journal", "ledger", "letter", "map", "missal", "notebook",
+    "psalter", "register", "sermon", "survey", "treatise", "will",
+]
+AUTHORS = [
+    "Aldus Manutius", "Anna Bijns", "Christine de Pizan", "Hildegard von Bingen", "Johann Mentelin",
+    "Mary Astell", "洪淳", "전심쳥젼", "Choe Namseon", "Philipp Franz von Siebold",
+]
+PLACES = ["Berlin", "Leipzig", "Seoul", "京城 [서울]", "Tokyo", "Paris", "Edinburgh", "Mainz"]
+PUBLISHERS = [
+    "京城書籍業組合", "Bundesregierung", "Ostasiatica Berlin", "Reimer", "Brockhaus", "Hanseong Jubo",
+]
+SUBJECTS = ["Coreanica", "Ostasiatica", "Geography", "History", "Literature", "Religion", "Science"]
+LANGUAGES = ["German", "Korean", "Chinese", "Japanese", "English", "French"]
+
+CONTEXT_V2 = "http://iiif.io/api/presentation/2/context.json"
+CONTEXT_V3 = "http://iiif.io/api/presentation/3/context.json"
+BASE_URL = "https://example.org/iiif"
+
+
+def text(rng, words=WORDS, n=10):
+    return " ".join(rng.choice(words) for _ in range(n))
+
+
+def manifest_metadata(rng):
+    """
+    Metadata (label, value) pairs for a manifest.
+    """
+    return [
+        ("Title", f"{rng.choice(WORDS).title()} {text(rng, n=3)}"),
+        ("Author", rng.choice(AUTHORS)),
+        ("Date of publication", str(rng.randint(1450, 1950))),
+        ("Place of publication", rng.choice(PLACES)),
+        ("Publisher", rng.choice(PUBLISHERS)),
+        ("Subject", rng.choice(SUBJECTS)),
+        ("Language", rng.choice(LANGUAGES)),
+    ]
+
+
+def image_url(n, page):
+    return f"{BASE_URL}/{n}/image/{page}"
+
+
+def manifest_v3(n, rng, canvases=5):
+    """
+    A IIIF Presentation 3 Manifest, with metadata, a summary, a navDate and image canvases.
+    """
+    manifest_id = f"{BASE_URL}/{n}/manifest"
+    metadata = manifest_metadata(rng)
+    return {
+        "@context": CONTEXT_V3,
+        "id": manifest_id,
+        "type": "Manifest",
+        "label": {"none": [metadata[0][1]]},
+        "summary": {"en": [text(rng, n=30)]},
+        "metadata": [
+            {"label": {"en": [label]}, "value": {"none": [value]}} for label, value in metadata
+        ],
+        "navDate": f"{metadata[2][1]}-01-01T00:00:00Z",
+        "thumbnail": [{"id": f"{image_url(n, 1)}/full/200,/0/default.jpg", "type": "Image"}],
+        "items": [
+            {
+                "id": f"{manifest_id}/canvas/{page}",
+                "type": "Canvas",
+                "label": {"none": [f"p. {page}"]},
+                "height": 1000,
+                "width": 800,
+                "items": [
+                    {
+                        "id": f"{manifest_id}/canvas/{page}/page",
+                        "type": "AnnotationPage",
+                        "items": [
+                            {
+                                "id": f"{manifest_id}/canvas/{page}/page/image",
+                                "type": "Annotation",
+                                "motivation": "painting",
+                                "target": f"{manifest_id}/canvas/{page}",
+                                "body": {
+                                    "id": f"{image_url(n, page)}/full/max/0/default.jpg",
+                                    "type": "Image",
+                                    "format": "image/jpeg",
+                                    "service": [
+                                        {
+                                            "id": image_url(n, page),
+                                            "type": "ImageService2",
+                                            "profile": "level1",
+                                        }
+                                    ],
+                                },
+                            }
+                        ],
+                    }
+                ],
+            }
+            for page in range(1, canvases + 1)
+        ],
+    }
+
+
+def manifest_v2(n, rng, canvases=5):
+    """
+    A IIIF Presentation 2 Manifest, with metadata, a description, a navDate and image canvases.
+    """
+    manifest_id = f"{BASE_URL}/{n}/manifest"
+    metadata = manifest_metadata(rng)
+    return {
+        "@context": CONTEXT_V2,
+        "@id": manifest_id,
+        "@type": "sc:Manifest",
+        "label": metadata[0][1],
+        "description": text(rng, n=30),
+        "metadata": [{"label": label, "value": value} for label, value in metadata],
+        "navDate": f"{metadata[2][1]}-01-01T00:00:00Z",
+        "thumbnail": {"@id": f"{image_url(n, 1)}/full/200,/0/default.jpg"},
+        "sequences": [
+            {
+                "@id": f"{manifest_id}/sequence/1",
+                "@type": "sc:Sequence",
+                "canvases": [
+                    {
+                        "@id": f"{manifest_id}/canvas/{page}",
+                        "@type": "sc:Canvas",
+                        "label": f"p. {page}",
+                        "height": 1000,
+                        "width": 800,
+                        "images": [
+                            {
+                                "@type": "oa:Annotation",
+                                "motivation": "sc:painting",
+                                "on": f"{manifest_id}/canvas/{page}",
+                                "resource": {
+                                    "@id": f"{image_url(n, page)}/full/full/0/default.jpg",
+                                    "@type": "dctypes:Image",
+                                    "format": "image/jpeg",
+                                    "service": {
+                                        "@context": "http://iiif.io/api/image/2/context.json",
+                                        "@id": image_url(n, page),
+                                        "profile": "http://iiif.io/api/image/2/level1.json",
+                                    },
+                                },
+                            }
+                        ],
+                    }
+                    for page in range(1, canvases + 1)
+                ],
+            }
+        ],
+    }
+
+
+def collection_v3(n, manifests):
+    """
+    A IIIF Presentation 3 Collection of manifests.
+    """
+    return {
+        "@context": CONTEXT_V3,
+        "id": f"{BASE_URL}/collection/{n}",
+        "type": "Collection",
+        "label": {"en": [f"Collection {n}"]},
+        "items": [
+            {
+                "id": manifest.get("id", manifest.get("@id")),
+                "type": "Manifest",
+                "label": manifest["label"]
+                if isinstance(manifest["label"], dict)
+                else {"none": [manifest["label"]]},
+            }
+            for manifest in manifests
+        ],
+    }
+
+
+def box_selector(rng):
+    return {
+        "type": "box-selector",
+        "state": {
+            "x": rng.randint(0, 700),
+            "y": rng.randint(0, 900),
+            "width": rng.randint(10, 100),
+            "height": rng.randint(10, 50),
+        },
+    }
+
+
+def ocr_document(rng, lines=20, words_per_line=10):
+    """
+    An OCR document in the intermediate format, as a single paragraph of lines of words, each
+    with a box selector.
+    """
+    return {
+        "paragraph": [
+            {
+                "properties": {
+                    "lines": [
+                        {
+                            "properties": {
+                                "text": [
+                                    {"value": rng.choice(WORDS), "selector": box_selector(rng)}
+                                    for _ in range(words_per_line)
+                                ]
+                            }
+                        }
+                        for _ in range(lines)
+                    ]
+                }
+            }
+        ]
+    }
+
+
+def capture_model(n, rng, target, regions=5):
+    """
+    A capture model document with regions of interest, targeting a IIIF resource (by Madoc ID).
+    """
+    return {
+        "document": {
+            "type": "entity",
+            "properties": {
+                "region": [
+                    {
+                        "id": f"capture-model-{n}-region-{region}",
+                        "label": rng.choice(["Person", "Place", "Event"]),
+                        "value": text(rng, n=3),
+                        "selector": box_selector(rng),
+                    }
+                    for region in range(regions)
+                ]
+            },
+        },
+        "target": [{"id": target, "type": "Manifest"}],
+    }
+
+
+def generate_corpus(
+    manifests=100, collections=5, canvases=5, v2_ratio=0.5, ocr_lines=20, capture_models=1, seed=1
+):
+    """
+    Generate the ingest payloads (as POSTed to /api/search/iiif and /api/search/model) for a
+    synthetic corpus of manifests (a mix of IIIF Presentation 2 and 3), collections, and an OCR
+    document and capture models for each manifest, all in a single Madoc site.
+
+    :return: dict of lists of payloads, for "manifests", "collections", "ocr" and "capture_models"
+    """
+    rng = random.Random(seed)
+    site = {"id": "urn:benchmark:site:1", "type": "Site"}
+    collection_ids = [f"urn:benchmark:collection:{n}" for n in range(collections)]
+    resources, manifest_payloads = [], []
+    for n in range(manifests):
+        if rng.random() < v2_ratio:
+            resource = manifest_v2(n, rng, canvases=canvases)
+        else:
+            resource = manifest_v3(n, rng, canvases=canvases)
+        resources.append(resource)
+        contexts = [site]
+        if collection_ids:
+            contexts.append({"id": collection_ids[n % collections], "type": "Collection"})
+        manifest_payloads.append(
+            {
+                "contexts": contexts,
+                "resource": resource,
+                "id": f"urn:benchmark:manifest:{n}",
+                "thumbnail": f"{image_url(n, 1)}/full/200,/0/default.jpg",
+                "cascade": False,
+                "async_ingest": False,
+            }
+        )
+    collection_payloads = [
+        {
+            "contexts": [site],
+            "resource": collection_v3(n, resources[n::collections]),
+            "id": collection_id,
+            "thumbnail": None,
+            "cascade": False,
+            "async_ingest": False,
+        }
+        for n, collection_id in enumerate(collection_ids)
+    ]
+    ocr_payloads = []
+    capture_model_payloads = []
+    for n, payload in enumerate(manifest_payloads):
+        if ocr_lines:
+            ocr_payloads.append(
+                {
+                    "resource_id": payload["id"],
+                    "content_id": f"ocr-{n}",
+                    "resource": ocr_document(rng, lines=ocr_lines),
+                }
+            )
+        for m in range(capture_models):
+            capture_model_payloads.append(
+                {
+                    "resource_id": payload["id"],
+                    "content_id": f"capture-model-{n}-{m}",
+                    "resource": capture_model(f"{n}-{m}", rng, target=payload["id"]),
+                }
+            )
+    return {
+        "manifests": manifest_payloads,
+        "collections": collection_payloads,
+        "ocr": ocr_payloads,
+        "capture_models": capture_model_payloads,
+    }
@@ -1,13 +1,13 @@
 # Django Imports
 
-import itertools
 import logging
 from collections import defaultdict
 
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
-from django.utils.translation import get_language
+from django.db import connection, models, transaction
+from django.db.models.functions import RowNumber
+from django.http import StreamingHttpResponse
 from django_filters import rest_framework as df_filters
 from django_filters.rest_framework import DjangoFilterBackend
 
@@ -19,15 +19,19 @@ from rest_framework.exceptions import ValidationError, ParseError
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
+from rest_framework.views import APIView
 
+from .autocomplete import autocomplete_terms
+from .bulk_ingest import iter_bulk_ingest
 from .filters import IIIFSearchFilter, FacetListFilter, AutoCompleteFilter
 from .indexable_utils import gen_indexables
 
 # Local imports
-from .models import Indexables, IIIFResource, Context
+from .models import Indexables, IIIFResource, Context, IngestJob, FacetCount
 from .parsers import IIIFSearchParser, IIIFCreateUpdateParser
 from .pagination import MadocPagination
-from .prezi_upgrader import Upgrader
+from .query_debug import QueryDebugMixin, debug_search_response
+from .search_cache import SearchCacheInvalidationMixin, cache_search_response
 from .serializer_utils import MethodBasedSerializerMixin
 from .serializers import (
     UserSerializer,
@@ -38,14 +42,14 @@ from .serializers import (
     CaptureModelSerializer,
     AutocompleteSerializer,
     IIIFCreateUpdateSerializer,
+    IngestJobSerializer,
 )
+from .metrics import instrument
 from .madoc_jwt import (
     request_madoc_site_urn,
 )
 
 # Globals
-default_lang = get_language()
-upgrader = Upgrader(flags={"default_lang": default_lang})
 global_facet_on_manifests = settings.FACET_ON_MANIFESTS_ONLY
 global_facet_types = ["metadata"]
 
@@ -77,7 +81,79 @@ class UserDetail(generics.RetrieveAPIView):
     serializer_class = UserSerializer
 
 
-class IIIFDetail(MethodBasedSerializerMixin, generics.RetrieveUpdateDestroyAPIView):
+class AsyncIngestMixin(object):
+    """
+    Mixin for the IIIF create/update views that queues the ingest as an IngestJob, to be
+    processed by the ingest workers, if "async_ingest" is set on the parsed request data.
+    """
+
+    def queue_ingest_job(self, serializer, action):
+        """
+        Queue the (validated) ingest data as a job, and return a 202 response with the job status.
+        """
+        job = IngestJob.objects.create(
+            action=action,
+            madoc_id=serializer.validated_data["madoc_id"],
+            payload=serializer.initial_data,
+        )
+        job_data = IngestJobSerializer(job, context=self.get_serializer_context()).data
+        return Response(
+            job_data, status=status.HTTP_202_ACCEPTED, headers={"Location": job_data["url"]}
+        )
+
+
+class IIIFCacheInvalidationMixin(SearchCacheInvalidationMixin):
+    """
+    Invalidate just the cached searches for the Madoc site of the IIIF resource, unless the
+    update was skipped as unchanged (see IIIFCreateUpdateSerializer.update), or queued as an
+    ingest job (which invalidates them when it is processed).
+    """
+
+    unchanged = False
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.unchanged = getattr(serializer, "unchanged", False)
+
+    def get_invalidation_madoc_ids(self, request, response):
+        if self.unchanged or response.status_code == status.HTTP_202_ACCEPTED:
+            return []
+        if madoc_id := request.data.get("madoc_id") or self.kwargs.get("pk"):
+            return [madoc_id]
+
+
+class IngestDigestInvalidationMixin:
+    """
+    Clear the ingest digest (see serializers.ingest_digest) of the IIIF resources whose
+    indexables or contexts are written outside of an ingest, so that re-ingesting them (with
+    skip_unchanged) isn't skipped as unchanged.
+    """
+
+    def get_digest_resources(self, instance):
+        raise NotImplementedError
+
+    def clear_ingest_digests(self, instance):
+        self.get_digest_resources(instance).update(ingest_digest=None)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self.clear_ingest_digests(serializer.instance)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.clear_ingest_digests(serializer.instance)
+
+    def perform_destroy(self, instance):
+        self.clear_ingest_digests(instance)
+        super().perform_destroy(instance)
+
+
+class IIIFDetail(
+    IIIFCacheInvalidationMixin,
+    AsyncIngestMixin,
+    MethodBasedSerializerMixin,
+    generics.RetrieveUpdateDestroyAPIView,
+):
     queryset = IIIFResource.objects.all()
     serializer_class = IIIFSerializer
     serializer_mapping = {
@@ -95,8 +171,21 @@ class IIIFDetail(MethodBasedSerializerMixin, generics.RetrieveUpdateDestroyAPIVi
             self.kwargs[lookup_url_kwarg] = f"{madoc_site_urn}|{url_id}"
         return super().get_object()
 
-
-class IIIFList(MethodBasedSerializerMixin, generics.ListCreateAPIView):
+    def update(self, request, *args, **kwargs):
+        if not request.data.get("async_ingest"):
+            return super().update(request, *args, **kwargs)
+        instance = self.get_object()
+        serializer = self.get_serializer(instance, data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return self.queue_ingest_job(serializer, action=IngestJob.UPDATE)
+
+
+class IIIFList(
+    IIIFCacheInvalidationMixin,
+    AsyncIngestMixin,
+    MethodBasedSerializerMixin,
+    generics.ListCreateAPIView,
+):
     queryset = IIIFResource.objects.all().prefetch_related("contexts")
     serializer_class = IIIFSerializer
     serializer_mapping = {
@@ -108,24 +197,79 @@ class IIIFList(MethodBasedSerializerMixin, generics.ListCreateAPIView):
     # permission_classes = [AllowAny]
     parser_classes = [IIIFCreateUpdateParser]
 
+    def create(self, request, *args, **kwargs):
+        if not request.data.get("async_ingest"):
+            return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return self.queue_ingest_job(serializer, action=IngestJob.CREATE)
+
+
+class IIIFBulkIngest(APIView):
+    """
+    Create/update IIIF resources from newline-delimited JSON ingest payloads, read from the
+    request stream and ingested in batches of ?batch_size= (default BULK_INGEST_BATCH_SIZE),
+    streaming back the status of each record.
+    """
+
+    def post(self, request, *args, **kwargs):
+        if not request.META.get("CONTENT_LENGTH"):
+            # Without a Content-Length (i.e. a chunked request) the stream may be empty
+            return Response(
+                {"detail": "A Content-Length is required."}, status=status.HTTP_411_LENGTH_REQUIRED
+            )
+        try:
+            batch_size = int(request.query_params.get("batch_size", settings.BULK_INGEST_BATCH_SIZE))
+        except ValueError:
+            raise ValidationError({"batch_size": "A valid integer is required."})
+        if batch_size < 1:
+            raise ValidationError({"batch_size": "Ensure this value is greater than or equal to 1."})
+        return StreamingHttpResponse(
+            iter_bulk_ingest(
+                request.stream,
+                batch_size=batch_size,
+                madoc_site_urn=request_madoc_site_urn(request),
+            ),
+            content_type="application/x-ndjson",
+        )
+
+
+class IngestJobDetail(generics.RetrieveAPIView):
+    """
+    Status of an asynchronous IIIF ingest job.
+    """
+
+    queryset = IngestJob.objects.all()
+    serializer_class = IngestJobSerializer
+
 
-class ContextDetail(generics.RetrieveUpdateDestroyAPIView):
+class ContextDetail(
+    SearchCacheInvalidationMixin, IngestDigestInvalidationMixin, generics.RetrieveUpdateDestroyAPIView
+):
     queryset = Context.objects.all()
     serializer_class = ContextSerializer
     lookup_field = "slug"
 
+    def get_digest_resources(self, instance):
+        return IIIFResource.objects.filter(contexts=instance)
 
-class ContextList(generics.ListCreateAPIView):
+
+class ContextList(SearchCacheInvalidationMixin, generics.ListCreateAPIView):
     queryset = Context.objects.all()
     serializer_class = ContextSerializer
 
 
-class IndexablesDetail(generics.RetrieveUpdateDestroyAPIView):
+class IndexablesDetail(
+    SearchCacheInvalidationMixin, IngestDigestInvalidationMixin, generics.RetrieveUpdateDestroyAPIView
+):
     queryset = Indexables.objects.all()
     serializer_class = IndexablesSerializer
 
+    def get_digest_resources(self, instance):
+        return IIIFResource.objects.filter(pk=instance.iiif_id)
+
 
-class IndexablesList(generics.ListCreateAPIView):
+class IndexablesList(SearchCacheInvalidationMixin, IngestDigestInvalidationMixin, generics.ListCreateAPIView):
     serializer_class = IndexablesSerializer
     filter_backends = [DjangoFilterBackend]
     queryset = Indexables.objects.all()
@@ -138,6 +282,9 @@ class IndexablesList(generics.ListCreateAPIView):
         "subtype",
     ]
 
+    def get_digest_resources(self, instance):
+        return IIIFResource.objects.filter(pk=instance.iiif_id)
+
 
 class ContextFilterSet(df_filters.FilterSet):
     """
@@ -152,12 +299,12 @@ class ContextFilterSet(df_filters.FilterSet):
         fields = ["cont"]
 
 
-class ModelDetail(generics.RetrieveUpdateDestroyAPIView):
+class ModelDetail(SearchCacheInvalidationMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Indexables.objects.all()
     serializer_class = CaptureModelSerializer
 
 
-class ModelList(generics.ListCreateAPIView):
+class ModelList(SearchCacheInvalidationMixin, generics.ListCreateAPIView):
     """
     List/Create API view for Indexables that are being created/listed
     """
@@ -179,38 +326,67 @@ class ModelList(generics.ListCreateAPIView):
         Override the .create() method on the rest-framework generic ListCreateAPIViewset
         """
         data = request.data
-        good_results = []
-        bad_results = []
         indexables = []
         if data.get("resource"):
             indexables = gen_indexables(data)
         if indexables:
-            for indexable in indexables:
-                serializer = self.get_serializer(data=indexable)  # Serialize the data
-                serializer.is_valid(raise_exception=True)  # Check it's valid
-                self.perform_create(serializer)  # Create the object
-                if serializer.errors != {}:
-                    bad_results.append(
-                        (serializer.data, self.get_success_headers(serializer.data))
-                    )
-                else:
-                    good_results.append(
-                        (serializer.data, self.get_success_headers(serializer.data))
-                    )
-            return_status = status.HTTP_201_CREATED
-            if len(good_results) > 0:
-                if len(bad_results) > 0:
-                    return_status = status.HTTP_206_PARTIAL_CONTENT
+            # Serialize the data, and bulk create the objects
+            serializer = self.get_serializer(data=indexables, many=True)
+            serializer.is_valid(raise_exception=True)  # Check it's valid
+            # Replace any previous indexables for the content_id in the same transaction
+            with transaction.atomic():
+                self.perform_create(serializer)  # Create the objects
+            if len(serializer.data) > 0:
                 return Response(
-                    [res[0] for res in good_results],
-                    status=return_status,
-                    headers=good_results[-1][1],
+                    serializer.data,
+                    status=status.HTTP_201_CREATED,
+                    headers=self.get_success_headers(serializer.data[-1]),
                 )
             raise ValidationError
         raise ParseError
 
 
-class SearchBaseClass(viewsets.ReadOnlyModelViewSet):
+class ModelBulkCreate(SearchCacheInvalidationMixin, generics.CreateAPIView):
+    """
+    Create API view for the Indexables for many capture models/OCR documents, i.e. a list of
+    the payloads accepted by ModelList, which are written in a single transaction with one
+    query to resolve the IIIF resources, one DELETE and one bulk INSERT.
+    """
+
+    serializer_class = CaptureModelSerializer
+    queryset = Indexables.objects.all()
+
+    def get_invalidation_madoc_ids(self, request, response):
+        return [item["resource_id"] for item in response.data["items"]]
+
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list) or not request.data:
+            raise ParseError("Expected a list of capture model or OCR resources")
+        indexables, items = [], []
+        for n, data in enumerate(request.data):
+            if not isinstance(data, dict) or not data.get("resource") or not data.get("resource_id"):
+                raise ValidationError({n: "Expected a resource and a resource_id"})
+            item_indexables = gen_indexables(data)
+            if not item_indexables:
+                raise ValidationError({n: "No indexables in the resource"})
+            indexables += item_indexables
+            items.append(
+                {
+                    "resource_id": data["resource_id"],
+                    "content_id": data.get("content_id", item_indexables[0]["content_id"]),
+                    "indexables": len(item_indexables),
+                }
+            )
+        serializer = self.get_serializer(data=indexables, many=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            self.perform_create(serializer)
+        return Response(
+            {"items": items, "indexables": len(indexables)}, status=status.HTTP_201_CREATED
+        )
+
+
+class SearchBaseClass(QueryDebugMixin, viewsets.ReadOnlyModelViewSet):
     """
     BaseClass for Search Service APIs.
     """
@@ -221,6 +397,41 @@ class SearchBaseClass(viewsets.ReadOnlyModelViewSet):
     permission_classes = [AllowAny]
 
 
+def top_facets(facet_summary, num_facets):
+    """
+    Truncate the facet counts to the top N values for each type and subtype in SQL, using
+    ROW_NUMBER(), so that only the facets that will be returned are fetched.
+
+    N.B. Django can't filter on a window function, so the ranked facets are filtered
+    in an outer query.
+
+    :param facet_summary: queryset of (type, subtype, value) lists annotated with the count, n
+    :param num_facets: number of values to keep for each type and subtype
+    :return: list of (type, subtype, value, n) tuples, ordered by type, subtype, -n and value
+    """
+    type_field, subtype_field, value_field = facet_summary.query.values_select
+    # Alias the (grouped) columns, so the outer query can select them by name
+    ranked_facets = facet_summary.annotate(
+        facet_type=models.F(type_field),
+        facet_subtype=models.F(subtype_field),
+        facet_value=models.F(value_field),
+        facet_rank=models.Window(
+            expression=RowNumber(),
+            partition_by=[models.F(type_field), models.F(subtype_field)],
+            order_by=[models.F("n").desc(), models.F(value_field).asc()],
+        ),
+    )
+    sql, params = ranked_facets.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT facet_type, facet_subtype, facet_value, n "
+            f"FROM ({sql}) ranked_facets WHERE facet_rank <= %s "
+            "ORDER BY facet_type, facet_subtype, facet_rank",
+            (*params, int(num_facets)),
+        )
+        return cursor.fetchall()
+
+
 class IIIFSearch(SearchBaseClass):
     """
     Simple read only view for the IIIF data with methods for
@@ -229,11 +440,31 @@ class IIIFSearch(SearchBaseClass):
     Uses a custom paginator to fit the Madoc model.
     """
 
+    # IIIFSearchFilter adds the DISTINCT if it filters with joins (i.e. without the exists_plan)
+    queryset = IIIFResource.objects.all().prefetch_related("contexts")
     filter_backends = [IIIFSearchFilter]
     pagination_class = MadocPagination
 
-    def get_facets(self, request):
-        facet_summary = defaultdict(dict)
+    def get_facet_counts(self, request, context, site):
+        """
+        Facet counts for a search that is only filtered by context (and Madoc site), from the
+        materialised facet counts.
+        """
+        facet_counts = FacetCount.objects.filter(
+            context=context, type__in=request.data.get("facet_types", ["metadata"])
+        )
+        if site:
+            facet_counts = facet_counts.filter(site__startswith=site)
+        if facet_fields := request.data.get("facet_fields"):
+            facet_counts = facet_counts.filter(subtype__in=facet_fields)
+        # Counts are per site, and a IIIF resource belongs to a single site, so they can be summed
+        return (
+            facet_counts.values_list("type", "subtype", "indexable")
+            .annotate(n=models.Sum("n"))
+            .order_by("type", "subtype", "-n", "indexable")
+        )
+
+    def get_facet_summary(self, request):
         # If we haven't been provided a list of facet fields via a POST
         # just generate the list by querying the unique list of metadata subtypes
         # Make a copy of the query so we aren't running the get_queryset logic every time
@@ -301,38 +532,31 @@ class IIIFSearch(SearchBaseClass):
             facet_filter_args.append(facet_language_filter)
         facet_summary = (
             facetable_q.filter(*facet_filter_args)
-            .values("indexables__type", "indexables__subtype", "indexables__indexable")
+            .values_list("indexables__type", "indexables__subtype", "indexables__indexable")
             .annotate(n=models.Count("pk", distinct=True))
             .order_by("indexables__type", "indexables__subtype", "-n", "indexables__indexable")
         )
-        grouped_facets = defaultdict(lambda: defaultdict(lambda: defaultdict(dict)))
+        return facet_summary
+
+    @instrument("facets")
+    def get_facets(self, request):
+        if (facet_counts_scope := request.data.get("facet_counts_scope")) is not None:
+            facet_summary = self.get_facet_counts(request, **facet_counts_scope)
+        else:
+            facet_summary = self.get_facet_summary(request)
         truncate_to = request.data.get("num_facets", 10)
         truncated_facets = defaultdict(lambda: defaultdict(dict))
-        # Turn annotated list of results into a deeply nested dict
-        for facet in facet_summary:
-            grouped_facets[facet["indexables__type"]][facet["indexables__subtype"]][
-                facet["indexables__indexable"]
-            ] = facet["n"]
-        # Take the deeply nested dict and truncate the leaves of the tree to just N keys.
-        for facet_type, facet_subtypes in grouped_facets.items():
-            for k, v in facet_subtypes.items():
-                truncated_facets[facet_type][k] = dict(itertools.islice(v.items(), truncate_to))
+        # Turn the list of the top N facets for each type and subtype into a nested dict
+        for facet_type, facet_subtype, facet_value, n in top_facets(facet_summary, truncate_to):
+            truncated_facets[facet_type][facet_subtype][facet_value] = n
         return truncated_facets
 
+    @debug_search_response
+    @cache_search_response
     def list(self, request, *args, **kwargs):
         resp = super().list(request, *args, **kwargs)
-        resp.data.update({"facets": self.get_facets(request=request)})
-        reverse_sort = False
-        if request.data.get("sort_order", None):
-            if (direction := request.data["sort_order"].get("direction")) is not None:
-                if direction == "descending":
-                    logger.debug("Descending")
-                    reverse_sort = True
-        resp.data["results"] = sorted(
-            resp.data["results"],
-            key=lambda k: (k.get("sortk"),),
-            reverse=reverse_sort,
-        )
+        with self.debug_stage("facets"):
+            resp.data.update({"facets": self.get_facets(request=request)})
         return resp
 
 
@@ -389,9 +613,12 @@ class Facets(SearchBaseClass):
             facet_dict[i[0]].append(i[1])
         return facet_dict
 
+    @debug_search_response
+    @cache_search_response
     def list(self, request, *args, **kwargs):
         response = super(Facets, self).list(request, args, kwargs)
-        response.data = self.get_facet_list(request=request)
+        with self.debug_stage("facets"):
+            response.data = self.get_facet_list(request=request)
         return response
 
 
@@ -400,15 +627,26 @@ class Autocomplete(SearchBaseClass):
     serializer_class = AutocompleteSerializer
     filter_backends = [AutoCompleteFilter]
 
+    @debug_search_response
+    @cache_search_response
     def list(self, request, *args, **kwargs):
-        facetable_queryset = self.filter_queryset(self.get_queryset().all())
-        raw_data = (
-            facetable_queryset.values("indexable")
-            .distinct()
-            .annotate(n=models.Count("pk", distinct=True))
-            .order_by("-n")[:10]
-        )
-        return_data = {
-            "results": [{"id": x.get("indexable"), "text": x.get("indexable")} for x in raw_data]
-        }
+        if (autocomplete_scope := request.data.get("autocomplete_scope")) is None:
+            facetable_queryset = self.filter_queryset(self.get_queryset().all())
+            raw_data = (
+                facetable_queryset.values_list("indexable")
+                .distinct()
+                .annotate(n=models.Count("pk", distinct=True))
+                .order_by("-n")[:10]
+            )
+        with self.debug_stage("autocomplete"):
+            if autocomplete_scope is not None:
+                raw_data = autocomplete_terms(
+                    **autocomplete_scope,
+                    autocomplete_type=request.data.get("autocomplete_type"),
+                    autocomplete_subtype=request.data.get("autocomplete_subtype"),
+                    query=request.data.get("autocomplete_query"),
+                    fuzzy=request.data.get("autocomplete_fuzzy"),
+                    index=request.data.get("autocomplete_index"),
+                )
+            return_data = {"results": [{"id": value, "text": value} for value, _ in raw_data]}
         return Response(data=return_data)
@@ -12,7 +12,6 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 import os
 import environ
 from django.utils.translation import gettext_lazy as _
-from distutils.util import strtobool
 
 env = environ.Env()
 
@@ -31,6 +30,56 @@ DEBUG = env.bool("DJANGO_DEBUG", False)
 # Facet on Manifets
 FACET_ON_MANIFESTS_ONLY = env.bool("FACET_ON_MANIFESTS", False)
 
+# Facets for searches that are only filtered by context (and Madoc site) are read from the materialised
+# facet counts, rather than counted from the indexables.
+# This can be overridden per request with "materialised_facets" in the search payload.
+MATERIALISED_FACETS = env.bool("MATERIALISED_FACETS", True)
+
+# Autocomplete requests that are only filtered by context (and Madoc site) are answered from the materialised
+# autocomplete terms, rather than by counting the matching indexables.
+# This can be overridden per request with "materialised_autocomplete" in the autocomplete payload.
+MATERIALISED_AUTOCOMPLETE = env.bool("MATERIALISED_AUTOCOMPLETE", True)
+
+# Fill the autocomplete results with fuzzy matches (from the materialised autocomplete terms) when there are fewer
+# prefix matches than results. This can be overridden per request with "autocomplete_fuzzy".
+AUTOCOMPLETE_FUZZY = env.bool("AUTOCOMPLETE_FUZZY", False)
+
+# Answer autocomplete prefix matches from an in-process index of the materialised autocomplete terms, rather than
+# querying the database. The index holds the terms for up to AUTOCOMPLETE_INDEX_SIZE contexts (and Madoc sites)
+# with at most AUTOCOMPLETE_INDEX_MAX_TERMS terms each, rebuilt at most every AUTOCOMPLETE_INDEX_REFRESH seconds
+# after a write, and every AUTOCOMPLETE_INDEX_TTL seconds. This can be overridden per request with
+# "autocomplete_index" in the autocomplete payload.
+AUTOCOMPLETE_INDEX = env.bool("AUTOCOMPLETE_INDEX", False)
+AUTOCOMPLETE_INDEX_MAX_TERMS = env.int("AUTOCOMPLETE_INDEX_MAX_TERMS", 100000)
+AUTOCOMPLETE_INDEX_SIZE = env.int("AUTOCOMPLETE_INDEX_SIZE", 32)
+AUTOCOMPLETE_INDEX_TTL = env.int("AUTOCOMPLETE_INDEX_TTL", 300)
+AUTOCOMPLETE_INDEX_REFRESH = env.int("AUTOCOMPLETE_INDEX_REFRESH", 5)
+
+# Filter searches with an EXISTS subquery per filter, rather than joining the indexables and contexts for each
+# filter and de-duplicating the results with a DISTINCT. This can be overridden per request with "exists_plan"
+# in the search payload. Off by default until `manage.py benchmark_search_plans` has shown that both plans
+# return the same results, in the same order and with the same ranks, for your data.
+SEARCH_EXISTS_PLAN = env.bool("SEARCH_EXISTS_PLAN", False)
+
+# Allow any client to request the SQL, EXPLAIN output and stage timings for a search with ?debug=true, rather
+# than just staff users.
+SEARCH_QUERY_DEBUG = env.bool("SEARCH_QUERY_DEBUG", False)
+
+# Record per-endpoint request and search/ingest stage timings, SQL query counts and rows, and expose them in
+# the Prometheus text format at /metrics. /metrics isn't authenticated (the labels include context and Madoc site
+# ids), so only enable this where /metrics can only be reached by the metrics scraper.
+METRICS_ENABLED = env.bool("METRICS_ENABLED", False)
+
+# Search response cache: "lru" (in process) or "django" (the SEARCH_CACHE_ALIAS cache in CACHES), or empty
+# to disable. Cached search, facet and autocomplete responses are invalidated on writes, and expire after
+# SEARCH_CACHE_TTL seconds. Use "django" with a shared cache if running the asynchronous ingest workers.
+SEARCH_CACHE = env.str("SEARCH_CACHE", "")
+SEARCH_CACHE_ALIAS = env.str("SEARCH_CACHE_ALIAS", "default")
+SEARCH_CACHE_SIZE = env.int("SEARCH_CACHE_SIZE", 1024)
+SEARCH_CACHE_TTL = env.int("SEARCH_CACHE_TTL", 300)
+
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+
 # Use fulltext querying for non-latin scripts
 NONLATIN_FULLTEXT = env.bool("NONLATIN_FULLTEXT", False)
 
@@ -42,6 +91,38 @@ SEARCH_MULTIPLE_FIELDS = env.bool("SEARCH_MULTIPLE_FIELDS", False)
 # defaults to True, but typically set to False during test coverage, so that we can mock services locally
 THUMBNAIL_FALLBACK = env.bool("THUMBNAIL_FALLBACK", False)
 
+# Thumbnail fallback info.json requests: timeout (in seconds) and number of concurrent requests, and
+# the size and TTL (in seconds) of the info.json cache. If INFO_JSON_PERSIST is set to True, the
+# fetched info.json documents are also stored in the database, and shared between processes.
+INFO_JSON_TIMEOUT = env.float("INFO_JSON_TIMEOUT", 10.0)
+INFO_JSON_MAX_WORKERS = env.int("INFO_JSON_MAX_WORKERS", 8)
+INFO_JSON_CACHE_SIZE = env.int("INFO_JSON_CACHE_SIZE", 4096)
+INFO_JSON_CACHE_TTL = env.int("INFO_JSON_CACHE_TTL", 86400)
+INFO_JSON_PERSIST = env.bool("INFO_JSON_PERSIST", False)
+
+# Cascade ingest: if set to True, the Canvases and Ranges of a Manifest that is ingested with
+# "cascade" or "cascade_canvases" are created/updated with bulk queries, rather than one at a time.
+# This can be overridden per request with "bulk_cascade" in the ingest payload.
+BULK_CASCADE = env.bool("BULK_CASCADE", False)
+
+# Skip unchanged resources on re-ingest: if set to True, an update to a IIIF resource (or one of its cascaded
+# Canvases or Ranges) is skipped if the digest of its IIIF resource, thumbnail, contexts and cascade flags matches
+# the digest stored on its last ingest. The digest is cleared by writes to its indexables and contexts through the
+# API, but not by changes made directly in the database, which a re-ingest then won't repair.
+# This can be overridden per request with "skip_unchanged" in the ingest payload.
+INGEST_SKIP_UNCHANGED = env.bool("INGEST_SKIP_UNCHANGED", False)
+
+# Asynchronous ingest: if set to True, IIIF create/update requests are queued as ingest jobs and return
+# 202 with a job id, rather than being processed in the request. The jobs are processed by the
+# process_ingest_jobs management command, with INGEST_WORKERS worker threads.
+# This can be overridden per request with "async_ingest" in the ingest payload.
+ASYNC_INGEST = env.bool("ASYNC_INGEST", False)
+INGEST_WORKERS = env.int("INGEST_WORKERS", 2)
+
+# Bulk ingest (/api/search/iiif/bulk): the number of records ingested in each transaction.
+# This can be overridden per request with ?batch_size=
+BULK_INGEST_BATCH_SIZE = env.int("BULK_INGEST_BATCH_SIZE", 50)
+
 ALLOWED_HOSTS = ["*"]
 
 # Application definition
@@ -65,6 +146,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "search.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -105,7 +187,10 @@ REST_FRAMEWORK = {
 
 MAX_PAGE_SIZE = env.int("MAX_PAGE_SIZE", None)
 
-BROWSABLE = strtobool(env("BROWSABLE", default="False"))
+# Pagination: the maximum count for "count=capped" requests
+PAGINATION_COUNT_CAP = env.int("PAGINATION_COUNT_CAP", 10000)
+
+BROWSABLE = env.bool("BROWSABLE", False)
 
 
 if not BROWSABLE:
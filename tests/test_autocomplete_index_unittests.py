@@ -0,0 +1,58 @@
+from search_service.search.autocomplete_index import AutocompleteIndex, AutocompleteSnapshot
+
+TERMS = [
+    ("metadata", "author", "mill, john", "Mill, John", 3),
+    ("metadata", "author", "milton, john", "Milton, John", 3),
+    ("metadata", "author", "more, thomas", "More, Thomas", 5),
+    ("metadata", "publisher", "milton press", "Milton Press", 1),
+    ("descriptive", "label", "milton, john", "Milton, John", 2),
+]
+
+
+def test__autocomplete_snapshot_search():
+    """
+    Should return the values with a normalised prefix, ranked by frequency and then value, per
+    type and subtype, summing the frequencies when not filtered by type or subtype
+    :return:
+    """
+    snapshot = AutocompleteSnapshot(TERMS, generations=[0, 0])
+    assert snapshot.search("metadata", "author", "mil") == [("Mill, John", 3), ("Milton, John", 3)]
+    assert snapshot.search("Metadata", "Author", "milt") == [("Milton, John", 3)]
+    assert snapshot.search("metadata", None, "mil") == [("Mill, John", 3), ("Milton, John", 3), ("Milton Press", 1)]
+    assert snapshot.search(None, None, "milton", limit=1) == [("Milton, John", 5)]
+    assert snapshot.search(None, None, "") == [
+        ("Milton, John", 5),
+        ("More, Thomas", 5),
+        ("Mill, John", 3),
+        ("Milton Press", 1),
+    ]
+    assert snapshot.search("metadata", "title", "") == []
+    assert AutocompleteSnapshot(TERMS, generations=[0, 0], max_terms=4).search(None, None, "") is None
+
+
+def test__autocomplete_index_rebuild():
+    """
+    Should rebuild a snapshot when the generations have changed (not within the refresh interval),
+    and evict the least recently used snapshot
+    :return:
+    """
+    loads = []
+    generations = {"": [0, 0]}
+
+    def load(context, site, limit):
+        loads.append((context, site))
+        return TERMS[: len(loads)]
+
+    index = AutocompleteIndex(load, lambda site: generations[site], size=1, ttl=60, refresh=0)
+    assert index.search("", "", query="m") == [("Mill, John", 3)]
+    assert index.search("", "", query="m") == [("Mill, John", 3)]
+    assert loads == [("", "")]
+    generations[""] = [0, 1]
+    assert index.search("", "", query="m") == [("Mill, John", 3), ("Milton, John", 3)]
+    assert loads == [("", ""), ("", "")]
+    index.refresh = 60
+    generations[""] = [0, 2]
+    assert index.search("", "", query="m") == [("Mill, John", 3), ("Milton, John", 3)]
+    index.search("urn:madoc:site:1", "", query="m")
+    index.search("", "", query="m")
+    assert loads == [("", ""), ("", ""), ("urn:madoc:site:1", ""), ("", "")]
@@ -0,0 +1,31 @@
+from search_service.search.langbase import LANGBASE
+from search_service.search.serializer_utils import LanguageIndex, get_language_data
+
+
+def test__get_language_data():
+    """
+    Should look up the language data by ISO 639-1 or ISO 639-2 code, or BCP 47 language tag
+    :return:
+    """
+    english = {
+        "language_iso639_2": "eng",
+        "language_iso639_1": "en",
+        "language_display": "english",
+        "language_pg": "english",
+    }
+    assert get_language_data(lang_code="en", langbase=LANGBASE) == english
+    assert get_language_data(lang_code="eng", langbase=LANGBASE) == english
+    assert get_language_data(lang_code="en-GB") == english
+    assert get_language_data(lang_code="haw")["language_pg"] is None
+    assert get_language_data(lang_code="none")["language_iso639_2"] is None
+    assert get_language_data(lang_code=None)["language_iso639_2"] is None
+
+
+def test__language_index_first_row():
+    """
+    Should use the first row for a code that is in more than one row, as scanning the language base did
+    :return:
+    """
+    index = LanguageIndex((("aaa", "aa", "I", "L", "First"), ("aab", "aa", "I", "L", "Second")))
+    assert index.language_data("aa")["language_display"] == "first"
+    assert index.language_data("aab")["language_display"] == "second"
@@ -0,0 +1,22 @@
+from prometheus_client import generate_latest
+
+from search_service.search.metrics import REGISTRY, STAGE_DURATION, STAGE_ERRORS
+
+
+def test__stage_metrics_exposition():
+    """
+    Should expose the stage metrics per endpoint and stage, with the counters suffixed _total
+    :return:
+    """
+    STAGE_DURATION.labels(endpoint="unittest", stage="filter").observe(0.05)
+    STAGE_ERRORS.labels(endpoint="unittest", stage="filter").inc()
+    try:
+        exposition = generate_latest(REGISTRY).decode("utf-8").splitlines()
+        assert "# TYPE search_stage_errors_total counter" in exposition
+        assert 'search_stage_errors_total{endpoint="unittest",stage="filter"} 1.0' in exposition
+        bucket = 'search_stage_duration_seconds_bucket{endpoint="unittest",le="0.05",stage="filter"}'
+        assert f"{bucket} 1.0" in exposition
+        assert 'search_stage_duration_seconds_count{endpoint="unittest",stage="filter"} 1.0' in exposition
+    finally:
+        STAGE_DURATION.remove("unittest", "filter")
+        STAGE_ERRORS.remove("unittest", "filter")
@@ -284,6 +284,23 @@ def test_contexts_only_query(http_service):
     }
 
 
+def test_contexts_only_query_materialised_facets(http_service):
+    headers = {"Content-Type": "application/json", "Accept": "application/json"}
+    facets = []
+    for materialised_facets in (True, False):
+        query = {
+            "contexts": ["urn:muya:site:1"],
+            "materialised_facets": materialised_facets,
+        }
+        result = requests.post(
+            url=http_service + "/api/search/search", json=query, headers=headers
+        )
+        assert result.status_code == requests.codes.ok
+        facets.append(result.json()["facets"])
+    assert facets[0].get("metadata") is not None
+    assert facets[0] == facets[1]
+
+
 def test_facet_api(http_service):
     query = {
         "contexts": ["urn:muya:site:1"],
@@ -330,6 +347,27 @@ def test_facet_api_types(http_service):
     assert j["descriptive"] == ["attribution", "label"]
 
 
+def test_autocomplete_materialised(http_service):
+    headers = {"Content-Type": "application/json", "Accept": "application/json"}
+    results = []
+    for materialised_autocomplete in (True, False):
+        query = {
+            "contexts": ["urn:muya:site:1"],
+            "autocomplete_type": "metadata",
+            "autocomplete_subtype": "author",
+            "autocomplete_query": "m",
+            "materialised_autocomplete": materialised_autocomplete,
+        }
+        result = requests.post(
+            url=http_service + "/api/search/autocomplete", json=query, headers=headers
+        )
+        assert result.status_code == requests.codes.ok
+        results.append(sorted(r["text"] for r in result.json()["results"]))
+    assert results[0]
+    assert all(text.lower().startswith("m") for text in results[0])
+    assert results[0] == results[1]
+
+
 def test_simple_metadata_query_single_metadata_fields(http_service):
     query = {
         "fulltext": "Mietzsching",
@@ -642,3 +680,661 @@ def test_cascading_ingest_range_query(http_service, manifest_with_ranges):
     assert result.status_code == requests.codes.ok
     j = result.json()
     assert j["results"][0]["resource_type"] == "Range"
+
+
+def test_async_ingest(http_service, test_api_auth, iiif_collection, tests_dir):
+    """
+    Queue an ingest as a job, and check the job status is available.
+
+    :return: requests response
+    """
+    manifest_json = json.load(
+        (tests_dir / f"fixtures/iiif/{iiif_collection[0]}").open(encoding="utf-8")
+    )
+    post_json = {
+        "contexts": [  # List of contexts with their id and type
+            {"id": "urn:muya:site:1", "type": "Site"},
+        ],
+        "resource": manifest_json,  # this is the JSON for the IIIF resource
+        "id": "urn:muya:manifest:async",  # Madoc ID for the subject/object
+        "cascade": False,
+        "async_ingest": True,
+    }
+    headers = {"Content-Type": "application/json", "Accept": "application/json"}
+    result = requests.post(
+        url=http_service + "/api/search/iiif",
+        json=post_json,
+        headers=headers,
+        auth=test_api_auth,
+    )
+    j = result.json()
+    assert result.status_code == 202
+    assert j.get("madoc_id") == "urn:muya:manifest:async"
+    assert j.get("status") == "queued"
+    job_result = requests.get(
+        url=http_service + f"/api/search/jobs/{j['id']}", headers=headers, auth=test_api_auth
+    )
+    assert job_result.status_code == requests.codes.ok
+    assert job_result.json().get("status") in ["queued", "running", "complete"]
+
+
+def test_exists_plan_results(http_service):
+    """
+    Search with the EXISTS subquery plan and the join plan, and check they return the same
+    results, in the same order and with the same ranks, without duplicates.
+
+    :return: requests response
+    """
+    queries = [
+        {"fulltext": "Leipzig"},
+        {"fulltext": "Leipzig", "contexts": ["urn:muya:site:1"]},
+        {
+            "fulltext": "Leipzig",
+            "facets": [{"type": "metadata", "subtype": "manifest type", "value": "monograph"}],
+        },
+        {
+            "fulltext": "bible Leipzig",
+            "facets": [{"type": "metadata", "subtype": "owner", "value": "Leipzig University Library"}],
+        },
+        {
+            "contexts": ["urn:muya:site:1"],
+            "facets": [
+                {"type": "metadata", "subtype": "manifest type", "value": "monograph"},
+                {"type": "metadata", "subtype": "manifest type", "value": "manuscript"},
+            ],
+        },
+        {
+            "fulltext": "Leipzig",
+            "facet_on_manifests": True,
+            "facets": [{"type": "metadata", "subtype": "manifest type", "value": "monograph"}],
+        },
+        {
+            "contexts": ["urn:muya:manifest:ranges"],
+            "facet_on_manifests": True,
+            "facets": [{"type": "metadata", "subtype": "yasna identifier", "value": "Y.1.1"}],
+        },
+    ]
+    headers = {"Content-Type": "application/json", "Accept": "application/json"}
+    for query in queries:
+        results = {}
+        for exists_plan in (False, True):
+            result = requests.post(
+                url=http_service + "/api/search/search?page_size=100",
+                json={**query, "exists_plan": exists_plan},
+                headers=headers,
+            )
+            assert result.status_code == requests.codes.ok
+            results[exists_plan] = [(r["resource_id"], r["rank"]) for r in result.json()["results"]]
+        ids = [resource_id for resource_id, _ in results[True]]
+        assert len(ids) == len(set(ids))
+        assert results[True] == results[False], query
+
+
+def test_bulk_ndjson_ingest(http_service, test_api_auth, iiif_collection, tests_dir):
+    """
+    Bulk ingest NDJSON with good and bad records across batch boundaries, and check that the
+    bad records fail without failing the rest of their batch.
+
+    :return: requests response
+    """
+    lines = []
+    for manifest in iiif_collection[1:3]:
+        manifest_json = json.load((tests_dir / f"fixtures/iiif/{manifest}").open(encoding="utf-8"))
+        post_json = {
+            "contexts": [
+                {"id": "urn:muya:site:1", "type": "Site"},
+                {"id": "Leipzig", "type": "Collection"},
+            ],
+            "resource": manifest_json,
+            "id": f"urn:muya:manifest:{manifest.replace('.json', '')}",
+            "cascade": False,
+        }
+        lines.append(json.dumps(post_json))
+    lines = [lines[0], "not json", "[1]", "", lines[1], json.dumps({"id": "urn:muya:manifest:bulk"})]
+    result = requests.post(
+        url=http_service + "/api/search/iiif/bulk?batch_size=2",
+        data="\n".join(lines).encode("utf-8"),
+        headers={"Content-Type": "application/x-ndjson"},
+        auth=test_api_auth,
+    )
+    assert result.status_code == requests.codes.ok
+    statuses = [json.loads(line) for line in result.text.splitlines()]
+    assert [(s.get("line"), s.get("status")) for s in statuses[:-1]] == [
+        (1, "updated"),
+        (2, "failed"),
+        (3, "failed"),
+        (5, "updated"),
+        (6, "failed"),
+    ]
+    assert statuses[-1] == {"summary": {"created": 0, "updated": 2, "unchanged": 0, "queued": 0, "failed": 3}}
+
+
+def test_bulk_ndjson_ingest_chunked(http_service, test_api_auth):
+    """
+    Bulk ingest NDJSON without a Content-Length, which is rejected.
+
+    :return: requests response
+    """
+    result = requests.post(
+        url=http_service + "/api/search/iiif/bulk",
+        data=(line for line in [b'{"id": "urn:muya:manifest:bulk"}\n']),
+        headers={"Content-Type": "application/x-ndjson"},
+        auth=test_api_auth,
+    )
+    assert result.status_code == 411
+
+
+def test_metrics(http_service):
+    """
+    Search, and check the request and its instrumented stages are counted in the metrics.
+
+    :return: requests response
+    """
+
+    def counts():
+        result = requests.get(url=http_service + "/metrics")
+        assert result.status_code == requests.codes.ok
+        return {
+            sample: float(value)
+            for sample, value in (line.rsplit(" ", 1) for line in result.text.splitlines())
+            if not sample.startswith("#")
+        }
+
+    request_count = 'search_request_duration_seconds_count{endpoint="search.api.search",method="POST",status="200"}'
+    stage_counts = [
+        f'search_stage_duration_seconds_count{{endpoint="search.api.search",stage="{stage}"}}'
+        for stage in ("parse", "filter")
+    ]
+    before = counts()
+    result = requests.post(
+        url=http_service + "/api/search/search",
+        json={"fulltext": "Mietzsching", "contexts": ["urn:muya:site:1"]},
+        headers={"Content-Type": "application/json", "Accept": "application/json"},
+    )
+    assert result.status_code == requests.codes.ok
+    after = counts()
+    assert after[request_count] == before.get(request_count, 0) + 1
+    for stage_count in stage_counts:
+        assert after[stage_count] >= before.get(stage_count, 0) + 1
+    assert "# TYPE search_stage_errors_total counter" in requests.get(url=http_service + "/metrics").text
+
+
+def resource_indexables(http_service, test_api_auth, resource_id):
+    """
+    The indexables for a IIIF resource, by their URL (i.e. their row id).
+    """
+    result = requests.get(
+        url=http_service + "/api/search/indexables",
+        params={"resource_id": resource_id, "page_size": 1000},
+        headers={"Accept": "application/json"},
+        auth=test_api_auth,
+    )
+    assert result.status_code == requests.codes.ok
+    return {i["url"]: (i["type"], i["subtype"], i["indexable"]) for i in result.json()["results"]}
+
+
+def test_manifest_update_skip_unchanged(http_service, test_api_auth, iiif_collection, tests_dir):
+    """
+    Re-ingest an unchanged manifest with skip_unchanged, which should be skipped, then change
+    its label indexable through the API, which clears its digest, and check a re-ingest repairs it.
+
+    :return: requests response
+    """
+    manifest_json = json.load((tests_dir / f"fixtures/iiif/{iiif_collection[0]}").open(encoding="utf-8"))
+    manifest_json["label"] = "QuickBrownFoxLazyDog"
+    identifier = f"urn:muya:manifest:{iiif_collection[0].replace('.json', '')}"
+    headers = {"Content-Type": "application/json", "Accept": "application/json"}
+    put_kwargs = {
+        "url": http_service + f"/api/search/iiif/{identifier}",
+        "json": {"id": identifier, "resource": manifest_json, "type": "Manifest", "skip_unchanged": True},
+        "headers": headers,
+        "auth": test_api_auth,
+    }
+    before = resource_indexables(http_service, test_api_auth, identifier)
+    result = requests.put(**put_kwargs)
+    assert result.status_code == 200
+    assert resource_indexables(http_service, test_api_auth, identifier) == before
+    indexables = requests.get(
+        url=http_service + "/api/search/indexables",
+        params={"resource_id": identifier, "type": "descriptive", "subtype": "label"},
+        headers=headers,
+        auth=test_api_auth,
+    ).json()["results"]
+    result = requests.patch(
+        url=indexables[0]["url"],
+        json={"indexable": "Xyzzyskip", "original_content": "Xyzzyskip"},
+        headers=headers,
+        auth=test_api_auth,
+    )
+    assert result.status_code == 200
+    result = requests.put(**put_kwargs)
+    assert result.status_code == 200
+    repaired = resource_indexables(http_service, test_api_auth, identifier)
+    assert indexables[0]["url"] not in repaired
+    assert sorted(repaired.values()) == sorted(before.values())
+    for fulltext, n in (("QuickBrownFoxLazyDog", 1), ("Xyzzyskip", 0)):
+        result = requests.post(
+            url=http_service + "/api/search/search",
+            json={"fulltext": fulltext, "contexts": ["urn:muya:site:1"]},
+            headers=headers,
+        )
+        assert len(result.json()["results"]) == n
+
+
+def test_cascading_update_skip_unchanged(http_service, test_api_auth, manifest_with_ranges):
+    """
+    Re-ingest a manifest with ranges with a changed label, and check that with skip_unchanged
+    the manifest is updated, but its (unchanged) ranges are left as they were.
+
+    :return: requests response
+    """
+    identifier = "urn:muya:manifest:e800b13a-6699-49ae-9bc2-c9b8c35b7a25"
+    headers = {"Content-Type": "application/json", "Accept": "application/json"}
+    range_ids = [f"{identifier}:range:8", f"{identifier}:range:8:range:0"]
+    before = {range_id: resource_indexables(http_service, test_api_auth, range_id) for range_id in range_ids}
+    assert all(before.values())
+    for label in ("SkipUnchangedRanges", "ReingestedRanges"):
+        result = requests.put(
+            url=http_service + f"/api/search/iiif/{identifier}",
+            json={
+                "contexts": [{"id": "urn:muya:site:1", "type": "Site"}],
+                "resource": {**manifest_with_ranges, "label": {"en": [label]}},
+                "id": identifier,
+                "cascade": True,
+                "skip_unchanged": True,
+            },
+            headers=headers,
+            auth=test_api_auth,
+        )
+        assert result.status_code == 200
+        result = requests.post(
+            url=http_service + "/api/search/search",
+            json={"fulltext": label, "contexts": ["urn:muya:site:1"]},
+            headers=headers,
+        )
+        assert [r["resource_id"] for r in result.json()["results"]] == [identifier]
+        assert {
+            range_id: resource_indexables(http_service, test_api_auth, range_id) for range_id in range_ids
+        } == before
+
+
+def test_bulk_model_repost(http_service, test_api_auth):
+    """
+    Bulk index OCR for a manifest, and then re-post it with the same content_id and different
+    text, which should replace, rather than add to, the indexed OCR.
+
+    :return: requests response
+    """
+    resource_id = "urn:muya:manifest:0000000141"
+    headers = {"Content-Type": "application/json", "Accept": "application/json"}
+
+    def ocr(words):
+        selector = {"type": "box-selector", "state": {"x": 10, "y": 10, "width": 50, "height": 20}}
+        return {
+            "paragraph": [
+                {
+                    "properties": {
+                        "lines": [
+                            {"properties": {"text": [{"value": word, "selector": selector} for word in words]}}
+                        ]
+                    }
+                }
+            ]
+        }
+
+    for words in (["Firstocrpost", "text"], ["Secondocrpost", "text"]):
+        result = requests.post(
+            url=http_service + "/api/search/model/bulk",
+            json=[{"resource_id": resource_id, "content_id": "ocr-repost", "resource": ocr(words)}],
+            headers=headers,
+            auth=test_api_auth,
+        )
+        assert result.status_code == 201
+    indexed = requests.get(
+        url=http_service + "/api/search/model",
+        params={"resource_id": resource_id, "content_id": "ocr-repost"},
+        headers=headers,
+        auth=test_api_auth,
+    ).json()
+    assert indexed["pagination"]["totalResults"] == result.json()["indexables"]
+    for fulltext, n in (("Firstocrpost", 0), ("Secondocrpost", 1)):
+        result = requests.post(
+            url=http_service + "/api/search/search",
+            json={"fulltext": fulltext, "contexts": ["urn:muya:site:1"]},
+            headers=headers,
+        )
+        assert len(result.json()["results"]) == n
+
+
+def test_reingest_syncs_indexables(http_service, test_api_auth):
+    """
+    Re-ingest a manifest unchanged, with a value inserted at the front of a subtype, and with a
+    subtype removed, and check that only the indexables that changed are replaced, and that its
+    OCR is left alone.
+
+    :return: requests response
+    """
+    identifier = "urn:muya:manifest:sync"
+    headers = {"Content-Type": "application/json", "Accept": "application/json"}
+
+    def manifest(metadata):
+        return {
+            "@context": "http://iiif.io/api/presentation/3/context.json",
+            "id": "https://example.org/iiif/sync/manifest",
+            "type": "Manifest",
+            "label": {"en": ["Sync test"]},
+            "metadata": [{"label": {"none": [label]}, "value": {"none": [value]}} for label, value in metadata],
+            "items": [],
+        }
+
+    def ingest(metadata, method=requests.put, url=f"/api/search/iiif/{identifier}"):
+        result = method(
+            url=http_service + url,
+            json={
+                "contexts": [{"id": "urn:muya:site:1", "type": "Site"}],
+                "resource": manifest(metadata),
+                "id": identifier,
+                "skip_unchanged": False,
+            },
+            headers=headers,
+            auth=test_api_auth,
+        )
+        assert result.status_code in (200, 201)
+
+    def indexables():
+        result = requests.get(
+            url=http_service + "/api/search/indexables",
+            params={"resource_id": identifier, "page_size": 100},
+            headers=headers,
+            auth=test_api_auth,
+        )
+        return {
+            i["url"]: (i["subtype"].lower(), i["indexable"], i["content_id"]) for i in result.json()["results"]
+        }
+
+    ingest([("Author", "Alpha"), ("Publisher", "Reimer")], method=requests.post, url="/api/search/iiif")
+    result = requests.post(
+        url=http_service + "/api/search/model",
+        json={
+            "resource_id": identifier,
+            "content_id": "ocr-sync",
+            "resource": {
+                "paragraph": [
+                    {
+                        "properties": {
+                            "lines": [
+                                {
+                                    "properties": {
+                                        "text": [
+                                            {
+                                                "value": "Syncocr",
+                                                "selector": {
+                                                    "type": "box-selector",
+                                                    "state": {"x": 0, "y": 0, "width": 10, "height": 10},
+                                                },
+                                            }
+                                        ]
+                                    }
+                                }
+                            ]
+                        }
+                    }
+                ]
+            },
+        },
+        headers=headers,
+        auth=test_api_auth,
+    )
+    assert result.status_code == 201
+    ingested = indexables()
+    ocr = {url: i for url, i in ingested.items() if i[2] == "ocr-sync"}
+    assert ocr
+    # Unchanged
+    ingest([("Author", "Alpha"), ("Publisher", "Reimer")])
+    assert indexables() == ingested
+    # A value inserted at the front of the authors replaces the authors, but nothing else
+    ingest([("Author", "Beta"), ("Author", "Alpha"), ("Publisher", "Reimer")])
+    reingested = indexables()
+    assert sorted(i[1] for i in reingested.values() if i[0] == "author") == ["Alpha", "Beta"]
+    assert not {url for url, i in ingested.items() if i[0] == "author"} & reingested.keys()
+    assert {url: i for url, i in ingested.items() if i[0] != "author"}.items() <= reingested.items()
+    # A removed subtype is deleted
+    ingest([("Author", "Beta"), ("Author", "Alpha")])
+    removed = indexables()
+    assert "publisher" not in {i[0] for i in removed.values()}
+    assert {url: i for url, i in reingested.items() if i[0] != "publisher"} == removed
+    assert ocr.items() <= removed.items()
+
+
+def test_cursor_pagination(http_service):
+    """
+    Page through searches with cursors, ordered by id, rank, a metadata value (which most
+    resources don't have, so sort on the default) and a date, and check they return the same
+    results, in the same order, as a single page, and that an invalid cursor is a 404.
+
+    :return: requests response
+    """
+    headers = {"Content-Type": "application/json", "Accept": "application/json"}
+    queries = [
+        {"contexts": ["urn:muya:site:1"]},
+        {"fulltext": "Leipzig"},
+        {"contexts": ["urn:muya:site:1"], "ordering": {"type": "metadata", "subtype": "yasna identifier"}},
+        {
+            "contexts": ["urn:muya:site:1"],
+            "ordering": {
+                "type": "descriptive",
+                "subtype": "navDate",
+                "value_for_sort": "indexable_date_range_start",
+                "direction": "descending",
+            },
+        },
+    ]
+    for query in queries:
+        result = requests.post(url=http_service + "/api/search/search?page_size=500", json=query, headers=headers)
+        expected = [r["resource_id"] for r in result.json()["results"]]
+        assert len(expected) > 7
+        paged, cursor = [], ""
+        while cursor is not None:
+            result = requests.post(
+                url=http_service + "/api/search/search",
+                params={"cursor": cursor, "page_size": 7},
+                json=query,
+                headers=headers,
+            )
+            assert result.status_code == requests.codes.ok
+            pagination = result.json()["pagination"]
+            assert "totalResults" not in pagination
+            paged += [r["resource_id"] for r in result.json()["results"]]
+            cursor = pagination["nextCursor"]
+        assert paged == expected, query
+    result = requests.post(
+        url=http_service + "/api/search/search?cursor=invalid", json=queries[0], headers=headers
+    )
+    assert result.status_code == 404
+
+
+def test_pagination_count_modes(http_service):
+    """
+    Check the counts, and the flags for counts that aren't exact, for each count mode.
+
+    :return: requests response
+    """
+    headers = {"Content-Type": "application/json", "Accept": "application/json"}
+    query = {"contexts": ["urn:muya:site:1"]}
+
+    def pagination(**params):
+        result = requests.post(
+            url=http_service + "/api/search/search", params=params, json=query, headers=headers
+        )
+        assert result.status_code == requests.codes.ok
+        return result.json()["pagination"]
+
+    exact = pagination()["totalResults"]
+    assert "totalResultsEstimated" not in pagination()
+    estimated = pagination(count="estimate")
+    assert estimated["totalResultsEstimated"] is True
+    assert isinstance(estimated["totalResults"], int)
+    assert pagination(count="capped")["totalResults"] == exact
+    assert pagination(count="capped")["totalResultsCapped"] is False
+    assert pagination(count="none")["totalResults"] == exact
+    assert "totalResults" not in pagination(cursor="", count="none")
+    assert pagination(cursor="", count="exact")["totalResults"] == exact
+
+
+def test_sort_key_ordering(http_service):
+    """
+    Order by a metadata field (from the precomputed sort keys) in each direction, with the type
+    and subtype in any case, and check the results are ordered by its values.
+
+    :return: requests response
+    """
+    headers = {"Content-Type": "application/json", "Accept": "application/json"}
+    results = {}
+    for subtype, direction in (
+        ("date of publication", "ascending"),
+        ("Date of Publication", "ascending"),
+        ("date of publication", "descending"),
+    ):
+        result = requests.post(
+            url=http_service + "/api/search/search?page_size=500",
+            json={
+                "contexts": ["urn:muya:site:1"],
+                "ordering": {"type": "Metadata", "subtype": subtype, "direction": direction},
+            },
+            headers=headers,
+        )
+        assert result.status_code == requests.codes.ok
+        results[(subtype, direction)] = [(r["resource_id"], r["sortk"]) for r in result.json()["results"]]
+    ascending = [sortk for _, sortk in results[("date of publication", "ascending")]]
+    descending = [sortk for _, sortk in results[("date of publication", "descending")]]
+    assert len(set(ascending)) > 1
+    assert ascending == sorted(ascending)
+    assert descending == sorted(ascending, reverse=True)
+    assert results[("Date of Publication", "ascending")] == results[("date of publication", "ascending")]
+
+
+def test_ingest_bulk_contexts(http_service, test_api_auth):
+    """
+    Ingest two manifests in many new contexts (some repeated, and some shared between them),
+    which are resolved in bulk, and check that each context is created once, and that the
+    manifests are in all of their contexts.
+
+    :return: requests response
+    """
+    headers = {"Content-Type": "application/json", "Accept": "application/json"}
+    prefix = "urn:muya:collection:contexts-"
+    manifest_contexts = {
+        "urn:muya:manifest:contexts-1": [f"{prefix}{i}" for i in range(20)],
+        "urn:muya:manifest:contexts-2": [f"{prefix}{i}" for i in range(10, 30)],
+    }
+
+    def contexts():
+        result = requests.get(
+            url=http_service + "/api/search/contexts", params={"page_size": 1000}, headers=headers
+        )
+        assert result.status_code == requests.codes.ok
+        return {c["id"]: c["url"] for c in result.json()["results"] if c["id"].startswith(prefix)}
+
+    for identifier, context_ids in manifest_contexts.items():
+        collections = [{"id": context_id, "type": "Collection"} for context_id in context_ids]
+        result = requests.post(
+            url=http_service + "/api/search/iiif",
+            json={
+                "contexts": [{"id": "urn:muya:site:1", "type": "Site"}] + collections + collections[:5],
+                "resource": {
+                    "@context": "http://iiif.io/api/presentation/3/context.json",
+                    "id": f"https://example.org/iiif/{identifier}/manifest",
+                    "type": "Manifest",
+                    "label": {"en": ["Contexts test"]},
+                    "items": [],
+                },
+                "id": identifier,
+            },
+            headers=headers,
+            auth=test_api_auth,
+        )
+        assert result.status_code == requests.codes.created
+        result = requests.get(url=http_service + f"/api/search/iiif/{identifier}", headers=headers)
+        assert result.status_code == requests.codes.ok
+        assert {"urn:muya:site:1", *context_ids} <= {c["id"] for c in result.json()["contexts"]}
+    created = contexts()
+    assert sorted(created) == sorted(f"{prefix}{i}" for i in range(30))
+    assert len(set(created.values())) == 30
+
+
+def test_ingest_clashing_context_slugs(http_service, test_api_auth):
+    """
+    Ingest a manifest in two new contexts whose ids have the same slug, and then another in a
+    third, and check that each context is given its own slug, and can be retrieved by it.
+
+    :return: requests response
+    """
+    headers = {"Content-Type": "application/json", "Accept": "application/json"}
+    context_ids = {
+        "urn:muya:manifest:slugs-1": ["urn:muya:collection:slug test", "urn:muya:collection:slug-test"],
+        "urn:muya:manifest:slugs-2": ["urn:muya:collection:Slug Test"],
+    }
+    for identifier, contexts in context_ids.items():
+        result = requests.post(
+            url=http_service + "/api/search/iiif",
+            json={
+                "contexts": [{"id": "urn:muya:site:1", "type": "Site"}]
+                + [{"id": context, "type": "Collection"} for context in contexts],
+                "resource": {
+                    "@context": "http://iiif.io/api/presentation/3/context.json",
+                    "id": f"https://example.org/iiif/{identifier}/manifest",
+                    "type": "Manifest",
+                    "label": {"en": ["Slugs test"]},
+                    "items": [],
+                },
+                "id": identifier,
+            },
+            headers=headers,
+            auth=test_api_auth,
+        )
+        assert result.status_code == requests.codes.created
+    slug = "urnmuyacollectionslug-test"
+    found = {}
+    for suffix in ("", "-2", "-3"):
+        result = requests.get(url=http_service + f"/api/search/contexts/{slug}{suffix}", headers=headers)
+        assert result.status_code == requests.codes.ok
+        found[result.json()["id"]] = result.json()["slug"]
+    assert set(found) == {context for contexts in context_ids.values() for context in contexts}
+    assert found["urn:muya:collection:Slug Test"] == f"{slug}-3"
+
+
+def test_bulk_ndjson_ingest_unchanged(http_service, test_api_auth):
+    """
+    Bulk ingest the same record twice with skip_unchanged, and then changed, and check that the
+    second ingest is reported as unchanged.
+
+    :return: requests response
+    """
+
+    def bulk_ingest(label):
+        line = {
+            "contexts": [{"id": "urn:muya:site:1", "type": "Site"}],
+            "resource": {
+                "@context": "http://iiif.io/api/presentation/3/context.json",
+                "id": "https://example.org/iiif/bulk-unchanged/manifest",
+                "type": "Manifest",
+                "label": {"en": [label]},
+                "items": [],
+            },
+            "id": "urn:muya:manifest:bulk-unchanged",
+            "skip_unchanged": True,
+        }
+        result = requests.post(
+            url=http_service + "/api/search/iiif/bulk",
+            data=json.dumps(line).encode("utf-8"),
+            headers={"Content-Type": "application/x-ndjson"},
+            auth=test_api_auth,
+        )
+        assert result.status_code == requests.codes.ok
+        return json.loads(result.text.splitlines()[0])["status"]
+
+    assert [bulk_ingest(label) for label in ("Unchanged", "Unchanged", "Changed")] == [
+        "created",
+        "unchanged",
+        "updated",
+    ]
@@ -0,0 +1,31 @@
+from search_service.search.search_cache import LRUSearchCacheBackend, madoc_id_sites
+
+
+def test__madoc_id_sites():
+    """
+    Should return the sites whose searches (filtered by madoc_id prefix) can include the resource
+    :return:
+    """
+    assert madoc_id_sites("urn:madoc:site:12|urn:madoc:manifest:1") == [
+        "",
+        "urn:madoc:site:12",
+        "urn:madoc:site:1",
+    ]
+    assert madoc_id_sites("urn:muya:manifest:1") == [""]
+
+
+def test__lru_search_cache_generations():
+    """
+    Should evict the least recently used response, and bump generations per scope
+    :return:
+    """
+    cache = LRUSearchCacheBackend(maxsize=2, ttl=60)
+    cache.set("a", {"results": []})
+    cache.set("b", {"results": []})
+    assert cache.get("a") == {"results": []}
+    cache.set("c", {"results": []})
+    assert cache.get("b") is None
+    assert cache.get_generation("urn:madoc:site:1") == 0
+    cache.bump_generation("urn:madoc:site:1")
+    assert cache.get_generation("urn:madoc:site:1") == 1
+    assert cache.get_generation("") == 0
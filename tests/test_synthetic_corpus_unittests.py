@@ -0,0 +1,21 @@
+from search_service.search.synthetic_corpus import generate_corpus
+
+
+def test__generate_corpus():
+    """
+    Should generate the same payloads for the same seed, with an OCR document and the capture
+    models for each manifest, and a mix of IIIF Presentation 2 and 3 manifests
+    :return:
+    """
+    corpus = generate_corpus(manifests=20, collections=2, canvases=2, capture_models=2, seed=3)
+    assert corpus == generate_corpus(manifests=20, collections=2, canvases=2, capture_models=2, seed=3)
+    assert len(corpus["manifests"]) == 20
+    assert len(corpus["collections"]) == 2
+    assert len(corpus["ocr"]) == 20
+    assert len(corpus["capture_models"]) == 40
+    contexts = {manifest["resource"].get("@context") for manifest in corpus["manifests"]}
+    assert contexts == {
+        "http://iiif.io/api/presentation/2/context.json",
+        "http://iiif.io/api/presentation/3/context.json",
+    }
+    assert sum(len(c["resource"]["items"]) for c in corpus["collections"]) == 20
@@ -1,4 +1,10 @@
-from search_service.search.iiif_utils import get_iiif_resource_thumbnail_json
+import requests
+
+from search_service.search.iiif_utils import (
+    get_iiif_resource_thumbnail_json,
+    InfoJSONCache,
+    InfoJSONResolver,
+)
 from search_service.search.prezi_upgrader import Upgrader
 
 upgrader = Upgrader(flags={"default_lang": "en"})
@@ -207,3 +213,59 @@ def test__manifest_no_thumbnail_dereference_canvas(iiif2_manifest):
             "width": 3840,
         }
     ]
+
+
+def test__info_json_cache_lru_and_ttl():
+    """
+    Should evict the least recently used info.json, and expire entries after their TTL
+    :return:
+    """
+    cache = InfoJSONCache(maxsize=2, ttl=60)
+    cache.set("https://example.org/iiif/a", {"id": "a"})
+    cache.set("https://example.org/iiif/b", {"id": "b"})
+    assert cache.get("https://example.org/iiif/a") == (True, {"id": "a"})
+    cache.set("https://example.org/iiif/c", {"id": "c"})
+    assert cache.get("https://example.org/iiif/b") == (False, None)
+    assert cache.get("https://example.org/iiif/a") == (True, {"id": "a"})
+    cache.set("https://example.org/iiif/d", {}, ttl=-1)
+    assert cache.get("https://example.org/iiif/d") == (False, None)
+
+
+def test__info_json_resolver_failures():
+    """
+    Should return an empty info.json for error responses and invalid URLs, without caching them
+    for longer than the failure TTL or storing them, and store the info.json that was fetched
+    :return:
+    """
+
+    class Session:
+        def get(self, url, timeout=None):
+            if not url.startswith("https://"):
+                raise requests.exceptions.MissingSchema(url)
+            response = requests.Response()
+            response.status_code = 404 if "missing" in url else 200
+            response._content = b'{"id": "%s"}' % url.encode("utf-8")
+            return response
+
+    class Store:
+        stored = {}
+
+        def get_many(self, image_service_ids, max_age):
+            return {}
+
+        def set_many(self, infos):
+            self.stored.update(infos)
+
+    resolver = InfoJSONResolver(store=Store(), failure_ttl=-1)
+    resolver.session = Session()
+    assert resolver.get_many(
+        ["https://example.org/iiif/a", "https://example.org/iiif/missing", "example.org/iiif/b"]
+    ) == {
+        "https://example.org/iiif/a": {"id": "https://example.org/iiif/a/info.json"},
+        "https://example.org/iiif/missing": {},
+        "example.org/iiif/b": {},
+    }
+    assert resolver.cache.get("https://example.org/iiif/missing") == (False, None)
+    assert resolver.store.stored == {
+        "https://example.org/iiif/a": {"id": "https://example.org/iiif/a/info.json"}
+    }